@@ -7,29 +7,89 @@ class Settings(BaseSettings):
 
     # App
     environment: str = Field(default="dev")
+    # Dependencies are warmed in the background after startup; /health/ready is 503 until done
+    warmup_retry_seconds: float = Field(default=5.0)  # delay before retrying a failed warmup step
 
     # Database
     database_url: str = Field(default="sqlite+aiosqlite:///./app.db")
 
     # Vector store
-    vector_provider: str = Field(default="qdrant")  # qdrant|pinecone|weaviate|milvus
+    vector_provider: str = Field(default="qdrant")  # qdrant|mmap (pinecone|weaviate|milvus via VectorStore adapters)
     qdrant_url: str = Field(default=":memory:")
     qdrant_api_key: str | None = Field(default=None)
     qdrant_collection: str = Field(default="documents")
+    qdrant_prefer_grpc: bool = Field(default=True)  # server URLs only
+    qdrant_grpc_port: int = Field(default=6334)
+    # Collection tuning, applied when the collection is created
+    qdrant_hnsw_m: int = Field(default=16)
+    qdrant_hnsw_ef_construct: int = Field(default=100)
+    qdrant_search_ef: int = Field(default=0)  # hnsw_ef per query, 0 = server default
+    qdrant_vectors_on_disk: bool = Field(default=False)  # always on disk when quantized
+    qdrant_payload_on_disk: bool = Field(default=False)
+    # Upserts are split into batches sent with bounded parallelism
+    vector_upsert_batch_size: int = Field(default=256)
+    vector_upsert_parallelism: int = Field(default=4)
+    vector_payload_mode: str = Field(default="full")  # full|ids (text served from chunk_text_cache)
+    chunk_text_cache_bytes: int = Field(default=64 * 1024 * 1024)
+    # Local memory-mapped exact index (vector_provider=mmap)
+    mmap_index_dir: str = Field(default="./data/vector_index")
+    mmap_search_block_rows: int = Field(default=65536)
+    # Snapshots of the in-memory Qdrant collection, restored at startup
+    vector_snapshot_enabled: bool = Field(default=True)
+    vector_snapshot_path: str = Field(default="./data/vectors.snap")
+    vector_snapshot_interval_seconds: float = Field(default=300.0)  # 0 = only on shutdown
 
     # Embeddings
     embedding_model_name: str = Field(default="sentence-transformers/all-MiniLM-L6-v2")
     embedding_dim: int = Field(default=384)
+    # Compressed index: none|int8 (4x smaller)|binary (32x); candidates are rescored at full precision
+    vector_quantization: str = Field(default="none")
+    vector_rescore_oversampling: float = Field(default=4.0)
+    embedding_cache_enabled: bool = Field(default=True)  # reuse vectors of identical chunks at ingest
+    embedding_preload: bool = Field(default=True)  # load and warm the model at startup instead of on first use
+    # Query-time micro-batching across concurrent requests
+    embedding_batch_max_size: int = Field(default=32)
+    embedding_batch_max_wait_ms: float = Field(default=5.0)
+
+    # Ingestion
+    chunk_size_unit: str = Field(default="chars")  # chars|tokens (embedding model tokenizer)
+    ingest_batch_size: int = Field(default=64)  # chunks embedded and written per batch
+    ingest_job_concurrency: int = Field(default=2)  # background ingestion workers
+    ingest_job_heartbeat_seconds: float = Field(default=15.0)  # running files silent for 4x this are taken over
+    ingest_spool_dir: str = Field(default="./data/ingest_spool")
+    pdf_extract_workers: int = Field(default=0)  # process pool size, 0 = one per CPU
+    pdf_pages_per_task: int = Field(default=8)
+    pdf_extract_timeout_seconds: float = Field(default=120.0)  # per document
+
+    # Prometheus metrics at /metrics (per process; scrape each worker separately)
+    metrics_enabled: bool = Field(default=True)
+    # Opt-in request profiling; nothing is installed unless enabled
+    profiling_enabled: bool = Field(default=False)
+    profiling_token: str | None = Field(default=None)  # X-Profile header / ?profile= value; required for profiling
+    profiling_sample_rate: float = Field(default=0.0)  # share of requests profiled at random
+    profiling_interval_ms: float = Field(default=5.0)  # sampling interval
+    profiling_max_concurrent: int = Field(default=2)
+    profiling_dir: str = Field(default="./data/profiles")
+    profiling_keep: int = Field(default=100)  # newest profiles kept on disk
 
     # Redis
     redis_url: str = Field(default="redis://localhost:6379/0")
     chat_history_ttl_seconds: int = Field(default=60 * 60 * 24)
     chat_history_max_turns: int = Field(default=15)
+    chat_history_prompt_turns: int = Field(default=5)  # most recent turns sent to the LLM
+    chat_summary_enabled: bool = Field(default=False)  # fold older turns into a rolling summary
+    chat_summary_batch_turns: int = Field(default=4)  # turns folded per summarization call
+    # Semantic answer cache: reuse an answer for a similar question over the same retrieved chunks
+    answer_cache_enabled: bool = Field(default=True)
+    answer_cache_similarity: float = Field(default=0.95)  # minimum cosine similarity of the questions
+    answer_cache_ttl_seconds: int = Field(default=60 * 60 * 24)
+    answer_cache_max_entries: int = Field(default=10_000)
 
     # LLM
     llm_provider: str = Field(default="gemini")  # gemini|openai|openrouter|local
     gemini_api_key: str | None = Field(default=None)
     openai_api_key: str | None = Field(default=None)
+    gemini_model: str = Field(default="gemini-2.5-flash")
     openai_model: str = Field(default="gpt-4o-mini")
     # OpenRouter via OpenAI SDK
     openrouter_key: str | None = Field(default=None)
@@ -37,6 +97,18 @@ class Settings(BaseSettings):
     openrouter_model: str = Field(default="openrouter/auto")
     app_public_url: str | None = Field(default=None)  # for OpenRouter Referer header
     app_title: str = Field(default="PalmMind Backend")  # for OpenRouter X-Title header
+    rag_batch_llm_concurrency: int = Field(default=4)  # LLM calls in flight per /rag/query/batch request
+    # Prompt assembly: neighbouring chunks are merged, overlaps and near-duplicates removed
+    rag_context_token_budget: int = Field(default=3000)  # system prompt + context + history + question
+    rag_history_token_share: float = Field(default=0.25)  # at most this share of the budget goes to history
+    rag_context_dedup_similarity: float = Field(default=0.9)  # shingle containment that counts as duplicate
+    llm_temperature: float = Field(default=0.2)
+    llm_concurrency: int = Field(default=8)  # LLM calls in flight across the whole process
+    llm_queue_timeout_seconds: float = Field(default=10.0)  # max wait for a free slot before 503
+    llm_request_timeout_seconds: float = Field(default=60.0)  # per attempt
+    llm_max_retries: int = Field(default=3)  # on rate limits and transient errors
+    llm_retry_base_delay_seconds: float = Field(default=0.5)  # doubled on each retry, with jitter
+    llm_local_latency_ms: float = Field(default=0.0)  # simulated model latency of the local provider
 
 
 settings = Settings()
@@ -1,10 +1,15 @@
 from typing import AsyncGenerator
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 from .config import settings
+from .services.metrics import instrument_engine
 
 
 engine = create_async_engine(settings.database_url, echo=False, future=True)
+instrument_engine(engine)
 SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 
 
@@ -16,3 +21,31 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
     async with SessionLocal() as session:
         yield session
 
+
+
+def _add_missing_columns(conn: Connection) -> None:
+    # create_all only creates missing tables; add nullable columns introduced since an
+    # existing database was created so older app.db files keep working.
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        added = set()
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            ddl = CreateColumn(column).compile(dialect=conn.dialect)
+            conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+            added.add(column.name)
+        for index in table.indexes:
+            if added & {c.name for c in index.columns}:
+                index.create(conn, checkfirst=True)
+
+
+async def init_models() -> None:
+    from . import models  # noqa: F401  (register tables on Base.metadata)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
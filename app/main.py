@@ -1,8 +1,41 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from .routers import ingestion, rag, booking, health
-from .db import engine, Base
+from .routers import ingestion, rag, booking, health, metrics, profiles
+from .db import engine, Base, init_models
+from .config import settings
+from .services.snapshot import SnapshotManager, snapshot_manager
+from .services.llm import close_llm_provider
+from .services.jobs import job_queue
+from .services.metrics import MetricsMiddleware
+from .services.pdf_extraction import pdf_extractor
+from .services.profiler import ProfilingMiddleware, profiling_available
+from .services.readiness import readiness
+from .services.retrieval import close_rag_service
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Everything slow (model, vector index, clients) is warmed in the background; the
+    # job queue is started there too, once the vector index has been restored
+    await init_models()
+    readiness.start()
+    try:
+        yield
+    finally:
+        await readiness.stop()
+        # Returns once interrupted files have removed their partial documents, so
+        # neither their vectors nor later upserts are missing from the final snapshot
+        await job_queue.stop()
+        # An index whose restore never finished must not overwrite the snapshot
+        if SnapshotManager.applies() and readiness.is_ready("vector_store"):
+            await snapshot_manager.stop()
+        # Let background memory/answer-cache writes land before the clients go away
+        await close_rag_service()
+        await close_llm_provider()
+        pdf_extractor.shutdown()
 
 
 def create_app() -> FastAPI:
@@ -27,8 +60,14 @@ def create_app() -> FastAPI:
         version="1.0.0",
         docs_url="/docs",
         redoc_url="/redoc",
+        lifespan=lifespan,
     )
 
+    profiling = profiling_available()
+    if profiling:
+        app.add_middleware(ProfilingMiddleware)
+    if settings.metrics_enabled:
+        app.add_middleware(MetricsMiddleware)
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
@@ -38,9 +77,14 @@ def create_app() -> FastAPI:
     )
 
     app.include_router(health.router, prefix="/health", tags=["health"]) 
+    if settings.metrics_enabled:
+        app.include_router(metrics.router, tags=["health"])
+    if profiling:
+        app.include_router(profiles.router, prefix="/debug/profiles", tags=["debug"])
     app.include_router(ingestion.router, prefix="/ingest", tags=["ingestion"]) 
     app.include_router(rag.router, prefix="/rag", tags=["rag"]) 
     app.include_router(booking.router, prefix="/booking", tags=["booking"]) 
+
     return app
 
 
@@ -1,7 +1,7 @@
 from __future__ import annotations
 from datetime import datetime
 from typing import Optional
-from sqlalchemy import String, Integer, DateTime, ForeignKey, Text
+from sqlalchemy import String, Integer, DateTime, ForeignKey, Text, LargeBinary
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .db import Base
@@ -13,6 +13,7 @@ class Document(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     filename: Mapped[str] = mapped_column(String(255), nullable=False)
     content_type: Mapped[str] = mapped_column(String(50), nullable=False)
+    tenant_id: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, index=True)
     uploaded_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
     chunks: Mapped[list[Chunk]] = relationship("Chunk", back_populates="document", cascade="all, delete-orphan")
@@ -24,6 +25,9 @@ class Chunk(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     document_id: Mapped[int] = mapped_column(ForeignKey("documents.id"), nullable=False, index=True)
     index_in_document: Mapped[int] = mapped_column(Integer, nullable=False)
+    page_number: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # 1-based, PDFs only
+    start_char: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # offsets in the extracted text
+    end_char: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     text: Mapped[str] = mapped_column(Text, nullable=False)
     embedding_id: Mapped[Optional[str]] = mapped_column(String(128), nullable=True, index=True)
 
@@ -40,3 +44,53 @@ class Booking(Base):
     time: Mapped[str] = mapped_column(String(20), nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
+
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    strategy: Mapped[str] = mapped_column(String(20), nullable=False)
+    fixed_size: Mapped[int] = mapped_column(Integer, nullable=False)
+    fixed_overlap: Mapped[int] = mapped_column(Integer, nullable=False)
+    size_unit: Mapped[Optional[str]] = mapped_column(String(10), nullable=True)
+    tenant_id: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    files: Mapped[list[IngestionJobFile]] = relationship(
+        "IngestionJobFile", back_populates="job", cascade="all, delete-orphan", order_by="IngestionJobFile.id"
+    )
+
+
+class IngestionJobFile(Base):
+    __tablename__ = "ingestion_job_files"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    job_id: Mapped[str] = mapped_column(ForeignKey("ingestion_jobs.id"), nullable=False, index=True)
+    filename: Mapped[str] = mapped_column(String(255), nullable=False)
+    content_type: Mapped[str] = mapped_column(String(50), nullable=False)
+    spool_path: Mapped[str] = mapped_column(String(512), nullable=False)
+    state: Mapped[str] = mapped_column(String(20), nullable=False, default="pending", index=True)  # pending|running|done|failed
+    document_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    num_chunks: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    pages: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    stage_seconds: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # JSON object
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    cache_hits: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    cache_misses: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    worker_id: Mapped[Optional[str]] = mapped_column(String(80), nullable=True)  # queue that claimed it
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)  # refreshed while running
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    job: Mapped[IngestionJob] = relationship("IngestionJob", back_populates="files")
+
+
+class EmbeddingCacheEntry(Base):
+    __tablename__ = "embedding_cache"
+
+    model_name: Mapped[str] = mapped_column(String(255), primary_key=True)
+    content_hash: Mapped[str] = mapped_column(String(64), primary_key=True)  # of the normalized chunk text
+    vector: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)  # float32, little-endian
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -1,10 +1,63 @@
-from fastapi import APIRouter
+from typing import Callable
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
+
+from ..config import settings
+from ..services.model_registry import model_registry
+from ..services.embedding_batcher import existing_embedding_batcher
+from ..services.snapshot import snapshot_manager
+from ..services.chunk_cache import chunk_text_cache
+from ..services.answer_cache import answer_cache
+from ..services.retrieval import stage_stats, stream_stats
+from ..services.llm import existing_llm_provider
+from ..services.context import context_packer
+from ..services.readiness import readiness
 
 
 router = APIRouter()
 
 
+def require_ready(*names: str) -> Callable[[], None]:
+    """Dependency answering 503 while any of the named warmup steps is not ready yet."""
+
+    async def dependency() -> None:
+        waiting = [name for name in names if not readiness.is_ready(name)]
+        if waiting:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Warming up: waiting for {', '.join(waiting)}",
+                headers={"Retry-After": str(max(1, round(settings.warmup_retry_seconds)))},
+            )
+
+    return dependency
+
+
 @router.get("/")
 async def healthcheck() -> dict:
     return {"status": "ok"}
 
+
+@router.get("/stats")
+async def service_stats() -> dict:
+    # Only services that exist already: building one here would load the model on the loop
+    batcher = existing_embedding_batcher()
+    llm = existing_llm_provider()
+    return {
+        "models": model_registry.stats(),
+        "embedding_batcher": batcher.stats() if batcher is not None else None,
+        "vector_snapshot": snapshot_manager.last_stats,
+        "chunk_text_cache": chunk_text_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "rag_stream": stream_stats(),
+        "rag_stages": stage_stats(),
+        "llm": llm.stats() if llm is not None else None,
+        "context_packing": context_packer.stats(),
+    }
+
+
+@router.get("/ready")
+async def readiness_probe() -> JSONResponse:
+    """200 once every required dependency is warm, 503 (with per-dependency state) until then."""
+    report = readiness.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
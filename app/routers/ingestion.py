@@ -1,21 +1,24 @@
+import json
+from typing import Optional
+
 from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from fastapi.responses import JSONResponse
 
-from ..db import get_db, engine, Base
-from ..schemas import IngestionResponse
-from ..services.ingestion import ingest_document
+from ..config import settings
+from ..db import get_db
+from ..models import IngestionJob
+from ..schemas import IngestionResponse, IngestionJobStatus, IngestionJobFileStatus
+from ..services.ingestion import ingest_stream
+from ..services.jobs import job_queue
+from .health import require_ready
 
 
 router = APIRouter()
 
 
-@router.on_event("startup")
-async def on_startup() -> None:
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-
-
 @router.get("/")
 async def ingestion_root():
     """
@@ -25,6 +28,8 @@ async def ingestion_root():
         "message": "Document Ingestion API",
         "endpoints": {
             "/upload": "Upload PDF or TXT documents",
+            "/jobs": "Queue many documents for background ingestion",
+            "/jobs/{job_id}": "Get per-file status of an ingestion job",
         }
     })
 
@@ -38,7 +43,9 @@ async def upload_info():
             "file": "(file): The document to upload",
             "strategy": "(str, optional): 'recursive' or 'fixed', default='recursive'",
             "fixed_size": "(int, optional): chunk size, default=500",
-            "fixed_overlap": "(int, optional): overlap size, default=50"
+            "fixed_overlap": "(int, optional): overlap size, default=50",
+            "size_unit": "(str, optional): 'chars' or 'tokens' of the embedding model, default='chars'",
+            "tenant_id": "(str, optional): tenant the document belongs to, for scoped queries"
         },
         "example_curl": """
         curl -X POST "http://localhost:8080/ingest/upload" \\
@@ -53,47 +60,145 @@ async def upload_info():
 
 from ..schemas import ChunkingStrategyRequest
 
-@router.post("/upload", response_model=IngestionResponse)
-async def upload_document(
-    file: UploadFile = File(...),
-    strategy: str = Form(default="recursive", description="Chunking strategy: 'recursive' or 'fixed'"),
-    fixed_size: int = Form(default=500, ge=50, le=2000, description="Chunk size (50-2000)"),
-    fixed_overlap: int = Form(default=50, ge=0, description="Overlap size (must be less than chunk size)"),
-    db: AsyncSession = Depends(get_db),
-):
+
+def _validate_upload(file: UploadFile, strategy: str, fixed_size: int, fixed_overlap: int, size_unit: str) -> None:
     # Validate file type
     if file.content_type not in {"application/pdf", "text/plain"} and not (
         file.filename.lower().endswith(".pdf") or file.filename.lower().endswith(".txt")
     ):
         raise HTTPException(status_code=400, detail="Only .pdf or .txt files are supported")
-    
+
     # Validate strategy
     if strategy not in ["recursive", "fixed"]:
         raise HTTPException(status_code=400, detail="Strategy must be either 'recursive' or 'fixed'")
-    
+    if size_unit not in ["chars", "tokens"]:
+        raise HTTPException(status_code=400, detail="size_unit must be either 'chars' or 'tokens'")
+
     # Validate chunking parameters
     if fixed_size < 50 or fixed_size > 2000:
         raise HTTPException(status_code=400, detail="fixed_size must be between 50 and 2000")
     if fixed_overlap < 0 or fixed_overlap >= fixed_size:
         raise HTTPException(status_code=400, detail="fixed_overlap must be between 0 and fixed_size")
-    
+
+
+# Until the vector index is restored, writes to it would make the restore skip the snapshot
+@router.post("/upload", response_model=IngestionResponse, dependencies=[Depends(require_ready("vector_store"))])
+async def upload_document(
+    file: UploadFile = File(...),
+    strategy: str = Form(default="recursive", description="Chunking strategy: 'recursive' or 'fixed'"),
+    fixed_size: int = Form(default=500, ge=50, le=2000, description="Chunk size (50-2000)"),
+    fixed_overlap: int = Form(default=50, ge=0, description="Overlap size (must be less than chunk size)"),
+    size_unit: str = Form(default=settings.chunk_size_unit, description="Measure sizes in 'chars' or model 'tokens'"),
+    tenant_id: Optional[str] = Form(default=None, max_length=64, description="Tenant the document belongs to"),
+    db: AsyncSession = Depends(get_db),
+):
+    _validate_upload(file, strategy, fixed_size, fixed_overlap, size_unit)
+
     try:
-        content = await file.read()
-        if not content:
-            raise HTTPException(status_code=400, detail="Empty file content")
-            
-        doc_id, num = await ingest_document(
+        # Stream from the spooled upload instead of reading it into memory
+        progress = await ingest_stream(
             db,
             filename=file.filename,
             content_type=file.content_type or "",
-            raw_bytes=content,
+            fileobj=file.file,
             strategy=strategy,
             fixed_size=fixed_size,
             fixed_overlap=fixed_overlap,
+            size_unit=size_unit,
+            tenant_id=tenant_id,
         )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process document: {str(e)}")
-    return IngestionResponse(document_id=doc_id, num_chunks=num)
+    return IngestionResponse(
+        document_id=progress.document_id,
+        num_chunks=progress.chunks,
+        pages=progress.pages,
+        cache_hits=progress.cache_hits,
+        cache_misses=progress.cache_misses,
+        stage_seconds={k: round(v, 4) for k, v in progress.stage_seconds.items()},
+    )
+
+
+@router.post(
+    "/jobs",
+    response_model=IngestionJobStatus,
+    status_code=202,
+    dependencies=[Depends(require_ready("vector_store", "ingestion"))],
+)
+async def create_ingestion_job(
+    files: list[UploadFile] = File(...),
+    strategy: str = Form(default="recursive", description="Chunking strategy: 'recursive' or 'fixed'"),
+    fixed_size: int = Form(default=500, ge=50, le=2000, description="Chunk size (50-2000)"),
+    fixed_overlap: int = Form(default=50, ge=0, description="Overlap size (must be less than chunk size)"),
+    size_unit: str = Form(default=settings.chunk_size_unit, description="Measure sizes in 'chars' or model 'tokens'"),
+    tenant_id: Optional[str] = Form(default=None, max_length=64, description="Tenant the documents belong to"),
+    db: AsyncSession = Depends(get_db),
+):
+    for file in files:
+        _validate_upload(file, strategy, fixed_size, fixed_overlap, size_unit)
+    job = await job_queue.submit(
+        db,
+        [(f.filename, f.content_type or "", f.file) for f in files],
+        strategy=strategy,
+        fixed_size=fixed_size,
+        fixed_overlap=fixed_overlap,
+        size_unit=size_unit,
+        tenant_id=tenant_id,
+    )
+    return _job_status(job)
+
+
+@router.get("/jobs/{job_id}", response_model=IngestionJobStatus)
+async def get_ingestion_job(job_id: str, db: AsyncSession = Depends(get_db)):
+    job = (
+        await db.execute(select(IngestionJob).where(IngestionJob.id == job_id).options(selectinload(IngestionJob.files)))
+    ).scalar_one_or_none()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_status(job)
+
+
+def _job_status(job: IngestionJob) -> IngestionJobStatus:
+    files: list[IngestionJobFileStatus] = []
+    for f in job.files:
+        status = IngestionJobFileStatus(
+            id=f.id,
+            filename=f.filename,
+            state=f.state,
+            document_id=f.document_id,
+            num_chunks=f.num_chunks,
+            pages=f.pages,
+            cache_hits=f.cache_hits or 0,
+            cache_misses=f.cache_misses or 0,
+            error=f.error,
+            created_at=f.created_at,
+            started_at=f.started_at,
+            finished_at=f.finished_at,
+            stage_seconds=json.loads(f.stage_seconds) if f.stage_seconds else {},
+        )
+        live = job_queue.live_progress(f.id) if f.state == "running" else None
+        if live is not None:
+            status.document_id = live.document_id
+            status.num_chunks = live.chunks
+            status.pages = live.pages
+            status.cache_hits = live.cache_hits
+            status.cache_misses = live.cache_misses
+            status.stage_seconds = {k: round(v, 4) for k, v in live.stage_seconds.items()}
+        if f.started_at and f.finished_at:
+            status.duration_seconds = round((f.finished_at - f.started_at).total_seconds(), 3)
+        files.append(status)
 
+    states = {f.state for f in files}
+    if states <= {"done"}:
+        state = "done"
+    elif states == {"failed"}:
+        state = "failed"
+    elif states <= {"done", "failed"}:
+        state = "partial"
+    elif states == {"pending"}:
+        state = "pending"
+    else:
+        state = "running"
+    return IngestionJobStatus(job_id=job.id, state=state, created_at=job.created_at, files=files)
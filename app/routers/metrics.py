@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from ..services.metrics import registry
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    """Prometheus scrape endpoint (text exposition format)."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,30 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from ..services.profiler import list_profiles, read_collapsed, token_matches
+
+
+router = APIRouter()
+
+
+def require_token(x_profile: str | None = Header(default=None)) -> None:
+    # token_matches is False when no token is configured, so profiles are never public
+    if not token_matches(x_profile):
+        raise HTTPException(status_code=403, detail="X-Profile token required")
+
+
+@router.get("/", dependencies=[Depends(require_token)])
+async def recent_profiles(limit: int = 20) -> list[dict]:
+    """Newest request profiles with their top functions."""
+    return await asyncio.to_thread(list_profiles, limit)
+
+
+@router.get("/{profile_id}", response_class=PlainTextResponse, dependencies=[Depends(require_token)])
+async def collapsed_stacks(profile_id: str) -> PlainTextResponse:
+    """Folded stacks of one profile, ready for flamegraph.pl or speedscope."""
+    text = await asyncio.to_thread(read_collapsed, profile_id)
+    if text is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(text)
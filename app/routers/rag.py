@@ -1,16 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from ..db import get_db
-from ..schemas import RAGQueryRequest, RAGQueryResponse, ChatHistoryResponse
-from ..services.retrieval import RAGService
-from ..services.memory import ChatMemoryManager
+from ..db import SessionLocal, get_db
+from ..schemas import RAGQueryRequest, RAGQueryResponse, RAGBatchQueryRequest, ChatHistoryResponse
+from ..services.retrieval import RAGService, StageTimer, aget_rag_service
+from ..services.llm import LLMUnavailableError
+from ..services.memory import ChatMemoryManager, get_memory_manager
 
 
 router = APIRouter()
-rag_service = RAGService()
-memory_manager = ChatMemoryManager()
+
+
+# Async so FastAPI resolves these on the event loop instead of a threadpool hop per request;
+# the first RAG request during warmup builds the service on a worker thread instead
+async def rag_service_dependency() -> RAGService:
+    return await aget_rag_service()
+
+
+async def memory_dependency() -> ChatMemoryManager:
+    return get_memory_manager()
 
 
 @router.get("/")
@@ -22,6 +33,8 @@ async def rag_root():
         "message": "Conversational RAG API",
         "endpoints": {
             "/query": "Submit a query",
+            "/query/batch": "Submit many queries, answers streamed back as NDJSON",
+            "/query/stream": "Submit a query, answer streamed back as server-sent events",
             "/history/{session_id}": "Get chat history for a session"
         }
     })
@@ -34,30 +47,100 @@ async def rag_query_info():
         "example_payload": {
             "session_id": "unique_session_id",
             "query": "your question here",
-            "top_k": 5
+            "top_k": 5,
+            "document_ids": "(optional) [1, 2]",
+            "tenant_id": "(optional) tenant to search within"
         }
     })
 
 @router.post("/query", response_model=RAGQueryResponse, description="Submit a query to the RAG system")
-async def rag_query(payload: RAGQueryRequest, db: AsyncSession = Depends(get_db)):
+async def rag_query(
+    payload: RAGQueryRequest,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    rag_service: RAGService = Depends(rag_service_dependency),
+):
+    timer = StageTimer()
     try:
-        answer, sources = await rag_service.query(
+        result = await rag_service.query(
             db, 
             session_id=payload.session_id, 
             query=payload.query, 
-            top_k=payload.top_k
-        )
-        # Store the interaction in chat memory
-        await memory_manager.add_interaction(
-            session_id=payload.session_id,
-            user_message=payload.query,
-            assistant_message=answer
+            top_k=payload.top_k,
+            document_ids=payload.document_ids,
+            tenant_id=payload.tenant_id,
+            timer=timer,
         )
-        return RAGQueryResponse(answer=answer, sources=sources)
+        response.headers["Server-Timing"] = timer.server_timing()
+        return result
+    except LLMUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post(
+    "/query/stream",
+    description="Stream the answer as server-sent events: `sources`, then `delta` events with answer text, "
+    "then `done` with timings (or `error`)",
+)
+async def rag_query_stream(payload: RAGQueryRequest, rag_service: RAGService = Depends(rag_service_dependency)):
+    async def events():
+        # The request-scoped session is closed before a streamed body is sent; use our own
+        async with SessionLocal() as db:
+            try:
+                async for event, data in rag_service.query_stream(
+                    db,
+                    session_id=payload.session_id,
+                    query=payload.query,
+                    top_k=payload.top_k,
+                    document_ids=payload.document_ids,
+                    tenant_id=payload.tenant_id,
+                ):
+                    yield _sse(event, data)
+            except Exception as e:
+                # Headers are already sent; report the failure in-band
+                yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post(
+    "/query/batch",
+    description="Answer many questions in one pass; one JSON object per line (NDJSON) as each answer finishes. "
+    "A failure ends the stream with an `{\"error\", \"status\"}` line (503 with `retry_after` seconds when "
+    "the LLM is unavailable)",
+)
+async def rag_query_batch(payload: RAGBatchQueryRequest, rag_service: RAGService = Depends(rag_service_dependency)):
+    async def lines():
+        # The request-scoped session is closed before a streamed body is sent; use our own
+        async with SessionLocal() as db:
+            try:
+                async for result in rag_service.query_batch(
+                    db,
+                    [(q.session_id, q.query) for q in payload.questions],
+                    top_k=payload.top_k,
+                    document_ids=payload.document_ids,
+                    tenant_id=payload.tenant_id,
+                ):
+                    yield result.model_dump_json() + "\n"
+            # Headers are already sent; report the failure in-band, with the status /query would use
+            except LLMUnavailableError as e:
+                yield json.dumps({"error": str(e), "status": 503, "retry_after": 5}) + "\n"
+            except Exception as e:
+                yield json.dumps({"error": str(e), "status": 500}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @router.get("/history", summary="Get history endpoint information", description="Returns information about how to use the history endpoint")
 async def history_info():
     return JSONResponse({
@@ -66,9 +149,9 @@ async def history_info():
     })
 
 @router.get("/history/{session_id}", response_model=ChatHistoryResponse)
-async def get_chat_history(session_id: str):
+async def get_chat_history(session_id: str, memory: ChatMemoryManager = Depends(memory_dependency)):
     try:
-        history = await memory_manager.get_chat_history(session_id)
+        history = await memory.get_chat_history(session_id)
         return ChatHistoryResponse(
             session_id=session_id,
             messages=history
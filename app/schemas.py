@@ -6,6 +6,34 @@ from pydantic import BaseModel, Field, EmailStr
 class IngestionResponse(BaseModel):
     document_id: int
     num_chunks: int
+    pages: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    stage_seconds: dict[str, float] = Field(default_factory=dict)
+
+
+class IngestionJobFileStatus(BaseModel):
+    id: int
+    filename: str
+    state: Literal["pending", "running", "done", "failed"]
+    document_id: Optional[int] = None
+    num_chunks: int = 0
+    pages: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    duration_seconds: Optional[float] = None
+    stage_seconds: dict[str, float] = Field(default_factory=dict)
+
+
+class IngestionJobStatus(BaseModel):
+    job_id: str
+    state: Literal["pending", "running", "done", "failed", "partial"]
+    created_at: datetime
+    files: List[IngestionJobFileStatus]
 
 
 class ChatMessage(BaseModel):
@@ -43,11 +71,48 @@ class RAGQueryRequest(BaseModel):
     session_id: constr(min_length=1) = Field(..., description="Unique session identifier")
     query: constr(min_length=1, max_length=1000) = Field(..., description="The question to ask")
     top_k: int = Field(default=5, ge=1, le=10, description="Number of relevant chunks to retrieve (1-10)")
+    document_ids: Optional[List[int]] = Field(
+        default=None, min_length=1, max_length=1000, description="Only search these documents"
+    )
+    tenant_id: Optional[constr(min_length=1, max_length=64)] = Field(
+        default=None, description="Only search documents uploaded for this tenant"
+    )
 
 
 class RAGQueryResponse(BaseModel):
     answer: str
     sources: list[int]
+    cached: bool = False  # answer reused from the semantic answer cache, no LLM call
+    prompt_tokens: Optional[int] = None  # of the packed prompt; None when no LLM call was made
+    tokens_saved: Optional[int] = None  # versus sending every retrieved chunk and the last 10 turns unpacked
+
+
+class RAGBatchQuestion(BaseModel):
+    session_id: constr(min_length=1) = Field(..., description="Session the question belongs to")
+    query: constr(min_length=1, max_length=1000) = Field(..., description="The question to ask")
+
+
+class RAGBatchQueryRequest(BaseModel):
+    questions: List[RAGBatchQuestion] = Field(..., min_length=1, max_length=1000)
+    top_k: int = Field(default=5, ge=1, le=10, description="Number of relevant chunks to retrieve (1-10)")
+    document_ids: Optional[List[int]] = Field(
+        default=None, min_length=1, max_length=1000, description="Only search these documents"
+    )
+    tenant_id: Optional[constr(min_length=1, max_length=64)] = Field(
+        default=None, description="Only search documents uploaded for this tenant"
+    )
+
+
+class RAGBatchQueryResult(BaseModel):
+    # One NDJSON line per question, in completion order; ``index`` points back into ``questions``
+    index: int
+    session_id: str
+    answer: Optional[str] = None
+    sources: list[int] = Field(default_factory=list)
+    cached: bool = False
+    prompt_tokens: Optional[int] = None
+    tokens_saved: Optional[int] = None
+    error: Optional[str] = None
 
 
 class BookingCreate(BaseModel):
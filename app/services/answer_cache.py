@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+import uuid
+from typing import Sequence
+
+import numpy as np
+import redis.asyncio as redis
+
+from ..config import settings
+
+
+class SemanticAnswerCache:
+    """Redis cache of LLM answers, matched by query similarity over the same sources.
+
+    Entries are grouped into buckets keyed by the sorted retrieved chunk ids, so only
+    questions answered from exactly the same context are compared. Within a bucket
+    the best cosine match at or above ``threshold`` wins. Entries expire after
+    ``ttl`` seconds; beyond ``max_entries`` the least recently used are evicted.
+    Re-ingesting a document drops every entry that cited it.
+
+    Keys: ``answer:b:<sources hash>`` hash entry id -> float32 query vector,
+    ``answer:e:<entry id>`` JSON answer, ``answer:doc:<document id>`` set of entry refs,
+    ``answer:lru`` sorted set of entry refs by last use.
+    """
+
+    LRU_KEY = "answer:lru"
+
+    def __init__(
+        self,
+        threshold: float | None = None,
+        ttl: int | None = None,
+        max_entries: int | None = None,
+        client: redis.Redis | None = None,
+    ):
+        self.threshold = settings.answer_cache_similarity if threshold is None else threshold
+        self.ttl = ttl or settings.answer_cache_ttl_seconds
+        self.max_entries = max_entries or settings.answer_cache_max_entries
+        self._client = client
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def client(self) -> redis.Redis:
+        if self._client is None:
+            self._client = redis.Redis.from_url(settings.redis_url, socket_timeout=5, retry_on_timeout=True)
+        return self._client
+
+    @staticmethod
+    def _bucket(chunk_ids: Sequence[int]) -> str:
+        # The model name keeps vectors of different dimensions out of one bucket
+        key = settings.embedding_model_name + ":" + ",".join(map(str, sorted(chunk_ids)))
+        digest = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+        return f"answer:b:{digest}"
+
+    @staticmethod
+    def _entry(entry_id: str) -> str:
+        return f"answer:e:{entry_id}"
+
+    async def lookup(self, embedding: np.ndarray, chunk_ids: Sequence[int]) -> str | None:
+        if not chunk_ids:
+            return None
+        bucket = self._bucket(chunk_ids)
+        try:
+            candidates = await self.client.hgetall(bucket)
+            match = self._best_match(embedding, candidates)
+            answer = await self.client.get(self._entry(match)) if match is not None else None
+            if match is not None and answer is None:
+                # Entry expired before its bucket did
+                await self.client.hdel(bucket, match)
+            elif answer is not None:
+                await self.client.zadd(self.LRU_KEY, {f"{bucket}|{match}": time.time()})
+        except redis.RedisError as e:
+            print(f"Redis error in answer cache lookup: {e}")
+            answer = None
+        if answer is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(answer)["answer"]
+
+    def _best_match(self, embedding: np.ndarray, candidates: dict) -> str | None:
+        if not candidates:
+            return None
+        ids = [k.decode() if isinstance(k, bytes) else k for k in candidates]
+        matrix = np.frombuffer(b"".join(candidates.values()), dtype="<f4").reshape(len(ids), -1)
+        q = np.asarray(embedding, dtype=np.float32)
+        scores = matrix @ (q / max(float(np.linalg.norm(q)), 1e-12))
+        best = int(np.argmax(scores))
+        return ids[best] if scores[best] >= self.threshold else None
+
+    async def store(
+        self, embedding: np.ndarray, chunk_ids: Sequence[int], document_ids: Sequence[int], answer: str
+    ) -> None:
+        if not chunk_ids:
+            return
+        bucket = self._bucket(chunk_ids)
+        entry_id = uuid.uuid4().hex
+        ref = f"{bucket}|{entry_id}"
+        q = np.asarray(embedding, dtype=np.float32)
+        vector = (q / max(float(np.linalg.norm(q)), 1e-12)).astype("<f4").tobytes()
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.set(self._entry(entry_id), json.dumps({"answer": answer, "sources": list(chunk_ids)}), ex=self.ttl)
+                pipe.hset(bucket, entry_id, vector)
+                pipe.expire(bucket, self.ttl)
+                for doc in set(document_ids):
+                    pipe.sadd(f"answer:doc:{doc}", ref)
+                    pipe.expire(f"answer:doc:{doc}", self.ttl)
+                pipe.zadd(self.LRU_KEY, {ref: time.time()})
+                pipe.zcard(self.LRU_KEY)
+                size = (await pipe.execute())[-1]
+            if size > self.max_entries:
+                evicted = await self.client.zpopmin(self.LRU_KEY, size - self.max_entries)
+                await self._drop([r for r, _ in evicted])
+        except redis.RedisError as e:
+            print(f"Redis error in answer cache store: {e}")
+
+    async def _drop(self, refs: Sequence[str | bytes]) -> None:
+        if not refs:
+            return
+        async with self.client.pipeline(transaction=False) as pipe:
+            for ref in refs:
+                bucket, entry_id = (ref.decode() if isinstance(ref, bytes) else ref).split("|", 1)
+                pipe.delete(self._entry(entry_id))
+                pipe.hdel(bucket, entry_id)
+                pipe.zrem(self.LRU_KEY, ref)
+            await pipe.execute()
+
+    async def invalidate_documents(self, document_ids: Sequence[int]) -> None:
+        """Drop every cached answer that cited one of ``document_ids``."""
+        try:
+            for doc in set(document_ids):
+                key = f"answer:doc:{doc}"
+                await self._drop(list(await self.client.smembers(key)))
+                await self.client.delete(key)
+        except redis.RedisError as e:
+            print(f"Redis error in answer cache invalidation: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+answer_cache = SemanticAnswerCache()
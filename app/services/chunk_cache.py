@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Iterable, Optional, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..models import Chunk
+
+
+# (index_in_document, start_char, end_char); offsets are None for chunks ingested before they were stored
+ChunkSpan = tuple[int, Optional[int], Optional[int]]
+
+
+class ChunkTextCache:
+    """Size-bounded LRU of chunk id -> text and position in front of the ``chunks`` table.
+
+    Lets the vector store carry ids only; query hits are resolved here, and the
+    misses of one query are fetched with a single ``select``. The position lets
+    context packing stitch neighbouring chunks of a document back together.
+    """
+
+    def __init__(self, max_bytes: int | None = None):
+        self.max_bytes = settings.chunk_text_cache_bytes if max_bytes is None else max_bytes
+        self._entries: OrderedDict[int, tuple[str, int, ChunkSpan]] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _put(self, chunk_id: int, text: str, span: ChunkSpan) -> None:
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(chunk_id, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self._entries[chunk_id] = (text, size, span)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted, _) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+
+    async def get(self, db: AsyncSession, chunk_ids: Sequence[int]) -> dict[int, tuple[str, ChunkSpan]]:
+        found: dict[int, tuple[str, ChunkSpan]] = {}
+        missing: list[int] = []
+        for cid in chunk_ids:
+            entry = self._entries.get(cid)
+            if entry is None:
+                missing.append(cid)
+            else:
+                self._entries.move_to_end(cid)
+                found[cid] = (entry[0], entry[2])
+        self.hits += len(found)
+        self.misses += len(missing)
+        if missing:
+            rows = (
+                await db.execute(
+                    select(Chunk.id, Chunk.text, Chunk.index_in_document, Chunk.start_char, Chunk.end_char).where(
+                        Chunk.id.in_(missing)
+                    )
+                )
+            ).all()
+            for cid, text, index, start, end in rows:
+                found[cid] = (text, (index, start, end))
+                self._put(cid, text, (index, start, end))
+        return found
+
+    def discard(self, chunk_ids: Iterable[int]) -> None:
+        for cid in chunk_ids:
+            entry = self._entries.pop(cid, None)
+            if entry is not None:
+                self.bytes -= entry[1]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+chunk_text_cache = ChunkTextCache()
@@ -1,6 +1,10 @@
 from __future__ import annotations
 
-from typing import Iterable, List
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator, List, Sequence
+
+
+SEPARATORS = ("\n\n", "\n", ". ", " ")
 
 
 def split_recursive(text: str, max_tokens: int = 500, overlap: int = 50) -> List[str]:
@@ -57,3 +61,187 @@ def split_fixed(text: str, size: int = 500, overlap: int = 50) -> List[str]:
         i = end - overlap
     return [c.strip() for c in chunks if c.strip()]
 
+
+@dataclass(frozen=True)
+class TextChunk:
+    text: str
+    start: int  # character offsets into the source text, end exclusive
+    end: int
+
+
+class ChunkingEngine:
+    """Linear-time chunker with ``recursive`` and ``fixed`` modes.
+
+    Sizes are measured in characters or, with ``unit="tokens"``, in tokens of a Hugging
+    Face fast tokenizer (normally the embedding model's). The recursive mode keeps a
+    running length while merging separator-delimited parts instead of re-joining them,
+    and every chunk carries its character offsets.
+    """
+
+    def __init__(
+        self,
+        strategy: str = "recursive",
+        size: int = 500,
+        overlap: int = 50,
+        unit: str = "chars",
+        tokenizer: Any = None,
+    ):
+        if unit == "tokens" and tokenizer is None:
+            raise ValueError("Token-based chunking requires a tokenizer")
+        self.strategy = strategy
+        self.size = max(1, size)
+        self.overlap = min(max(0, overlap), self.size - 1)
+        self.unit = unit
+        self.tokenizer = tokenizer if unit == "tokens" else None
+        self._sep_len = {sep: self._measure([sep])[0] for sep in SEPARATORS}
+
+    # -- measuring -----------------------------------------------------------------
+
+    def _measure(self, texts: Sequence[str]) -> list[int]:
+        if self.tokenizer is None:
+            return [len(t) for t in texts]
+        return [len(ids) for ids in self.tokenizer(list(texts), add_special_tokens=False)["input_ids"]]
+
+    def _fits(self, text: str, start: int, end: int) -> bool:
+        n = end - start
+        if n <= self.size:
+            return True
+        if self.tokenizer is None or n > self.size * 16:
+            # Spans far above the budget are assumed not to fit; splitting them is
+            # harmless because small parts are merged back together.
+            return False
+        return self._measure([text[start:end]])[0] <= self.size
+
+    # -- splitting -----------------------------------------------------------------
+
+    def split(self, text: str) -> list[TextChunk]:
+        return list(self._chunks(text, 0, len(text), 0))
+
+    def _chunks(self, text: str, start: int, end: int, base: int) -> Iterator[TextChunk]:
+        spans = self._fixed(text, start, end) if self.strategy == "fixed" else self._recursive(text, start, end, 0)
+        for s, e in spans:
+            # Trim surrounding whitespace, same as the legacy splitters' strip()
+            raw = text[s:e]
+            chunk = raw.strip()
+            if chunk:
+                s += raw.find(chunk)
+                yield TextChunk(text=chunk, start=base + s, end=base + s + len(chunk))
+
+    def _recursive(self, text: str, start: int, end: int, level: int) -> Iterator[tuple[int, int]]:
+        if self._fits(text, start, end):
+            yield start, end
+            return
+        if level >= len(SEPARATORS):
+            yield from self._fixed(text, start, end)
+            return
+
+        sep = SEPARATORS[level]
+        pieces = text[start:end].split(sep)
+        if len(pieces) == 1:
+            yield from self._recursive(text, start, end, level + 1)
+            return
+        parts: list[tuple[int, int]] = []
+        pos = start
+        for piece in pieces:
+            parts.append((pos, pos + len(piece)))
+            pos += len(piece) + len(sep)
+
+        lengths = self._measure(pieces)
+        sep_len = self._sep_len[sep]
+        acc_start = acc_end = -1
+        acc_len = 0
+        for (s, e), n in zip(parts, lengths):
+            if n > self.size:
+                if acc_start >= 0:
+                    yield acc_start, acc_end
+                    acc_start = -1
+                yield from self._recursive(text, s, e, level + 1)
+            elif acc_start < 0:
+                acc_start, acc_end, acc_len = s, e, n
+            elif acc_len + sep_len + n > self.size:
+                yield acc_start, acc_end
+                acc_start, acc_end, acc_len = s, e, n
+            else:
+                acc_end, acc_len = e, acc_len + sep_len + n
+        if acc_start >= 0:
+            yield acc_start, acc_end
+
+    def _fixed(self, text: str, start: int, end: int) -> Iterator[tuple[int, int]]:
+        step = self.size - self.overlap
+        if self.tokenizer is None:
+            i = start
+            while i < end:
+                j = min(i + self.size, end)
+                yield i, j
+                if j == end:
+                    break
+                i += step
+            return
+
+        offsets = self.tokenizer(
+            text[start:end], add_special_tokens=False, return_offsets_mapping=True
+        )["offset_mapping"]
+        if not offsets:
+            yield start, end
+            return
+        i = 0
+        while i < len(offsets):
+            j = min(i + self.size, len(offsets))
+            yield start + offsets[i][0], start + offsets[j - 1][1]
+            if j == len(offsets):
+                break
+            i += step
+
+    # -- streaming -----------------------------------------------------------------
+
+    def iter_stream(self, segments: Iterable[str]) -> Iterator[TextChunk]:
+        """Chunk a stream of text segments (e.g. PDF pages) holding only a bounded tail in memory.
+
+        Offsets refer to the concatenation of all segments.
+        """
+        if self.strategy == "fixed" and self.tokenizer is None:
+            yield from self._stream_fixed_chars(segments)
+            return
+
+        # Split the buffer at the last paragraph (or line/word) break once it is large
+        # enough; the remainder carries over so chunks can still span segment boundaries.
+        window = self.size * (4 if self.tokenizer is not None else 1)
+        threshold = max(window * 8, 4096)
+        parts: list[str] = []
+        buffered = 0
+        base = 0
+        for seg in segments:
+            parts.append(seg)
+            buffered += len(seg)
+            if buffered < threshold:
+                continue
+            buf = "".join(parts)
+            cut = -1
+            for sep in SEPARATORS[:2] + (" ",):
+                cut = buf.rfind(sep, 0, len(buf) - window)
+                if cut > 0:
+                    break
+            if cut <= 0:
+                cut = len(buf) - window
+            yield from self._chunks(buf, 0, cut, base)
+            parts = [buf[cut:]]
+            buffered = len(parts[0])
+            base += cut
+        if parts:
+            buf = "".join(parts)
+            yield from self._chunks(buf, 0, len(buf), base)
+
+    def _stream_fixed_chars(self, segments: Iterable[str]) -> Iterator[TextChunk]:
+        # Same windows as split_fixed, emitted as soon as each one is complete
+        step = self.size - self.overlap
+        buf = ""
+        base = 0
+        for seg in segments:
+            buf += seg
+            start = 0
+            while len(buf) - start > self.size:
+                yield from self._chunks(buf, start, start + self.size, base)
+                start += step
+            buf = buf[start:]
+            base += start
+        yield from self._chunks(buf, 0, len(buf), base)
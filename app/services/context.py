@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import copy
+import re
+from dataclasses import dataclass, field
+from typing import Any, Sequence
+
+from ..config import settings
+from ..schemas import ChatMessage
+
+from .chunk_cache import ChunkSpan
+from .llm import SYSTEM_PROMPT
+from .model_registry import get_tokenizer
+from .types import RetrievedChunk
+
+
+_WORD = re.compile(r"\w+")
+_SHINGLE = 5  # words per shingle for near-duplicate detection
+_MIN_OVERLAP = 16  # shortest text overlap trusted when offsets are unknown
+_MIN_PARTIAL_TOKENS = 64  # don't bother packing a truncated passage shorter than this
+
+
+@dataclass
+class Passage:
+    """One or more retrieved chunks of a document, stitched back into continuous text."""
+
+    document_id: int
+    text: str
+    score: float
+    chunk_ids: list[int]
+    last_index: int | None = None
+    end: int | None = None  # character offset where ``text`` ends in the document
+
+    def header(self) -> str:
+        return f"[Doc {self.document_id} | Score {self.score:.3f}]\n"
+
+
+@dataclass
+class PackedContext:
+    messages: list[dict[str, str]]
+    prompt_tokens: int
+    baseline_tokens: int  # what the unpacked prompt (every chunk, last 10 history messages) would cost
+    passages: list[Passage] = field(default_factory=list)
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.baseline_tokens - self.prompt_tokens)
+
+
+def _text_overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of ``a`` that is a prefix of ``b``."""
+    probe = b[:_MIN_OVERLAP]
+    if len(probe) < _MIN_OVERLAP:
+        return 0
+    tail = a[-len(b):]
+    pos = tail.find(probe)
+    while pos != -1:
+        if b.startswith(tail[pos:]):
+            return len(tail) - pos
+        pos = tail.find(probe, pos + 1)
+    return 0
+
+
+def _shingles(text: str) -> set[int]:
+    words = _WORD.findall(text.lower())
+    if len(words) < _SHINGLE:
+        return {hash(" ".join(words))} if words else set()
+    return {hash(" ".join(words[i:i + _SHINGLE])) for i in range(len(words) - _SHINGLE + 1)}
+
+
+class ContextPacker:
+    """Turns retrieved chunks and chat history into LLM messages within a token budget.
+
+    Hits from the same document that are neighbours (consecutive ``index_in_document``
+    or overlapping offsets) are stitched into one passage with the chunk overlap
+    removed. Passages whose word shingles are mostly contained in a better-scored
+    passage are dropped. History gets at most ``history_share`` of the budget,
+    newest turns first. Context passages then fill what is left in score order, and
+    the last one may be truncated. Token counts come from the embedding model's
+    tokenizer, falling back to ~4 characters per token for models without one.
+    """
+
+    def __init__(
+        self,
+        budget: int | None = None,
+        history_share: float | None = None,
+        dedup_similarity: float | None = None,
+        tokenizer: Any = None,
+    ):
+        self.budget = settings.rag_context_token_budget if budget is None else budget
+        self.history_share = settings.rag_history_token_share if history_share is None else history_share
+        self.dedup_similarity = (
+            settings.rag_context_dedup_similarity if dedup_similarity is None else dedup_similarity
+        )
+        self._tokenizer = tokenizer
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.baseline_tokens = 0
+        self.chunks_in = 0
+        self.passages_out = 0
+
+    @property
+    def tokenizer(self) -> Any:
+        if self._tokenizer is None:
+            # A private copy: packing runs in worker threads, and sharing the embedding
+            # model's tokenizer would let its truncation/padding switches race ours
+            tokenizer = get_tokenizer()
+            self._tokenizer = copy.deepcopy(tokenizer) if tokenizer is not None else False
+        return self._tokenizer or None
+
+    def count(self, texts: Sequence[str]) -> list[int]:
+        if not texts:
+            return []
+        if self.tokenizer is None:
+            return [max(1, len(t) // 4) if t else 0 for t in texts]
+        return [len(ids) for ids in self.tokenizer(list(texts), add_special_tokens=False, verbose=False)["input_ids"]]
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        if self.tokenizer is None:
+            cut = text[: max_tokens * 4]
+        else:
+            offsets = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)[
+                "offset_mapping"
+            ]
+            if len(offsets) <= max_tokens:
+                return text
+            cut = text[: offsets[max_tokens - 1][1]]
+        # End on a word boundary
+        space = cut.rfind(" ")
+        return (cut[:space] if space > len(cut) // 2 else cut) + " …"
+
+    @staticmethod
+    def merge(results: Sequence[RetrievedChunk], spans: dict[int, ChunkSpan]) -> list[Passage]:
+        """Stitch neighbouring hits of each document into passages, in document order."""
+        by_doc: dict[int, list[RetrievedChunk]] = {}
+        for r in results:
+            by_doc.setdefault(r.document_id, []).append(r)
+
+        passages: list[Passage] = []
+        for doc, hits in by_doc.items():
+            # Chunks without a known position can't be placed; they stay on their own
+            hits.sort(key=lambda r: spans[r.chunk_id][0] if r.chunk_id in spans else -1)
+            current: Passage | None = None
+            for r in hits:
+                index, start, end = spans.get(r.chunk_id, (None, None, None))
+                adjacent = (
+                    current is not None
+                    and index is not None
+                    and current.last_index is not None
+                    and (
+                        index == current.last_index + 1
+                        or (start is not None and current.end is not None and start < current.end)
+                    )
+                )
+                if not adjacent:
+                    current = Passage(doc, r.text, r.score, [r.chunk_id], index, end)
+                    passages.append(current)
+                    continue
+                if start is not None and current.end is not None:
+                    if end is not None and end <= current.end:
+                        pass  # fully inside what we already have
+                    elif start < current.end:
+                        current.text += r.text[current.end - start:]
+                    else:
+                        current.text += " " + r.text
+                else:
+                    k = _text_overlap(current.text, r.text)
+                    current.text += r.text[k:] if k else " " + r.text
+                current.score = max(current.score, r.score)
+                current.chunk_ids.append(r.chunk_id)
+                current.last_index = index
+                current.end = max(current.end, end) if current.end is not None and end is not None else end
+        return passages
+
+    def dedupe(self, passages: list[Passage]) -> list[Passage]:
+        """Drop passages mostly contained in a better-scored one; returns the rest by score."""
+        kept: list[tuple[Passage, set[int]]] = []
+        for p in sorted(passages, key=lambda p: p.score, reverse=True):
+            sh = _shingles(p.text)
+            if sh and any(
+                len(sh & other) / min(len(sh), len(other)) >= self.dedup_similarity for _, other in kept if other
+            ):
+                continue
+            kept.append((p, sh))
+        return [p for p, _ in kept]
+
+    def pack(
+        self,
+        query: str,
+        results: Sequence[RetrievedChunk],
+        spans: dict[int, ChunkSpan],
+        history: Sequence[ChatMessage],
+        summary: str | None = None,
+    ) -> PackedContext:
+        """Build the prompt messages. ``summary`` is the rolling summary of turns older
+        than ``history``; it is charged to the history share and goes in first."""
+        history = list(history)
+        summary_text = f"Summary of the earlier conversation:\n{summary}" if summary else ""
+        passages = self.dedupe(self.merge(results, spans))
+        # One tokenizer call for everything we need to measure
+        pieces = (
+            [SYSTEM_PROMPT, query, summary_text]
+            + [m.content for m in history]
+            + [f"[Doc {r.document_id} | Score {r.score:.3f}]\n{r.text}" for r in results]
+            + [p.header() + p.text for p in passages]
+        )
+        counts = self.count(pieces)
+        fixed, summary_tokens = counts[0] + counts[1], counts[2]
+        hist_counts = counts[3:3 + len(history)]
+        chunk_counts = counts[3 + len(history):3 + len(history) + len(results)]
+        passage_counts = counts[3 + len(history) + len(results):]
+
+        remaining = max(0, self.budget - fixed)
+        history_budget = int(remaining * self.history_share)
+        used = summary_tokens if summary_tokens <= history_budget else 0
+        kept_history: list[ChatMessage] = []
+        for msg, n in zip(reversed(history), reversed(hist_counts)):
+            if used + n > history_budget:
+                break
+            kept_history.append(msg)
+            used += n
+        kept_history.reverse()
+        remaining -= used
+
+        packed: list[str] = []
+        kept_passages: list[Passage] = []
+        context_tokens = 0
+        for p, n in zip(passages, passage_counts):
+            if n > remaining:
+                if remaining < _MIN_PARTIAL_TOKENS:
+                    continue
+                # The truncation marker and word-boundary cut keep this a little under budget
+                header = p.header()
+                packed.append(header + self._truncate(p.text, remaining - self.count([header])[0] - 2))
+                n = remaining
+            else:
+                packed.append(p.header() + p.text)
+            remaining -= n
+            context_tokens += n
+            kept_passages.append(p)
+
+        messages: list[dict[str, str]] = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "system", "content": "Context:\n" + "\n\n".join(packed)},
+        ]
+        if summary_text and summary_tokens <= history_budget:
+            messages.append({"role": "system", "content": summary_text})
+        messages.extend({"role": m.role, "content": m.content} for m in kept_history)
+        messages.append({"role": "user", "content": query})
+
+        prompt_tokens = fixed + used + context_tokens
+        baseline = fixed + sum(hist_counts[-10:]) + sum(chunk_counts)
+        self.requests += 1
+        self.prompt_tokens += prompt_tokens
+        self.baseline_tokens += baseline
+        self.chunks_in += len(results)
+        self.passages_out += len(kept_passages)
+        return PackedContext(messages, prompt_tokens, baseline, kept_passages)
+
+    def stats(self) -> dict:
+        n = max(1, self.requests)
+        return {
+            "requests": self.requests,
+            "budget": self.budget,
+            "mean_prompt_tokens": round(self.prompt_tokens / n, 1),
+            "mean_baseline_tokens": round(self.baseline_tokens / n, 1),
+            "tokens_saved": max(0, self.baseline_tokens - self.prompt_tokens),
+            "mean_chunks_in": round(self.chunks_in / n, 2),
+            "mean_passages_out": round(self.passages_out / n, 2),
+        }
+
+
+context_packer = ContextPacker()
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import numpy as np
+
+from .embeddings import EmbeddingsService
+from ..config import settings
+
+
+@dataclass
+class _Pending:
+    text: str
+    future: asyncio.Future
+    enqueued_at: float
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent single-text embed calls into one encode per batch."""
+
+    def __init__(
+        self,
+        embedder: EmbeddingsService | None = None,
+        max_batch_size: int | None = None,
+        max_wait_ms: float | None = None,
+        stats_window: int = 1024,
+    ):
+        self.embedder = embedder or EmbeddingsService()
+        self.max_batch_size = max(1, max_batch_size or settings.embedding_batch_max_size)
+        wait_ms = settings.embedding_batch_max_wait_ms if max_wait_ms is None else max_wait_ms
+        self.max_wait = max(0.0, wait_ms) / 1000.0
+        self._queue: asyncio.Queue[_Pending] | None = None
+        self._worker: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+        self.batches = 0
+        self.items = 0
+        self._batch_sizes: deque[int] = deque(maxlen=stats_window)
+        self._waits: deque[float] = deque(maxlen=stats_window)
+
+    def _ensure_worker(self) -> asyncio.Queue[_Pending]:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+        return self._queue
+
+    async def embed(self, text: str) -> np.ndarray:
+        queue = self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait(_Pending(text=text, future=future, enqueued_at=time.perf_counter()))
+        return await future
+
+    async def _collect(self, queue: asyncio.Queue[_Pending]) -> list[_Pending]:
+        batch = [await queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        # Whatever else is already queued rides along for free
+        while len(batch) < self.max_batch_size and not queue.empty():
+            batch.append(queue.get_nowait())
+        return batch
+
+    async def _run(self) -> None:
+        queue = self._queue
+        while True:
+            batch = await self._collect(queue)
+            batch = [p for p in batch if not p.future.cancelled()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            self.batches += 1
+            self.items += len(batch)
+            self._batch_sizes.append(len(batch))
+            self._waits.extend(started - p.enqueued_at for p in batch)
+            try:
+                vectors = await asyncio.to_thread(self.embedder.encode, [p.text for p in batch])
+            except Exception as e:
+                for p in batch:
+                    if not p.future.done():
+                        p.future.set_exception(e)
+                continue
+            for p, vec in zip(batch, vectors):
+                if not p.future.done():
+                    p.future.set_result(vec)
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except (asyncio.CancelledError, RuntimeError):
+                pass
+            self._worker = None
+
+    def stats(self) -> dict:
+        sizes = list(self._batch_sizes)
+        waits = sorted(self._waits)
+
+        def pct(p: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 3)
+
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+            "max_batch_size_seen": max(sizes, default=0),
+            "queue_wait_ms": {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99)},
+        }
+
+
+_batcher: EmbeddingBatcher | None = None
+_batcher_lock = threading.Lock()
+
+
+def get_embedding_batcher() -> EmbeddingBatcher:
+    # Loads the embedding model on first use; call it off the event loop until then
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = EmbeddingBatcher()
+    return _batcher
+
+
+def existing_embedding_batcher() -> EmbeddingBatcher | None:
+    """The batcher if something has built it already; never loads the model."""
+    return _batcher
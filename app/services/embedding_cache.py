@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import hashlib
+import unicodedata
+from typing import Sequence
+
+import numpy as np
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..models import EmbeddingCacheEntry
+
+
+# Dialects whose INSERT supports ON CONFLICT DO NOTHING
+_CONFLICT_INSERTS = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}
+
+
+def normalize_chunk(text: str) -> str:
+    # Whitespace and Unicode-form differences don't change what the chunk says
+    return unicodedata.normalize("NFKC", " ".join(text.split()))
+
+
+def content_hash(text: str) -> str:
+    return hashlib.blake2b(normalize_chunk(text).encode("utf-8"), digest_size=20).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by (model name, normalized content hash)."""
+
+    def __init__(self, model_name: str | None = None, dim: int | None = None):
+        self.model_name = model_name or settings.embedding_model_name
+        self.dim = dim or settings.embedding_dim
+
+    async def lookup(self, db: AsyncSession, hashes: Sequence[str]) -> dict[str, np.ndarray]:
+        if not hashes:
+            return {}
+        rows = (
+            await db.execute(
+                select(EmbeddingCacheEntry.content_hash, EmbeddingCacheEntry.vector).where(
+                    EmbeddingCacheEntry.model_name == self.model_name,
+                    EmbeddingCacheEntry.content_hash.in_(set(hashes)),
+                )
+            )
+        ).all()
+        found: dict[str, np.ndarray] = {}
+        for h, blob in rows:
+            vec = np.frombuffer(blob, dtype="<f4")
+            if vec.shape[0] == self.dim:
+                found[h] = vec
+        return found
+
+    async def store(self, db: AsyncSession, hashes: Sequence[str], vectors: np.ndarray) -> None:
+        if not hashes:
+            return
+        values = [
+            {"model_name": self.model_name, "content_hash": h, "vector": np.asarray(v, dtype="<f4").tobytes()}
+            for h, v in zip(hashes, vectors)
+        ]
+        # Another ingest may have cached the same chunk meanwhile; either copy is fine
+        conflict_insert = _CONFLICT_INSERTS.get(db.get_bind().dialect.name)
+        if conflict_insert is not None:
+            await db.execute(conflict_insert(EmbeddingCacheEntry).values(values).on_conflict_do_nothing())
+            return
+        existing = set(
+            (
+                await db.execute(
+                    select(EmbeddingCacheEntry.content_hash).where(
+                        EmbeddingCacheEntry.model_name == self.model_name,
+                        EmbeddingCacheEntry.content_hash.in_([v["content_hash"] for v in values]),
+                    )
+                )
+            ).scalars()
+        )
+        for value in values:
+            if value["content_hash"] in existing:
+                continue
+            try:
+                async with db.begin_nested():
+                    await db.execute(insert(EmbeddingCacheEntry).values(value))
+            except IntegrityError:
+                pass
+
+    async def embed(
+        self, db: AsyncSession, texts: Sequence[str], encode
+    ) -> tuple[np.ndarray, int, int]:
+        """Embed ``texts`` via the cache, calling ``encode`` (async, list -> matrix) for misses only.
+
+        Returns the (n, dim) float32 matrix plus hit and miss counts. Duplicates within
+        ``texts`` are embedded once.
+        """
+        hashes = [content_hash(t) for t in texts]
+        cached = await self.lookup(db, hashes)
+        miss_index: dict[str, int] = {}
+        for i, h in enumerate(hashes):
+            if h not in cached and h not in miss_index:
+                miss_index[h] = i
+
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        if miss_index:
+            fresh = await encode([texts[i] for i in miss_index.values()])
+            for h, vec in zip(miss_index, fresh):
+                cached[h] = vec
+            await self.store(db, list(miss_index), fresh)
+        for i, h in enumerate(hashes):
+            out[i] = cached[h]
+        misses = len(miss_index)
+        return out, len(texts) - misses, misses
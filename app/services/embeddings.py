@@ -1,17 +1,31 @@
 from __future__ import annotations
 
-from typing import List
-from sentence_transformers import SentenceTransformer
+from typing import List, Sequence
+
+import numpy as np
+
 from . import types as svc_types
+from .metrics import EMBED_BATCH_SIZE, EMBED_DURATION
+from .model_registry import get_embedding_model
 from ..config import settings
 
 
 class EmbeddingsService:
     def __init__(self, model_name: str | None = None):
-        name = model_name or settings.embedding_model_name
-        self._model = SentenceTransformer(name)
+        self.model_name = model_name or settings.embedding_model_name
+        # Shared per process; constructing the service no longer reloads weights
+        self._model = get_embedding_model(self.model_name)
+        self.dim = settings.embedding_dim
 
-    def embed(self, texts: List[str]) -> List[list[float]]:
-        embeddings = self._model.encode(texts, convert_to_numpy=False, normalize_embeddings=True)
-        return [list(map(float, vec)) for vec in embeddings]
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed texts as a C-contiguous float32 matrix of L2-normalized rows, shape (n, dim)."""
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        EMBED_BATCH_SIZE.observe(len(texts))
+        with EMBED_DURATION.time():
+            embeddings = self._model.encode(list(texts), convert_to_numpy=True, normalize_embeddings=True)
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
 
+    def embed(self, texts: List[str]) -> List[list[float]]:
+        # List form kept for callers that need JSON-serializable vectors
+        return self.encode(texts).tolist()
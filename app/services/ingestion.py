@@ -1,84 +1,389 @@
 from __future__ import annotations
 
-from typing import Iterable
+import asyncio
+import bisect
+import codecs
+import inspect
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Awaitable, BinaryIO, Callable, Iterable, Iterator, TypeVar
+from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from pdfminer.high_level import extract_text as pdf_extract_text
 
+from ..config import settings
 from ..models import Document, Chunk
-from .chunking import split_recursive, split_fixed
+from .answer_cache import answer_cache
+from .chunk_cache import chunk_text_cache
+from .chunking import ChunkingEngine, TextChunk
+from .embedding_cache import EmbeddingCache
 from .embeddings import EmbeddingsService
-from .vector_store import get_vector_store
+from .metrics import INGEST_CHUNKS, INGEST_DOCUMENTS, INGEST_STAGE
+from .model_registry import get_tokenizer
+from .pdf_extraction import pdf_extractor
+from .vector_store import get_async_vector_store
+
+
+TEXT_BLOCK_SIZE = 64 * 1024
+
+T = TypeVar("T")
+
+
+@dataclass
+class IngestionProgress:
+    filename: str
+    document_id: int | None = None
+    pages: int = 0
+    chars: int = 0
+    chunks: int = 0
+    embedded: int = 0
+    stored: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    stage_seconds: dict[str, float] = field(
+        default_factory=lambda: {"extract": 0.0, "chunk": 0.0, "embed": 0.0, "store": 0.0}
+    )
+
+
+ProgressCallback = Callable[[IngestionProgress], Awaitable[None] | None]
+
+
+def _is_pdf(filename: str, content_type: str) -> bool:
+    return filename.lower().endswith(".pdf") or content_type == "application/pdf"
+
+
+def iter_pdf_pages(fp: BinaryIO) -> Iterator[tuple[int, str]]:
+    # The pool workers open the PDF by path; spooled uploads that still live in memory
+    # are copied to a temporary file first.
+    name = getattr(fp, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        yield from pdf_extractor.iter_pages(name)
+        return
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+        shutil.copyfileobj(fp, tmp, length=1024 * 1024)
+        tmp.flush()
+        yield from pdf_extractor.iter_pages(tmp.name)
+
+
+def iter_text_blocks(fp: BinaryIO, block_size: int = TEXT_BLOCK_SIZE) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    while True:
+        block = fp.read(block_size)
+        if not block:
+            break
+        yield decoder.decode(block)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def iter_extracted_text(fp: BinaryIO, filename: str, content_type: str) -> Iterator[tuple[int | None, str]]:
+    """Yield ``(page_number, text)`` segments; page numbers are None for plain text."""
+    if _is_pdf(filename, content_type):
+        return iter_pdf_pages(fp)
+    return ((None, block) for block in iter_text_blocks(fp))
 
 
 async def extract_text_from_file(content: bytes, filename: str, content_type: str) -> str:
-    if filename.lower().endswith(".pdf") or content_type == "application/pdf":
-        # pdfminer expects a file path or a file-like object
-        from io import BytesIO
-        from pdfminer.high_level import extract_text
-        pdf_file = BytesIO(content)
-        try:
-            # The extract_text function can work with file-like objects
-            text = extract_text(pdf_file)
-            if not text:
-                raise ValueError("No text could be extracted from the PDF")
-            return text
-        except Exception as e:
-            raise ValueError(f"Failed to extract text from PDF: {str(e)}")
-        finally:
-            pdf_file.close()
-    else:
-        try:
-            return content.decode("utf-8", errors="ignore")
-        except Exception as e:
-            raise ValueError(f"Failed to decode text file: {str(e)}")
+    def _extract() -> str:
+        return "".join(text for _, text in iter_extracted_text(BytesIO(content), filename, content_type))
 
+    text = await asyncio.to_thread(_extract)
+    if _is_pdf(filename, content_type) and not text:
+        raise ValueError("No text could be extracted from the PDF")
+    return text
 
-async def ingest_document(
+
+class _PageTracker:
+    """Passes segment text to the chunker while remembering where each page starts."""
+
+    def __init__(self, segments: Iterable[tuple[int | None, str]], progress: IngestionProgress):
+        self._segments = segments
+        self._progress = progress
+        self._starts: list[int] = []
+        self._pages: list[int | None] = []
+        self._offset = 0
+
+    def __iter__(self) -> Iterator[str]:
+        it = iter(self._segments)
+        while True:
+            started = time.perf_counter()
+            try:
+                page_no, text = next(it)
+            except StopIteration:
+                return
+            finally:
+                self._progress.stage_seconds["extract"] += time.perf_counter() - started
+            self._progress.pages += 1
+            self._progress.chars += len(text)
+            if page_no is not None:
+                self._starts.append(self._offset)
+                self._pages.append(page_no)
+            self._offset += len(text)
+            yield text
+
+    def page_at(self, offset: int) -> int | None:
+        i = bisect.bisect_right(self._starts, offset) - 1
+        return self._pages[i] if i >= 0 else None
+
+
+def _take(chunks: Iterator[TextChunk], n: int) -> list[TextChunk]:
+    batch: list[TextChunk] = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= n:
+            break
+    return batch
+
+
+async def _report(on_progress: ProgressCallback | None, progress: IngestionProgress) -> None:
+    if on_progress is None:
+        return
+    result = on_progress(progress)
+    if inspect.isawaitable(result):
+        await result
+
+
+async def ingest_stream(
     db: AsyncSession,
     *,
     filename: str,
     content_type: str,
-    raw_bytes: bytes,
+    fileobj: BinaryIO,
     strategy: str = "recursive",
     fixed_size: int = 500,
     fixed_overlap: int = 50,
-) -> tuple[int, int]:
-    text = await extract_text_from_file(raw_bytes, filename, content_type)
-    if not text.strip():
-        raise ValueError("No text extracted from file")
+    size_unit: str | None = None,
+    tenant_id: str | None = None,
+    batch_size: int | None = None,
+    on_progress: ProgressCallback | None = None,
+    on_document: Callable[[int | None], None] | None = None,
+) -> IngestionProgress:
+    """Extract, chunk, embed and store a document batch by batch.
+
+    Pages are pulled lazily from ``fileobj`` and at most ``batch_size`` chunks are held
+    at once, so memory stays flat regardless of document size.
+
+    ``on_document`` is called with the new document's id just before its row is
+    committed, and with None just before a partial document is discarded; changes it
+    makes to objects in ``db`` are committed together with those.
+    """
+    batch_size = batch_size or settings.ingest_batch_size
+    size_unit = size_unit or settings.chunk_size_unit
+    engine = ChunkingEngine(
+        strategy=strategy,
+        size=fixed_size,
+        overlap=fixed_overlap,
+        unit=size_unit,
+        tokenizer=get_tokenizer() if size_unit == "tokens" else None,
+    )
+    progress = IngestionProgress(filename=filename)
+    pages = _PageTracker(iter_extracted_text(fileobj, filename, content_type), progress)
+    chunks = engine.iter_stream(pages)
 
-    doc = Document(filename=filename, content_type=content_type)
+    doc = Document(filename=filename, content_type=content_type, tenant_id=tenant_id)
+    upserted: list[str] = []
+    try:
+        # Shielded so that, even when cancelled, whether the document row exists is known
+        await run_shielded(_add_document(db, doc, progress, on_document))
+        await _ingest_batches(db, doc, chunks, pages, progress, batch_size, on_progress, upserted)
+    except BaseException:
+        # Also on cancellation (job queue shutdown, a client going away): batches are
+        # committed as they go so concurrent ingests don't hold the SQLite write lock for
+        # a whole document, so the partial document must be undone explicitly.
+        INGEST_DOCUMENTS.inc(outcome="failed")
+        await run_shielded(_undo_partial(db, progress.document_id, upserted, on_document))
+        raise
+    if settings.answer_cache_enabled:
+        await _invalidate_previous_versions(db, doc)
+    INGEST_DOCUMENTS.inc(outcome="ok")
+    INGEST_CHUNKS.inc(progress.chunks)
+    for stage, seconds in progress.stage_seconds.items():
+        INGEST_STAGE.observe(seconds, stage=stage)
+    return progress
+
+
+async def discard_document(db: AsyncSession, document_id: int, embedding_ids: Iterable[str] = ()) -> None:
+    """Delete a document with its chunks and their vectors, e.g. what a failed ingest left."""
+    ids = set(embedding_ids)
+    ids.update((await db.execute(select(Chunk.embedding_id).where(Chunk.document_id == document_id))).scalars())
+    # Drop the vectors first: their payloads point at chunk ids that are about to be freed
+    try:
+        await get_async_vector_store().delete(list(ids))
+    except Exception as e:
+        print(f"Failed to delete {len(ids)} vectors of document {document_id}: {e!r}")
+    # Ids of deleted rows can be reused by SQLite; drop any text cached for them
+    chunk_text_cache.discard((await db.execute(select(Chunk.id).where(Chunk.document_id == document_id))).scalars())
+    await db.execute(delete(Chunk).where(Chunk.document_id == document_id))
+    await db.execute(delete(Document).where(Document.id == document_id))
+    await db.commit()
+
+
+async def _add_document(
+    db: AsyncSession, doc: Document, progress: IngestionProgress, on_document: Callable[[int | None], None] | None
+) -> None:
     db.add(doc)
     await db.flush()
+    if on_document is not None:
+        on_document(doc.id)
+    await db.commit()
+    progress.document_id = doc.id
 
-    if strategy == "fixed":
-        chunks = split_fixed(text, size=fixed_size, overlap=fixed_overlap)
-    else:
-        chunks = split_recursive(text, max_tokens=fixed_size, overlap=fixed_overlap)
 
-    chunk_models: list[Chunk] = []
-    for idx, chunk_text in enumerate(chunks):
-        chunk_models.append(Chunk(document_id=doc.id, index_in_document=idx, text=chunk_text))
+async def _undo_partial(
+    db: AsyncSession, document_id: int | None, upserted: list[str], on_document: Callable[[int | None], None] | None
+) -> None:
+    # The batch in flight may have upserted vectors for rows it never committed
+    await db.rollback()
+    if document_id is not None:
+        if on_document is not None:
+            on_document(None)
+        await discard_document(db, document_id, upserted)
 
-    db.add_all(chunk_models)
-    await db.flush()
 
-    # Embed and upsert to vector store
-    embedder = EmbeddingsService()
-    vectors = embedder.embed([c.text for c in chunk_models])
-    vs = get_vector_store()
-    payloads = []
-    
-    import uuid
-    for c, vec in zip(chunk_models, vectors):
-        # Generate a UUID for the vector store
-        point_id = str(uuid.uuid4())
-        # Store the UUID in the chunk for reference
-        c.embedding_id = point_id
-        payloads.append((point_id, vec, {"chunk_id": c.id, "document_id": doc.id, "text": c.text}))
-    vs.upsert(payloads)
+async def run_shielded(coro: Awaitable[T]) -> T:
+    """Run ``coro`` to the end even if the caller is cancelled meanwhile; the
+    cancellation is raised once it is done."""
+    task = asyncio.ensure_future(coro)
+    cancelled = False
+    while True:
+        try:
+            result = await asyncio.shield(task)
+            break
+        except asyncio.CancelledError:
+            if task.done():
+                raise
+            cancelled = True
+    if cancelled:
+        raise asyncio.CancelledError
+    return result
 
-    await db.commit()
-    return doc.id, len(chunk_models)
 
+async def _invalidate_previous_versions(db: AsyncSession, doc: Document) -> None:
+    # Re-ingesting a file: cached answers built from its earlier versions may be stale
+    previous = (
+        await db.execute(
+            select(Document.id).where(
+                Document.filename == doc.filename,
+                Document.tenant_id.is_(None) if doc.tenant_id is None else Document.tenant_id == doc.tenant_id,
+                Document.id != doc.id,
+            )
+        )
+    ).scalars().all()
+    if previous:
+        await answer_cache.invalidate_documents(previous)
+
+
+def _payload(chunk: Chunk, tenant_id: str | None) -> dict:
+    payload = {"chunk_id": chunk.id, "document_id": chunk.document_id}
+    if tenant_id is not None:
+        payload["tenant_id"] = tenant_id
+    if settings.vector_payload_mode != "ids":
+        payload.update(page=chunk.page_number, text=chunk.text)
+    return payload
+
+
+async def _ingest_batches(
+    db: AsyncSession,
+    doc: Document,
+    chunks: Iterator[TextChunk],
+    pages: _PageTracker,
+    progress: IngestionProgress,
+    batch_size: int,
+    on_progress: ProgressCallback | None,
+    upserted: list[str],
+) -> None:
+    # Loads the embedding model if warmup hasn't yet; keep that off the event loop
+    embedder = await asyncio.to_thread(EmbeddingsService)
+    cache = EmbeddingCache(embedder.model_name, embedder.dim) if settings.embedding_cache_enabled else None
+    vs = get_async_vector_store()
+
+    async def encode(texts: list[str]):
+        return await asyncio.to_thread(embedder.encode, texts)
+
+    async def store(batch: list[TextChunk]) -> None:
+        texts = [c.text for c in batch]
+        rows = [
+            Chunk(
+                document_id=doc.id,
+                index_in_document=progress.chunks + i,
+                page_number=pages.page_at(c.start),
+                start_char=c.start,
+                end_char=c.end,
+                text=c.text,
+                embedding_id=str(uuid.uuid4()),
+            )
+            for i, c in enumerate(batch)
+        ]
+        progress.chunks += len(rows)
+
+        started = time.perf_counter()
+        if cache is not None:
+            vectors, hits, misses = await cache.embed(db, texts, encode)
+            progress.cache_hits += hits
+            progress.cache_misses += misses
+        else:
+            vectors = await encode(texts)
+            progress.cache_misses += len(texts)
+        progress.stage_seconds["embed"] += time.perf_counter() - started
+        progress.embedded += len(rows)
+
+        started = time.perf_counter()
+        db.add_all(rows)
+        await db.flush()
+        ids = [c.embedding_id for c in rows]
+        # Recorded before the call so a partly applied upsert is cleaned up too
+        upserted.extend(ids)
+        await vs.upsert(
+            ids,
+            vectors,
+            [_payload(c, doc.tenant_id) for c in rows],
+        )
+        await db.commit()
+        for c in rows:
+            db.expunge(c)
+        progress.stage_seconds["store"] += time.perf_counter() - started
+        progress.stored += len(rows)
+
+    while True:
+        # Extraction and chunking are synchronous generators; drive them off the event loop
+        extract_before = progress.stage_seconds["extract"]
+        started = time.perf_counter()
+        batch = await asyncio.to_thread(_take, chunks, batch_size)
+        pulled = time.perf_counter() - started
+        progress.stage_seconds["chunk"] += max(0.0, pulled - (progress.stage_seconds["extract"] - extract_before))
+        if not batch:
+            break
+        # A cancellation mid-statement would leave the SQLite connection holding its write
+        # lock, so one only takes effect between batches
+        await run_shielded(store(batch))
+        await _report(on_progress, progress)
+
+    if progress.chunks == 0:
+        raise ValueError("No text extracted from file")
+
+
+async def ingest_document(
+    db: AsyncSession,
+    *,
+    filename: str,
+    content_type: str,
+    raw_bytes: bytes,
+    strategy: str = "recursive",
+    fixed_size: int = 500,
+    fixed_overlap: int = 50,
+) -> tuple[int, int]:
+    progress = await ingest_stream(
+        db,
+        filename=filename,
+        content_type=content_type,
+        fileobj=BytesIO(raw_bytes),
+        strategy=strategy,
+        fixed_size=fixed_size,
+        fixed_overlap=fixed_overlap,
+    )
+    return progress.document_id, progress.chunks
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import shutil
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import BinaryIO
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..db import SessionLocal
+from ..models import IngestionJob, IngestionJobFile
+from .ingestion import IngestionProgress, discard_document, ingest_stream, run_shielded
+
+
+class IngestionJobQueue:
+    """SQLite-backed queue of ingestion jobs processed by a bounded pool of workers.
+
+    Uploaded files are spooled to disk and every file is a row in ``ingestion_job_files``,
+    so pending and interrupted work is picked up again on the next start.
+
+    Several processes may share the table. A file is claimed with a conditional UPDATE,
+    so exactly one queue processes it, and the claiming queue refreshes the row's
+    ``heartbeat_at`` every ``ingest_job_heartbeat_seconds``. A running file whose
+    heartbeat is four intervals old belongs to a queue that died: any queue (at start
+    and then on every heartbeat) removes its partial document and runs it again.
+    """
+
+    def __init__(self, concurrency: int | None = None, spool_dir: str | None = None):
+        self.concurrency = max(1, concurrency or settings.ingest_job_concurrency)
+        self.spool_dir = spool_dir or settings.ingest_spool_dir
+        self._queue: asyncio.Queue[int] | None = None
+        self._workers: list[asyncio.Task] = []
+        self._heartbeat: asyncio.Task | None = None
+        self._progress: dict[int, IngestionProgress] = {}
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.heartbeat_interval = max(1.0, settings.ingest_job_heartbeat_seconds)
+
+    async def start(self) -> None:
+        if self._workers:
+            return
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._queue = asyncio.Queue()
+        await self._recover_stale()
+        async with SessionLocal() as db:
+            pending = (
+                await db.execute(
+                    select(IngestionJobFile.id).where(IngestionJobFile.state == "pending").order_by(IngestionJobFile.id)
+                )
+            ).scalars().all()
+        for file_id in pending:
+            self._queue.put_nowait(file_id)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._heartbeat = asyncio.create_task(self._keep_alive())
+
+    async def stop(self) -> None:
+        tasks = self._workers + ([self._heartbeat] if self._heartbeat is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._heartbeat = None
+
+    async def _keep_alive(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await run_shielded(self._beat())
+                for file_id in await self._recover_stale():
+                    self._queue.put_nowait(file_id)
+            except Exception as e:
+                print(f"Ingestion job heartbeat failed: {e!r}")
+
+    async def _beat(self) -> None:
+        async with SessionLocal() as db:
+            await db.execute(
+                update(IngestionJobFile)
+                .where(IngestionJobFile.worker_id == self.worker_id, IngestionJobFile.state == "running")
+                .values(heartbeat_at=datetime.utcnow())
+            )
+            await db.commit()
+
+    async def _recover_stale(self) -> list[int]:
+        """Put files whose queue stopped heartbeating back to pending, without the partial
+        document it may have left; returns their ids."""
+        cutoff = datetime.utcnow() - timedelta(seconds=4 * self.heartbeat_interval)
+        recovered: list[int] = []
+        async with SessionLocal() as db:
+            stale = (
+                await db.execute(
+                    select(IngestionJobFile.id, IngestionJobFile.document_id, IngestionJobFile.heartbeat_at).where(
+                        IngestionJobFile.state == "running",
+                        (IngestionJobFile.heartbeat_at.is_(None)) | (IngestionJobFile.heartbeat_at < cutoff),
+                    )
+                )
+            ).all()
+            for file_id, document_id, seen in stale:
+                # Conditional on the heartbeat read above: if another queue recovered it or
+                # its owner came back meanwhile, leave it alone
+                reset = await run_shielded(self._reset_stale(db, file_id, document_id, seen))
+                if reset:
+                    recovered.append(file_id)
+        return recovered
+
+    @staticmethod
+    async def _reset_stale(db: AsyncSession, file_id: int, document_id: int | None, seen: datetime | None) -> bool:
+        result = await db.execute(
+            update(IngestionJobFile)
+            .where(
+                IngestionJobFile.id == file_id,
+                IngestionJobFile.state == "running",
+                IngestionJobFile.heartbeat_at.is_(None) if seen is None else IngestionJobFile.heartbeat_at == seen,
+            )
+            .values(state="pending", document_id=None, started_at=None, worker_id=None, heartbeat_at=None)
+        )
+        if result.rowcount != 1:
+            await db.rollback()
+            return False
+        if document_id is not None:
+            # Commits the reset along with the deletes
+            await discard_document(db, document_id)
+        else:
+            await db.commit()
+        return True
+
+    async def _claim(self, file_id: int) -> bool:
+        async with SessionLocal() as db:
+            now = datetime.utcnow()
+            result = await db.execute(
+                update(IngestionJobFile)
+                .where(IngestionJobFile.id == file_id, IngestionJobFile.state == "pending")
+                .values(state="running", started_at=now, worker_id=self.worker_id, heartbeat_at=now)
+            )
+            await db.commit()
+            return result.rowcount == 1
+
+    def _spool(self, src: BinaryIO, path: str) -> None:
+        src.seek(0)
+        with open(path, "wb") as dst:
+            shutil.copyfileobj(src, dst, length=1024 * 1024)
+
+    async def submit(
+        self,
+        db: AsyncSession,
+        files: list[tuple[str, str, BinaryIO]],
+        *,
+        strategy: str = "recursive",
+        fixed_size: int = 500,
+        fixed_overlap: int = 50,
+        size_unit: str | None = None,
+        tenant_id: str | None = None,
+    ) -> IngestionJob:
+        """Spool ``(filename, content_type, fileobj)`` uploads to disk and enqueue them as one job."""
+        job = IngestionJob(
+            id=uuid.uuid4().hex,
+            strategy=strategy,
+            fixed_size=fixed_size,
+            fixed_overlap=fixed_overlap,
+            size_unit=size_unit,
+            tenant_id=tenant_id,
+        )
+        for filename, content_type, fileobj in files:
+            path = os.path.join(self.spool_dir, f"{job.id}-{uuid.uuid4().hex}")
+            await asyncio.to_thread(self._spool, fileobj, path)
+            job.files.append(IngestionJobFile(filename=filename, content_type=content_type, spool_path=path))
+        db.add(job)
+        await db.commit()
+        if self._queue is not None:
+            for f in job.files:
+                self._queue.put_nowait(f.id)
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            file_id = await self._queue.get()
+            try:
+                await self._process(file_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Ingestion job worker error for file {file_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, file_id: int) -> None:
+        # Another process sharing the table may have taken the file first
+        if not await run_shielded(self._claim(file_id)):
+            return
+        async with SessionLocal() as db:
+            row = await db.get(IngestionJobFile, file_id)
+            job = await db.get(IngestionJob, row.job_id)
+            spool_path = row.spool_path
+            params = dict(
+                filename=row.filename,
+                content_type=row.content_type,
+                strategy=job.strategy,
+                fixed_size=job.fixed_size,
+                fixed_overlap=job.fixed_overlap,
+                size_unit=job.size_unit,
+                tenant_id=job.tenant_id,
+            )
+
+            progress: IngestionProgress | None = None
+            error: str | None = None
+            try:
+                with open(spool_path, "rb") as fp:
+                    progress = await ingest_stream(
+                        db,
+                        fileobj=fp,
+                        on_progress=lambda p: self._progress.__setitem__(file_id, p),
+                        # Recorded in the same commit as the document, so a restart can remove it
+                        on_document=lambda document_id: setattr(row, "document_id", document_id),
+                        **params,
+                    )
+            except asyncio.CancelledError:
+                # ingest_stream has discarded the partial document; the file starts over
+                # on the next start
+                row.state, row.started_at, row.worker_id, row.heartbeat_at = "pending", None, None, None
+                await run_shielded(db.commit())
+                raise
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+            finally:
+                self._progress.pop(file_id, None)
+
+            row.finished_at = datetime.utcnow()
+            if progress is not None:
+                row.state = "done"
+                row.document_id = progress.document_id
+                row.num_chunks = progress.chunks
+                row.pages = progress.pages
+                row.cache_hits = progress.cache_hits
+                row.cache_misses = progress.cache_misses
+                row.stage_seconds = json.dumps({k: round(v, 4) for k, v in progress.stage_seconds.items()})
+            else:
+                row.state = "failed"
+                row.error = error
+            await db.commit()
+
+        try:
+            os.remove(spool_path)
+        except OSError:
+            pass
+
+    def live_progress(self, file_id: int) -> IngestionProgress | None:
+        return self._progress.get(file_id)
+
+
+job_queue = IngestionJobQueue()
@@ -1,9 +1,14 @@
 from __future__ import annotations
 
-import google.generativeai as genai
-from typing import Iterable
 import asyncio
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 from ..config import settings
+from .metrics import LLM_DURATION, LLM_RETRIES, LLM_TOKENS, Gauge, registry
 
 
 SYSTEM_PROMPT = (
@@ -12,47 +17,361 @@ SYSTEM_PROMPT = (
 )
 
 
+class LLMUnavailableError(RuntimeError):
+    """The LLM could not be reached in time: queue wait exceeded or retries exhausted."""
+
+
 class LLMProvider:
+    """Stateless chat completion: every call sends exactly the ``messages`` given.
+
+    All calls share one semaphore of ``llm_concurrency`` slots. Callers wait at most
+    ``llm_queue_timeout_seconds`` for a slot. Each attempt is bounded by
+    ``llm_request_timeout_seconds``, and rate-limit or transient errors are retried
+    with jittered exponential backoff. Subclasses implement ``_generate``,
+    ``_stream`` and ``_retryable``.
+    """
+
+    name = "base"
+
     def __init__(self):
-        # Configure Gemini
-        genai.configure(api_key=settings.gemini_api_key)
-        
-        # Create model instance
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        # For history tracking
-        self.chat = self.model.start_chat(history=[])
+        self.concurrency = max(1, settings.llm_concurrency)
+        self.queue_timeout = settings.llm_queue_timeout_seconds
+        self.request_timeout = settings.llm_request_timeout_seconds
+        self.max_retries = max(0, settings.llm_max_retries)
+        self.retry_base_delay = settings.llm_retry_base_delay_seconds
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self.waiting = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.queue_timeouts = 0
+
+    async def _generate(self, messages: list[dict[str, str]]) -> str:
+        raise NotImplementedError
+
+    async def _stream(self, messages: list[dict[str, str]]) -> AsyncIterator[str]:
+        # Providers without native streaming send the whole answer as one delta
+        yield await self._generate(messages)
+
+    def _retryable(self, error: Exception) -> bool:
+        return isinstance(error, (asyncio.TimeoutError, TimeoutError))
+
+    @asynccontextmanager
+    async def _slot(self):
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.queue_timeouts += 1
+            raise LLMUnavailableError(f"LLM busy: no slot free within {self.queue_timeout:g}s")
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        self.requests += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    async def _backoff(self, error: Exception, attempt: int) -> None:
+        if attempt >= self.max_retries or not self._retryable(error):
+            self.failures += 1
+            if self._retryable(error):
+                raise LLMUnavailableError(f"LLM request failed after {attempt + 1} attempts: {error!r}") from error
+            raise error
+        self.retries += 1
+        LLM_RETRIES.inc(provider=self.name)
+        await asyncio.sleep(self.retry_base_delay * (2 ** attempt) * (0.5 + random.random() / 2))
+
+    def _usage(self, prompt_tokens: int | None, completion_tokens: int | None) -> None:
+        # Called by providers with the token counts their API reports
+        if prompt_tokens:
+            LLM_TOKENS.inc(prompt_tokens, provider=self.name, kind="prompt")
+        if completion_tokens:
+            LLM_TOKENS.inc(completion_tokens, provider=self.name, kind="completion")
 
     async def generate(self, messages: list[dict[str, str]]) -> str:
+        started = time.perf_counter()
+        outcome = "error"
         try:
-            # Convert the message format to work with Gemini
-            last_user_message = next(
-                (msg["content"] for msg in reversed(messages) if msg["role"] == "user"),
-                None
-            )
-            
-            if not last_user_message:
-                return "No user message found"
-            
-            # Since Gemini's generate_content is synchronous, run it in a thread pool
-            response = await asyncio.to_thread(
-                self.chat.send_message,
-                last_user_message,
-                generation_config={"temperature": 0.2}
-            )
-            
-            return response.text
-            
-        except Exception as e:
-            print(f"Error in generate: {e}")
+            async with self._slot():
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        answer = await asyncio.wait_for(self._generate(messages), self.request_timeout)
+                        outcome = "ok"
+                        return answer
+                    except Exception as e:
+                        await self._backoff(e, attempt)
+        except LLMUnavailableError:
+            outcome = "unavailable"
+            raise
+        finally:
+            LLM_DURATION.observe(time.perf_counter() - started, provider=self.name, outcome=outcome)
+        raise AssertionError("unreachable")
+
+    async def generate_stream(self, messages: list[dict[str, str]]) -> AsyncIterator[str]:
+        """Yield the answer as text deltas while the model produces it.
+
+        Only failures before the first delta are retried; after that the caller has
+        already forwarded partial text. Every delta, not just the first, must arrive
+        within ``request_timeout`` of the previous one, so a stalled stream gives its
+        slot back instead of holding it forever.
+        """
+        began = time.perf_counter()
+        outcome = "error"
+        try:
+            async with self._slot():
+                for attempt in range(self.max_retries + 1):
+                    started = False
+                    stream = self._stream(messages)
+                    try:
+                        while True:
+                            delta = await asyncio.wait_for(anext(stream), self.request_timeout)
+                            started = True
+                            yield delta
+                    except StopAsyncIteration:
+                        outcome = "ok"
+                        return
+                    except Exception as e:
+                        if not started:
+                            await self._backoff(e, attempt)
+                            continue
+                        self.failures += 1
+                        if isinstance(e, asyncio.TimeoutError):
+                            raise LLMUnavailableError(
+                                f"LLM stream stalled: no delta within {self.request_timeout:g}s"
+                            ) from e
+                        raise
+                    finally:
+                        await stream.aclose()
+        except LLMUnavailableError:
+            outcome = "unavailable"
             raise
-        # Local naive fallback: extract sentences containing query keywords
+        finally:
+            LLM_DURATION.observe(time.perf_counter() - began, provider=self.name, outcome=outcome)
+
+    async def aclose(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "provider": self.name,
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "queue_timeouts": self.queue_timeouts,
+        }
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self):
+        super().__init__()
+        import google.generativeai as genai
+        from google.api_core import exceptions as gexc
+
+        genai.configure(api_key=settings.gemini_api_key)
+        # One model object per process; the SDK keeps its gRPC channel open across calls
+        self.model = genai.GenerativeModel(settings.gemini_model)
+        self._transient = (
+            gexc.ResourceExhausted,
+            gexc.TooManyRequests,
+            gexc.ServiceUnavailable,
+            gexc.DeadlineExceeded,
+            gexc.InternalServerError,
+        )
+
+    @staticmethod
+    def _contents(messages: list[dict[str, str]]) -> list[dict]:
+        # This SDK version has no system instruction; system text leads the first user turn.
+        # Gemini also wants alternating user/model turns, so consecutive ones are merged.
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        contents: list[dict] = []
+        for m in messages:
+            if m["role"] == "system":
+                continue
+            role = "model" if m["role"] == "assistant" else "user"
+            if contents and contents[-1]["role"] == role:
+                contents[-1]["parts"][0] += "\n\n" + m["content"]
+            else:
+                contents.append({"role": role, "parts": [m["content"]]})
+        if system:
+            if contents and contents[0]["role"] == "user":
+                contents[0]["parts"][0] = f"{system}\n\n{contents[0]['parts'][0]}"
+            else:
+                contents.insert(0, {"role": "user", "parts": [system]})
+        return contents
+
+    async def _generate(self, messages: list[dict[str, str]]) -> str:
+        response = await self.model.generate_content_async(
+            self._contents(messages), generation_config={"temperature": settings.llm_temperature}
+        )
+        # Older SDK versions don't surface usage metadata
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            self._usage(usage.prompt_token_count, usage.candidates_token_count)
+        return response.text
+
+    async def _stream(self, messages: list[dict[str, str]]) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(
+            self._contents(messages), generation_config={"temperature": settings.llm_temperature}, stream=True
+        )
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            self._usage(usage.prompt_token_count, usage.candidates_token_count)
+
+    def _retryable(self, error: Exception) -> bool:
+        return isinstance(error, self._transient) or super()._retryable(error)
+
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI chat completions, or OpenRouter through the same API."""
+
+    def __init__(self, openrouter: bool = False):
+        super().__init__()
+        import httpx
+        import openai
+
+        self.name = "openrouter" if openrouter else "openai"
+        # Pooled keep-alive connections sized to the concurrency limit; retries are ours
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+            timeout=self.request_timeout,
+        )
+        if openrouter:
+            headers = {"X-Title": settings.app_title}
+            if settings.app_public_url:
+                headers["HTTP-Referer"] = settings.app_public_url
+            self.client = openai.AsyncOpenAI(
+                api_key=settings.openrouter_key,
+                base_url=settings.openrouter_base_url,
+                default_headers=headers,
+                max_retries=0,
+                http_client=self._http,
+            )
+            self.model = settings.openrouter_model
+        else:
+            self.client = openai.AsyncOpenAI(api_key=settings.openai_api_key, max_retries=0, http_client=self._http)
+            self.model = settings.openai_model
+        self._transient = (
+            openai.RateLimitError,
+            openai.APITimeoutError,
+            openai.APIConnectionError,
+            openai.InternalServerError,
+        )
+
+    async def _generate(self, messages: list[dict[str, str]]) -> str:
+        response = await self.client.chat.completions.create(
+            model=self.model, messages=messages, temperature=settings.llm_temperature
+        )
+        if response.usage is not None:
+            self._usage(response.usage.prompt_tokens, response.usage.completion_tokens)
+        return response.choices[0].message.content or ""
+
+    async def _stream(self, messages: list[dict[str, str]]) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=settings.llm_temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for event in stream:
+            if event.choices and event.choices[0].delta.content:
+                yield event.choices[0].delta.content
+            if event.usage is not None:
+                # Sent in a final event with no choices
+                self._usage(event.usage.prompt_tokens, event.usage.completion_tokens)
+
+    def _retryable(self, error: Exception) -> bool:
+        return isinstance(error, self._transient) or super()._retryable(error)
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+
+class LocalProvider(LLMProvider):
+    """Offline, deterministic answers for development and load tests.
+
+    Picks the context sentences that share words with the question. An optional
+    fixed delay (``llm_local_latency_ms``) stands in for model latency.
+    """
+
+    name = "local"
+
+    def _answer(self, messages: list[dict[str, str]]) -> str:
         user_last = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
         keywords = {w.lower() for w in user_last.split() if len(w) > 3}
-        context = " ".join(m["content"] for m in messages if m["role"] == "system" and "Context:" in m["content"]) 
+        context = " ".join(m["content"] for m in messages if m["role"] == "system" and "Context:" in m["content"])
         sentences = context.split(". ")
         selected = [s for s in sentences if any(k in s.lower() for k in keywords)]
         if not selected:
             return "I don't know from the provided context."
         return ". ".join(selected)[:1200]
 
+    async def _generate(self, messages: list[dict[str, str]]) -> str:
+        if settings.llm_local_latency_ms > 0:
+            await asyncio.sleep(settings.llm_local_latency_ms / 1000)
+        answer = self._answer(messages)
+        # No tokenizer here; ~4 characters per token
+        self._usage(sum(len(m["content"]) for m in messages) // 4, len(answer) // 4)
+        return answer
+
+    async def _stream(self, messages: list[dict[str, str]]) -> AsyncIterator[str]:
+        answer = await self._generate(messages)
+        for start in range(0, len(answer), 16):
+            yield answer[start:start + 16]
+
+
+_provider: LLMProvider | None = None
+_provider_lock = threading.Lock()
+
+
+def get_llm_provider() -> LLMProvider:
+    """The process-wide provider selected by ``settings.llm_provider``."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = _build_provider()
+    return _provider
+
+
+def _build_provider() -> LLMProvider:
+    if settings.llm_provider == "gemini":
+        return GeminiProvider()
+    if settings.llm_provider in ("openai", "openrouter"):
+        return OpenAIProvider(openrouter=settings.llm_provider == "openrouter")
+    if settings.llm_provider == "local":
+        return LocalProvider()
+    raise ValueError(f"Unsupported LLM provider: {settings.llm_provider}")
+
+
+def existing_llm_provider() -> LLMProvider | None:
+    """The provider if something has built it already."""
+    return _provider
+
+
+async def close_llm_provider() -> None:
+    if _provider is not None:
+        await _provider.aclose()
+
+
+def _slot_gauge() -> dict[tuple[str, ...], float]:
+    if _provider is None:
+        return {}
+    return {("in_flight",): _provider.in_flight, ("waiting",): _provider.waiting}
+
+
+registry.register(
+    Gauge("rag_llm_slots", "LLM calls holding or waiting for a concurrency slot", ["state"], collect=_slot_gauge)
+)
@@ -1,90 +1,208 @@
 from __future__ import annotations
 
+import asyncio
+import time
 from datetime import datetime
-from typing import List
+from typing import Dict, List, Optional, Tuple
 import redis.asyncio as redis
-import json
+import orjson
 from ..config import settings
 from ..schemas import ChatMessage
+from .metrics import REDIS_DURATION, REDIS_ERRORS
+
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "Merge the previous summary and the new turns into one updated summary of at most "
+    "150 words. Keep facts, names, numbers and open questions; drop pleasantries."
+)
+
+# (timestamp, messages) of one stored list element
+Turn = Tuple[float, List[ChatMessage]]
 
 
 class ChatMemoryManager:
+    """Per-session chat history in Redis.
+
+    Each interaction is one list element, an orjson array ``[ts, user, assistant]``,
+    written with a single pipelined RPUSH/LTRIM/EXPIRE. Elements written by older
+    versions (one JSON object per message) are still read. Prompt reads fetch only
+    the tail they need. With ``chat_summary_enabled``, turns that have scrolled out of
+    the prompt window are folded into ``chat:<session>:summary`` in the background,
+    ``chat_summary_batch_turns`` at a time, so the prompt stays the same size however
+    long the session runs.
+    """
+
     def __init__(self):
         try:
             self.client = redis.Redis.from_url(
                 settings.redis_url,
-                decode_responses=True,
                 socket_timeout=5,
                 retry_on_timeout=True
             )
             self.max_turns = settings.chat_history_max_turns
             self.ttl = settings.chat_history_ttl_seconds
+            self.prompt_turns = settings.chat_history_prompt_turns
+            self.summary_enabled = settings.chat_summary_enabled
+            self.summary_batch = max(1, settings.chat_summary_batch_turns)
         except Exception as e:
             print(f"Failed to initialize Redis client: {e}")
             raise
+        self._summarizing: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
 
     def _key(self, session_id: str) -> str:
         return f"chat:{session_id}"
 
+    def _summary_key(self, session_id: str) -> str:
+        return f"chat:{session_id}:summary"
+
+    @property
+    def _keep(self) -> int:
+        # Turns must stay in the list until they have been folded into the summary
+        return max(self.max_turns, self.prompt_turns + self.summary_batch) if self.summary_enabled else self.max_turns
+
     async def add_interaction(self, session_id: str, user_message: str, assistant_message: str) -> None:
         key = self._key(session_id)
-        timestamp = datetime.utcnow().isoformat()
-        
         try:
-            # Store messages as JSON strings
-            user_msg = json.dumps({
-                "role": "user",
-                "content": user_message,
-                "timestamp": timestamp
-            })
-            assistant_msg = json.dumps({
-                "role": "assistant",
-                "content": assistant_message,
-                "timestamp": timestamp
-            })
-
-            async with self.client.pipeline(transaction=True) as pipe:
-                await pipe.rpush(key, user_msg)
-                await pipe.rpush(key, assistant_msg)
-                await pipe.expire(key, self.ttl)
-                # Trim to last N*2 messages (user+assistant pairs)
-                await pipe.ltrim(key, max(0, -2 * self.max_turns), -1)
-                await pipe.execute()
+            with REDIS_DURATION.time(component="chat_memory", op="add_interaction"):
+                async with self.client.pipeline(transaction=True) as pipe:
+                    pipe.rpush(key, orjson.dumps([time.time(), user_message, assistant_message]))
+                    pipe.ltrim(key, -self._keep, -1)
+                    pipe.expire(key, self.ttl)
+                    await pipe.execute()
         except redis.RedisError as e:
+            REDIS_ERRORS.inc(component="chat_memory", op="add_interaction")
             print(f"Redis error in add_interaction: {e}")
             raise
 
-    async def get_chat_history(self, session_id: str) -> List[ChatMessage]:
+    @staticmethod
+    def _parse(items: List[bytes]) -> List[Turn]:
+        turns: List[Turn] = []
+        for item in items:
+            try:
+                data = orjson.loads(item)
+                if isinstance(data, list):
+                    ts, user, assistant = data
+                    at = datetime.utcfromtimestamp(ts)
+                    messages = [
+                        ChatMessage.model_construct(role="user", content=user, timestamp=at),
+                        ChatMessage.model_construct(role="assistant", content=assistant, timestamp=at),
+                    ]
+                else:
+                    # One message per element, as written before the compact format
+                    at = datetime.fromisoformat(data["timestamp"])
+                    ts = (at - datetime(1970, 1, 1)).total_seconds()
+                    messages = [ChatMessage(role=data["role"], content=data["content"], timestamp=at)]
+                turns.append((ts, messages))
+            except (orjson.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+                print(f"Error parsing message: {e}")
+                continue
+        return turns
+
+    @staticmethod
+    def _flatten(turns: List[Turn]) -> List[ChatMessage]:
+        return [m for _, messages in turns for m in messages]
+
+    async def get_chat_history(self, session_id: str, turns: Optional[int] = None) -> List[ChatMessage]:
+        """The stored history, or only its last ``turns`` interactions."""
         key = self._key(session_id)
-        messages: List[ChatMessage] = []
-        
         try:
-            items = await self.client.lrange(key, 0, -1)
-            
-            for item in items:
-                try:
-                    data = json.loads(item)
-                    messages.append(
-                        ChatMessage(
-                            role=data["role"],
-                            content=data["content"],
-                            timestamp=datetime.fromisoformat(data["timestamp"])
-                        )
-                    )
-                except (json.JSONDecodeError, KeyError) as e:
-                    print(f"Error parsing message: {e}")
-                    continue
-                    
+            with REDIS_DURATION.time(component="chat_memory", op="get_chat_history"):
+                items = await self.client.lrange(key, -turns if turns else 0, -1)
         except redis.RedisError as e:
+            REDIS_ERRORS.inc(component="chat_memory", op="get_chat_history")
             print(f"Redis error in get_chat_history: {e}")
-            
-        return messages
+            return []
+        return self._flatten(self._parse(items))
+
+    async def get_prompt_histories(
+        self, session_ids: List[str]
+    ) -> Dict[str, Tuple[List[ChatMessage], Optional[str]]]:
+        """Recent history and rolling summary (if any) of several sessions in one round trip.
+
+        Without summaries this is the last ``chat_history_prompt_turns`` turns. With
+        them it is every turn not yet summarized, which stays below
+        ``prompt_turns + summary_batch``.
+        """
+        unique = list(dict.fromkeys(session_ids))
+        window = self.prompt_turns + self.summary_batch if self.summary_enabled else self.prompt_turns
+        try:
+            with REDIS_DURATION.time(component="chat_memory", op="get_prompt_histories"):
+                async with self.client.pipeline(transaction=False) as pipe:
+                    for session_id in unique:
+                        pipe.lrange(self._key(session_id), -window, -1)
+                        if self.summary_enabled:
+                            pipe.hmget(self._summary_key(session_id), "text", "through")
+                    results = await pipe.execute()
+        except redis.RedisError as e:
+            REDIS_ERRORS.inc(component="chat_memory", op="get_prompt_histories")
+            print(f"Redis error in get_prompt_histories: {e}")
+            return {session_id: ([], None) for session_id in unique}
+
+        step = 2 if self.summary_enabled else 1
+        histories: Dict[str, Tuple[List[ChatMessage], Optional[str]]] = {}
+        for i, session_id in enumerate(unique):
+            turns = self._parse(results[i * step])
+            if not self.summary_enabled:
+                histories[session_id] = (self._flatten(turns), None)
+                continue
+            text, through = results[i * step + 1]
+            summary = text.decode() if text else None
+            pending = [t for t in turns if t[0] > float(through or 0)]
+            if len(pending) >= window:
+                self._fold_later(session_id, summary, pending[: self.summary_batch])
+            histories[session_id] = (self._flatten(pending), summary)
+        return histories
+
+    async def get_prompt_history(self, session_id: str) -> Tuple[List[ChatMessage], Optional[str]]:
+        return (await self.get_prompt_histories([session_id]))[session_id]
+
+    def _fold_later(self, session_id: str, summary: Optional[str], turns: List[Turn]) -> None:
+        if session_id in self._summarizing:
+            return
+        self._summarizing.add(session_id)
+        task = asyncio.create_task(self._fold(session_id, summary, turns))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fold(self, session_id: str, summary: Optional[str], turns: List[Turn]) -> None:
+        from .llm import get_llm_provider
+
+        try:
+            transcript = "\n".join(f"{m.role}: {m.content}" for m in self._flatten(turns))
+            text = await get_llm_provider().generate([
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Previous summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"},
+            ])
+            key = self._summary_key(session_id)
+            with REDIS_DURATION.time(component="chat_memory", op="store_summary"):
+                async with self.client.pipeline(transaction=True) as pipe:
+                    pipe.hset(key, mapping={"text": text, "through": repr(turns[-1][0])})
+                    pipe.expire(key, self.ttl)
+                    await pipe.execute()
+        except Exception as e:
+            # The turns stay pending and are retried on the next read
+            print(f"Error summarizing chat {session_id}: {e}")
+        finally:
+            self._summarizing.discard(session_id)
 
     async def clear_history(self, session_id: str) -> None:
-        key = self._key(session_id)
         try:
-            await self.client.delete(key)
+            with REDIS_DURATION.time(component="chat_memory", op="clear_history"):
+                await self.client.delete(self._key(session_id), self._summary_key(session_id))
         except redis.RedisError as e:
+            REDIS_ERRORS.inc(component="chat_memory", op="clear_history")
             print(f"Redis error in clear_history: {e}")
             raise
 
+
+_memory: ChatMemoryManager | None = None
+
+
+def get_memory_manager() -> ChatMemoryManager:
+    """The process-wide chat memory, shared by the RAG service and the history endpoint."""
+    global _memory
+    if _memory is None:
+        _memory = ChatMemoryManager()
+    return _memory
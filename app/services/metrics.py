@@ -0,0 +1,345 @@
+from __future__ import annotations
+
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Iterable, Sequence
+
+
+# Latency buckets in seconds, 1 ms .. 60 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(self.labelnames, key)} {_num(value)}"
+
+
+class Gauge(_Metric):
+    """A settable gauge, or with ``collect`` one whose value is read at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        collect: Callable[[], dict[tuple[str, ...], float] | float] | None = None,
+    ):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._collect = collect
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def samples(self) -> Iterable[str]:
+        if self._collect is not None:
+            try:
+                collected = self._collect()
+            except Exception as e:
+                print(f"Error collecting metric {self.name}: {e}")
+                return
+            items = collected.items() if isinstance(collected, dict) else [((), collected)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(self.labelnames, key)} {_num(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            row[i] += 1
+            row[-1] += value
+
+    def time(self, **labels: Any) -> "_Timer":
+        return _Timer(self, labels)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = [(key, list(row)) for key, row in self._values.items()]
+        for key, row in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), row[:-1]):
+                cumulative += count
+                le = 'le="' + _num(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {_num(cumulative)}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_num(row[-1])}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {_num(cumulative)}"
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: dict[str, Any]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+def timed(histogram: Histogram, **labels: Any) -> Callable:
+    """Decorator observing the wall time of a sync or async function."""
+
+    def decorate(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started, **labels)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, **labels)
+
+        return wrapper
+
+    return decorate
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (0.0.4)."""
+        return "\n".join(m.render() for m in self._metrics.values()) + "\n"
+
+
+registry = MetricsRegistry()
+
+# HTTP
+HTTP_IN_FLIGHT = registry.register(
+    Gauge("rag_http_requests_in_flight", "Requests currently being handled", ["route"])
+)
+HTTP_REQUESTS = registry.register(
+    Counter("rag_http_requests_total", "Finished HTTP requests", ["method", "route", "status"])
+)
+HTTP_DURATION = registry.register(
+    Histogram("rag_http_request_duration_seconds", "Time to fully send the response", ["method", "route"])
+)
+
+# Embeddings
+EMBED_DURATION = registry.register(Histogram("rag_embed_duration_seconds", "Duration of one encode call"))
+EMBED_BATCH_SIZE = registry.register(
+    Histogram("rag_embed_batch_size", "Texts per encode call", buckets=SIZE_BUCKETS)
+)
+
+# Vector store
+VECTOR_DURATION = registry.register(
+    Histogram("rag_vector_store_duration_seconds", "Vector store call duration", ["store", "op"])
+)
+
+# SQL
+DB_QUERY_DURATION = registry.register(
+    Histogram("rag_db_query_duration_seconds", "SQL statement execution time", ["statement"])
+)
+
+# Redis
+REDIS_DURATION = registry.register(
+    Histogram("rag_redis_roundtrip_duration_seconds", "Redis round trips by operation", ["component", "op"])
+)
+REDIS_ERRORS = registry.register(Counter("rag_redis_errors_total", "Failed Redis round trips", ["component", "op"]))
+
+# LLM
+LLM_DURATION = registry.register(
+    Histogram("rag_llm_request_duration_seconds", "LLM call duration, queueing and retries included", ["provider", "outcome"])
+)
+LLM_TOKENS = registry.register(
+    Counter("rag_llm_tokens_total", "Tokens reported by the LLM API (estimated for the local provider)", ["provider", "kind"])
+)
+LLM_RETRIES = registry.register(Counter("rag_llm_retries_total", "LLM attempts retried after a transient error", ["provider"]))
+
+# Ingestion
+INGEST_STAGE = registry.register(
+    Histogram("rag_ingest_stage_seconds", "Time per ingestion stage per document", ["stage"])
+)
+INGEST_DOCUMENTS = registry.register(Counter("rag_ingest_documents_total", "Ingested documents", ["outcome"]))
+INGEST_CHUNKS = registry.register(Counter("rag_ingest_chunks_total", "Chunks stored by ingestion"))
+
+
+def observe_sql(statement: str, seconds: float) -> None:
+    # First keyword only (SELECT, INSERT, ...), keeping label cardinality bounded
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    DB_QUERY_DURATION.observe(seconds, statement=verb)
+
+
+def instrument_engine(engine: Any) -> None:
+    """Time every statement run on a SQLAlchemy engine (async engines via their sync_engine)."""
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        observe_sql(statement, time.perf_counter() - started)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        # after_cursor_execute doesn't run for a failed statement; drop its start time
+        conn = context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+
+HTTP_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "CONNECT", "TRACE"})
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware counting in-flight and finished HTTP requests.
+
+    Finished requests are labelled by their path template (``/rag/history/{session_id}``).
+    The template is only known after routing, so in-flight requests are labelled by
+    the first path segment instead, and only when some route of the app starts with
+    it (``/rag``, ``/ingest``...); any other path counts as "unmatched". Both keep
+    label cardinality bounded by the app's routes. Methods outside the standard set
+    are counted as "OTHER" for the same reason.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+        self._sections: frozenset[str] | None = None
+
+    @staticmethod
+    def _section(path: str) -> str:
+        return "/" + path.strip("/").split("/", 1)[0]
+
+    def _in_flight_label(self, scope: dict) -> str:
+        if self._sections is None:
+            routes = getattr(scope.get("app"), "routes", None)
+            if routes is None:
+                return "unmatched"
+            self._sections = frozenset(self._section(r.path) for r in routes if getattr(r, "path", None))
+        section = self._section(scope["path"])
+        return section if section in self._sections else "unmatched"
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        started = time.perf_counter()
+        section = self._in_flight_label(scope)
+        HTTP_IN_FLIGHT.inc(route=section)
+
+        async def send_wrapper(message: dict) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec(route=section)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"] if scope["method"] in HTTP_METHODS else "OTHER"
+            HTTP_REQUESTS.inc(method=method, route=route, status=status)
+            HTTP_DURATION.observe(time.perf_counter() - started, method=method, route=route)
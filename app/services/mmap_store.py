@@ -0,0 +1,363 @@
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Sequence
+
+import numpy as np
+
+from .quantization import Quantizer, get_quantizer
+from .types import RetrievedChunk, SearchFilter, VectorStore
+from ..config import settings
+
+
+INDEX_VERSION = 2
+META_V1_DTYPE = np.dtype([("id", "S36"), ("chunk_id", "<i8"), ("document_id", "<i8")])
+META_DTYPE = np.dtype([("id", "S36"), ("chunk_id", "<i8"), ("document_id", "<i8"), ("tenant", "<u8")])
+TOMBSTONE = -1  # chunk_id/document_id of a deleted row
+
+
+def tenant_key(tenant_id: str | None) -> int:
+    # Fixed-width stand-in for the tenant string; 0 means "no tenant"
+    if tenant_id is None:
+        return 0
+    return int.from_bytes(hashlib.blake2b(tenant_id.encode("utf-8"), digest_size=8).digest(), "little") | 1
+
+
+class MmapVectorStore(VectorStore):
+    """Exact cosine search over an append-only, memory-mapped float32 matrix.
+
+    ``vectors.f32`` holds L2-normalized rows and ``meta.bin`` a parallel array of
+    (point id, chunk id, document id, tenant key) records. Both files are mapped read-only, so
+    every worker process on the host shares the same page-cache pages and startup
+    costs nothing beyond an ``mmap``. Appends are serialized across processes with
+    ``flock``; readers pick up new rows by re-mapping when the files grow. Chunk text
+    is not stored; callers fill it in from the database.
+
+    With a quantization mode (``int8`` or ``binary``) a parallel ``codes.<mode>`` file
+    is kept as well. Search scans only the compact codes, then rescores the best
+    ``top_k * rescore_oversampling`` candidates against the float32 rows, so the full
+    vectors are paged in for a handful of rows per query instead of all of them.
+
+    Filtered searches use in-memory row lists per document (and documents per
+    tenant), built lazily from ``meta.bin``, and only score the matching rows.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        dim: int | None = None,
+        block_rows: int | None = None,
+        quantization: str | None = None,
+        rescore_oversampling: float | None = None,
+    ):
+        self.path = path or settings.mmap_index_dir
+        self.dim = dim or settings.embedding_dim
+        self.block_rows = block_rows or settings.mmap_search_block_rows
+        self.quantizer: Quantizer | None = get_quantizer(
+            settings.vector_quantization if quantization is None else quantization, self.dim
+        )
+        self.oversampling = rescore_oversampling or settings.vector_rescore_oversampling
+        os.makedirs(self.path, exist_ok=True)
+        self._vectors_path = os.path.join(self.path, "vectors.f32")
+        self._meta_path = os.path.join(self.path, "meta.bin")
+        self._codes_path = os.path.join(self.path, f"codes.{self.quantizer.mode}") if self.quantizer else None
+        self._lock_path = os.path.join(self.path, ".lock")
+        self._lock = threading.Lock()
+        self._count = 0
+        self._vectors: np.ndarray = np.empty((0, self.dim), dtype=np.float32)
+        self._meta: np.ndarray = np.empty(0, dtype=META_DTYPE)
+        self._codes: np.ndarray | None = None
+        self._postings: dict[int, list[np.ndarray]] = {}
+        self._tenant_docs: dict[int, set[int]] = {}
+        self._indexed = 0
+        self._check_header()
+        self._refresh()
+
+    def _check_header(self) -> None:
+        header_path = os.path.join(self.path, "index.json")
+        with self._file_lock():
+            if os.path.exists(header_path):
+                with open(header_path) as f:
+                    header = json.load(f)
+                if header.get("dim") == self.dim and header.get("version") == 1:
+                    self._migrate_v1(header_path)
+                    header["version"] = INDEX_VERSION
+                if header.get("dim") != self.dim or header.get("version") != INDEX_VERSION:
+                    raise ValueError(
+                        f"Vector index at {self.path} has dim={header.get('dim')} version={header.get('version')}, "
+                        f"expected dim={self.dim} version={INDEX_VERSION}"
+                    )
+            else:
+                with open(header_path, "w") as f:
+                    json.dump({"version": INDEX_VERSION, "dim": self.dim}, f)
+            for p in (self._vectors_path, self._meta_path, self._codes_path):
+                if p is not None:
+                    open(p, "ab").close()
+            self._backfill_codes()
+
+    def _migrate_v1(self, header_path: str) -> None:
+        # Version 1 metadata had no tenant column; existing rows get "no tenant"
+        old = np.fromfile(self._meta_path, dtype=META_V1_DTYPE) if os.path.exists(self._meta_path) else None
+        if old is not None:
+            new = np.zeros(old.shape[0], dtype=META_DTYPE)
+            for name in META_V1_DTYPE.names:
+                new[name] = old[name]
+            tmp = f"{self._meta_path}.tmp"
+            new.tofile(tmp)
+            os.replace(tmp, self._meta_path)
+        with open(header_path, "w") as f:
+            json.dump({"version": INDEX_VERSION, "dim": self.dim}, f)
+
+    def _rows_on_disk(self) -> int:
+        rows = min(
+            os.path.getsize(self._vectors_path) // (self.dim * 4),
+            os.path.getsize(self._meta_path) // META_DTYPE.itemsize,
+        )
+        if self.quantizer is not None:
+            rows = min(rows, os.path.getsize(self._codes_path) // self._code_bytes())
+        return rows
+
+    def _code_bytes(self) -> int:
+        return self.quantizer.width * self.quantizer.dtype.itemsize
+
+    def _backfill_codes(self, block: int = 65536) -> None:
+        # Quantization enabled on an index built without it: encode the existing rows once
+        if self.quantizer is None:
+            return
+        vector_rows = os.path.getsize(self._vectors_path) // (self.dim * 4)
+        code_rows = os.path.getsize(self._codes_path) // self._code_bytes()
+        if code_rows >= vector_rows:
+            return
+        vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(vector_rows, self.dim))
+        with open(self._codes_path, "r+b") as cf:
+            cf.truncate(code_rows * self._code_bytes())
+            cf.seek(0, os.SEEK_END)
+            for start in range(code_rows, vector_rows, block):
+                cf.write(self.quantizer.encode(np.asarray(vectors[start:start + block])).tobytes())
+        del vectors
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        # Rows are visible once the vector, metadata (and code) records are all on disk
+        count = self._rows_on_disk()
+        if count == self._count:
+            return
+        with self._lock:
+            if count <= self._count:
+                return
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(count, self.dim))
+            self._meta = np.memmap(self._meta_path, dtype=META_DTYPE, mode="r", shape=(count,))
+            if self.quantizer is not None:
+                self._codes = np.memmap(
+                    self._codes_path, dtype=self.quantizer.dtype, mode="r", shape=(count, self.quantizer.width)
+                )
+            self._count = count
+
+    def __len__(self) -> int:
+        self._refresh()
+        return self._count
+
+    def upsert(self, ids: Sequence[str], vectors: np.ndarray, payloads: Sequence[dict]) -> None:
+        """Append points. Ids are assumed new (ingestion mints a uuid4 per chunk)."""
+        if len(ids) == 0:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = np.ascontiguousarray(vectors / np.maximum(norms, 1e-12), dtype="<f4")
+        meta = np.empty(len(ids), dtype=META_DTYPE)
+        meta["id"] = [str(i).encode("ascii") for i in ids]
+        meta["chunk_id"] = [int(p["chunk_id"]) for p in payloads]
+        meta["document_id"] = [int(p["document_id"]) for p in payloads]
+        meta["tenant"] = [tenant_key(p.get("tenant_id")) for p in payloads]
+
+        codes = self.quantizer.encode(vectors) if self.quantizer is not None else None
+
+        with self._file_lock():
+            # Trim a torn write from a crashed appender so the files stay row-aligned
+            rows = self._rows_on_disk()
+            files = [(self._vectors_path, self.dim * 4, vectors), (self._meta_path, META_DTYPE.itemsize, meta)]
+            if codes is not None:
+                files.append((self._codes_path, self._code_bytes(), codes))
+            for path, row_bytes, data in files:
+                with open(path, "r+b") as f:
+                    f.truncate(rows * row_bytes)
+                    f.seek(0, os.SEEK_END)
+                    f.write(data.tobytes())
+                    f.flush()
+        self._refresh()
+
+    def delete(self, ids: Sequence[str]) -> None:
+        """Tombstone points in place: the files are append-only, so a deleted row keeps its
+        slot with a zero vector and chunk id -1, and is left out of results."""
+        if len(ids) == 0:
+            return
+        wanted = np.array([str(i).encode("ascii") for i in ids], dtype="S36")
+        tomb = np.zeros(1, dtype=META_DTYPE)
+        tomb["chunk_id"] = tomb["document_id"] = TOMBSTONE
+        zero = np.zeros((1, self.dim), dtype="<f4")
+        files = [(self._vectors_path, self.dim * 4, zero.tobytes())]
+        if self.quantizer is not None:
+            files.append((self._codes_path, self._code_bytes(), self.quantizer.encode(zero).tobytes()))
+        with self._file_lock():
+            self._refresh()
+            rows = np.flatnonzero(np.isin(self._meta["id"], wanted))
+            for row in rows.tolist():
+                tomb["id"] = self._meta[row]["id"]
+                for path, row_bytes, data in files + [(self._meta_path, META_DTYPE.itemsize, tomb.tobytes())]:
+                    with open(path, "r+b") as f:
+                        f.seek(row * row_bytes)
+                        f.write(data)
+
+    def count(self) -> int:
+        return len(self)
+
+    def iter_points(self, batch_size: int = 10_000) -> Iterator[tuple[list[str], np.ndarray, list[dict]]]:
+        self._refresh()
+        for start in range(0, self._count, batch_size):
+            meta = self._meta[start:start + batch_size]
+            live = meta["chunk_id"] != TOMBSTONE
+            meta = meta[live]
+            yield (
+                [i.decode("ascii") for i in meta["id"]],
+                np.array(self._vectors[start:start + batch_size])[live],
+                [{"chunk_id": int(c), "document_id": int(d)} for c, d in zip(meta["chunk_id"], meta["document_id"])],
+            )
+
+    def _index_rows(self) -> None:
+        # Extend the per-document row lists with rows appended since the last filtered query
+        with self._lock:
+            start, end = self._indexed, self._count
+            if end <= start:
+                return
+            meta = self._meta[start:end]
+            docs = meta["document_id"]
+            order = np.argsort(docs, kind="stable")
+            uniq, first = np.unique(docs[order], return_index=True)
+            for doc, rows in zip(uniq.tolist(), np.split(order + start, first[1:])):
+                self._postings.setdefault(doc, []).append(rows)
+            pairs = np.unique(np.stack([meta["tenant"], docs.astype(np.uint64)], axis=1), axis=0)
+            for tenant, doc in pairs.tolist():
+                if tenant:
+                    self._tenant_docs.setdefault(tenant, set()).add(doc)
+            self._indexed = end
+
+    def _filter_rows(self, filters: SearchFilter) -> np.ndarray:
+        self._index_rows()
+        docs = set(filters.document_ids) if filters.document_ids is not None else None
+        parts: list[np.ndarray] = []
+        with self._lock:
+            if filters.tenant_id is not None:
+                tenant_docs = self._tenant_docs.get(tenant_key(filters.tenant_id), set())
+                docs = set(tenant_docs) if docs is None else docs & tenant_docs
+            for doc in docs:
+                rows = self._postings.get(doc)
+                if rows:
+                    if len(rows) > 1:
+                        rows[:] = [np.concatenate(rows)]
+                    parts.append(rows[0])
+        return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+    def _top_rows(self, score_block, k: int, rows: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        # Blocked scan over all rows, or over the given (sorted) row ids; per-block
+        # argpartition keeps at most k candidates per block
+        total = self._count if rows is None else rows.shape[0]
+        cand_rows: list[np.ndarray] = []
+        cand_scores: list[np.ndarray] = []
+        for start in range(0, total, self.block_rows):
+            end = min(start + self.block_rows, total)
+            sel = slice(start, end) if rows is None else rows[start:end]
+            scores = score_block(sel)
+            kk = min(k, scores.shape[0])
+            idx = np.argpartition(scores, -kk)[-kk:]
+            cand_rows.append(idx + start if rows is None else sel[idx])
+            cand_scores.append(scores[idx])
+        if not cand_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        all_rows = np.concatenate(cand_rows)
+        scores = np.concatenate(cand_scores)
+        order = np.argsort(-scores, kind="stable")[:k]
+        return all_rows[order], scores[order]
+
+    def _search(self, q: np.ndarray, top_k: int, rows: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        if self.quantizer is None:
+            return self._top_rows(lambda sel: self._vectors[sel] @ q, top_k, rows)
+        prepared = self.quantizer.prepare(q)
+        n_candidates = max(top_k, int(top_k * self.oversampling))
+        cand, _ = self._top_rows(lambda sel: self.quantizer.scores(self._codes[sel], prepared), n_candidates, rows)
+        # Rescore candidates against the full-precision rows, read in file order
+        cand = np.sort(cand)
+        exact = self._vectors[cand] @ q
+        order = np.argsort(-exact, kind="stable")[:top_k]
+        return cand[order], exact[order]
+
+    def _to_results(self, rows: np.ndarray, scores: np.ndarray) -> list[RetrievedChunk]:
+        meta = self._meta[rows]
+        return [
+            RetrievedChunk(chunk_id=int(m["chunk_id"]), document_id=int(m["document_id"]), text="", score=float(s))
+            for m, s in zip(meta, scores)
+            if m["chunk_id"] != TOMBSTONE
+        ]
+
+    def query(self, embedding: np.ndarray, top_k: int, filters: SearchFilter | None = None) -> list[RetrievedChunk]:
+        return self.query_batch(np.asarray(embedding, dtype=np.float32).reshape(1, self.dim), top_k, filters)[0]
+
+    def query_batch(
+        self, embeddings: np.ndarray, top_k: int, filters: SearchFilter | None = None
+    ) -> list[list[RetrievedChunk]]:
+        self._refresh()
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        if self._count == 0 or top_k <= 0:
+            return [[] for _ in range(queries.shape[0])]
+        rows = self._filter_rows(filters) if filters is not None else None
+        if rows is not None and rows.shape[0] == 0:
+            return [[] for _ in range(queries.shape[0])]
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        if self.quantizer is not None or queries.shape[0] == 1:
+            return [self._to_results(*self._search(q, top_k, rows)) for q in queries]
+        top_rows, top_scores = self._search_many(queries, top_k, rows)
+        return [self._to_results(top_rows[:, j], top_scores[:, j]) for j in range(queries.shape[0])]
+
+    def _search_many(
+        self, queries: np.ndarray, k: int, rows: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # Every block is read once and scored against all queries with one matmul;
+        # block height shrinks with the batch so the score matrix stays ~64 MB
+        m = queries.shape[0]
+        block_rows = max(1024, min(self.block_rows, (1 << 24) // m))
+        total = self._count if rows is None else rows.shape[0]
+        cand_rows: list[np.ndarray] = []
+        cand_scores: list[np.ndarray] = []
+        for start in range(0, total, block_rows):
+            end = min(start + block_rows, total)
+            base = np.arange(start, end) if rows is None else rows[start:end]
+            scores = self._vectors[start:end] @ queries.T if rows is None else self._vectors[base] @ queries.T
+            kk = min(k, scores.shape[0])
+            idx = np.argpartition(scores, -kk, axis=0)[-kk:]
+            cand_rows.append(base[idx])
+            cand_scores.append(np.take_along_axis(scores, idx, axis=0))
+        all_rows = np.concatenate(cand_rows, axis=0)
+        scores = np.concatenate(cand_scores, axis=0)
+        order = np.argsort(-scores, axis=0, kind="stable")[:k]
+        return np.take_along_axis(all_rows, order, axis=0), np.take_along_axis(scores, order, axis=0)
+
+    def memory_stats(self) -> dict:
+        self._refresh()
+        return {
+            "points": self._count,
+            "vector_bytes": self._count * self.dim * 4,
+            "code_bytes": self._count * self._code_bytes() if self.quantizer is not None else 0,
+            "quantization": self.quantizer.mode if self.quantizer is not None else "none",
+        }
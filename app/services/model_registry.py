@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import os
+import resource
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any
+
+from sentence_transformers import SentenceTransformer
+
+from ..config import settings
+
+
+def _rss_bytes() -> int:
+    # Current resident set size; /proc is exact on Linux, ru_maxrss is a peak-based fallback
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _param_bytes(model: Any) -> int:
+    try:
+        return sum(p.numel() * p.element_size() for p in model.parameters())
+    except Exception:
+        return 0
+
+
+@dataclass
+class LoadedModel:
+    name: str
+    model: SentenceTransformer
+    load_seconds: float
+    param_bytes: int
+    rss_delta_bytes: int
+    loaded_at: datetime = field(default_factory=datetime.utcnow)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "load_seconds": round(self.load_seconds, 3),
+            "param_bytes": self.param_bytes,
+            "rss_delta_bytes": self.rss_delta_bytes,
+            "loaded_at": self.loaded_at.isoformat(),
+        }
+
+
+class ModelRegistry:
+    """Process-wide cache of embedding models, each loaded at most once."""
+
+    def __init__(self):
+        self._models: dict[str, LoadedModel] = {}
+        self._lock = threading.Lock()
+        self._loading: dict[str, threading.Lock] = {}
+
+    def get(self, name: str | None = None) -> SentenceTransformer:
+        return self.entry(name).model
+
+    def entry(self, name: str | None = None) -> LoadedModel:
+        name = name or settings.embedding_model_name
+        loaded = self._models.get(name)
+        if loaded is not None:
+            return loaded
+
+        with self._lock:
+            name_lock = self._loading.setdefault(name, threading.Lock())
+        # Concurrent callers for the same model wait here instead of loading it again
+        with name_lock:
+            loaded = self._models.get(name)
+            if loaded is None:
+                loaded = self._load(name)
+                self._models[name] = loaded
+        return loaded
+
+    def _load(self, name: str) -> LoadedModel:
+        rss_before = _rss_bytes()
+        started = time.perf_counter()
+        model = SentenceTransformer(name)
+        elapsed = time.perf_counter() - started
+        return LoadedModel(
+            name=name,
+            model=model,
+            load_seconds=elapsed,
+            param_bytes=_param_bytes(model),
+            rss_delta_bytes=max(0, _rss_bytes() - rss_before),
+        )
+
+    def register(self, name: str, model: Any) -> None:
+        """Install an already constructed model, e.g. a local stand-in."""
+        with self._lock:
+            self._models[name] = LoadedModel(
+                name=name, model=model, load_seconds=0.0, param_bytes=_param_bytes(model), rss_delta_bytes=0
+            )
+
+    def preload(self, names: list[str] | None = None) -> None:
+        for name in names or [settings.embedding_model_name]:
+            self.entry(name)
+
+    def is_loaded(self, name: str | None = None) -> bool:
+        return (name or settings.embedding_model_name) in self._models
+
+    def stats(self) -> list[dict]:
+        return [m.stats() for m in list(self._models.values())]
+
+
+model_registry = ModelRegistry()
+
+
+def get_embedding_model(name: str | None = None) -> SentenceTransformer:
+    return model_registry.get(name)
+
+
+def get_tokenizer(name: str | None = None) -> Any:
+    """The fast tokenizer of a registered embedding model, if it has one."""
+    return getattr(model_registry.get(name), "tokenizer", None)
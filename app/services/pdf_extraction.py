@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from io import StringIO
+from typing import Iterator
+
+from ..config import settings
+
+
+# Worker-side functions: kept at module level and free of heavy imports so that
+# spawned pool processes start quickly.
+
+def _count_pages(path: str) -> int:
+    from pdfminer.pdfpage import PDFPage
+
+    with open(path, "rb") as fp:
+        return sum(1 for _ in PDFPage.get_pages(fp, caching=False))
+
+
+def _extract_page_range(path: str, start: int, end: int) -> list[str]:
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    texts: list[str] = []
+    output = StringIO()
+    rsrcmgr = PDFResourceManager(caching=True)
+    device = TextConverter(rsrcmgr, output, laparams=LAParams())
+    interpreter = PDFPageInterpreter(rsrcmgr, device)
+    try:
+        with open(path, "rb") as fp:
+            for page in PDFPage.get_pages(fp, pagenos=set(range(start, end)), caching=False):
+                interpreter.process_page(page)
+                texts.append(output.getvalue())
+                output.seek(0)
+                output.truncate(0)
+    finally:
+        device.close()
+    return texts
+
+
+class PdfExtractor:
+    """Extracts PDF text in parallel page ranges on a process pool.
+
+    Pages come back in document order as ``(page_number, text)`` with 1-based page
+    numbers. A document that does not finish within ``timeout`` seconds raises
+    ``ValueError`` and the pool is retired: later documents get a fresh one, while
+    documents already running on the old pool finish there. Its workers, including
+    the stuck one, are killed once the last of them is done.
+    """
+
+    def __init__(self, workers: int | None = None, pages_per_task: int | None = None, timeout: float | None = None):
+        self.workers = workers or settings.pdf_extract_workers or os.cpu_count() or 1
+        self.pages_per_task = max(1, pages_per_task or settings.pdf_pages_per_task)
+        self.timeout = timeout or settings.pdf_extract_timeout_seconds
+        self._pool: ProcessPoolExecutor | None = None
+        self._users: dict[ProcessPoolExecutor, int] = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn rather than fork: the parent holds model and event-loop threads
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            self._users[self._pool] = self._users.get(self._pool, 0) + 1
+            return self._pool
+
+    def _release(self, pool: ProcessPoolExecutor) -> None:
+        with self._lock:
+            self._users[pool] -= 1
+            if self._users[pool] > 0 or pool is self._pool:
+                return
+            del self._users[pool]
+        self._terminate(pool)
+
+    def _retire(self, pool: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+
+    @staticmethod
+    def _terminate(pool: ProcessPoolExecutor) -> None:
+        for proc in list((getattr(pool, "_processes", None) or {}).values()):
+            proc.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+            retired = [p for p in self._users if p is not pool]
+            self._users.clear()
+        for p in retired:
+            self._terminate(p)
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _result(self, pool: ProcessPoolExecutor, future: Future, deadline: float):
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            self._retire(pool)
+            raise ValueError(f"PDF extraction timed out after {self.timeout:g}s")
+        except BrokenProcessPool:
+            self._retire(pool)
+            raise ValueError("PDF extraction worker crashed")
+
+    def iter_pages(self, path: str) -> Iterator[tuple[int, str]]:
+        """Blocking generator; run it off the event loop."""
+        deadline = time.monotonic() + self.timeout
+        pool = self._acquire()
+        in_flight: deque[tuple[int, Future]] = deque()
+        try:
+            try:
+                num_pages = self._result(pool, pool.submit(_count_pages, path), deadline)
+            except ValueError:
+                raise
+            except Exception as e:
+                raise ValueError(f"Failed to extract text from PDF: {str(e)}")
+
+            # Keep only a window of ranges in flight so finished pages don't pile up
+            # faster than the chunker consumes them.
+            starts = iter(range(0, num_pages, self.pages_per_task))
+
+            def submit_next() -> None:
+                start = next(starts, None)
+                if start is not None:
+                    end = min(start + self.pages_per_task, num_pages)
+                    in_flight.append((start, pool.submit(_extract_page_range, path, start, end)))
+
+            for _ in range(self.workers * 2):
+                submit_next()
+            while in_flight:
+                start, future = in_flight.popleft()
+                try:
+                    texts = self._result(pool, future, deadline)
+                except ValueError:
+                    raise
+                except Exception as e:
+                    raise ValueError(f"Failed to extract text from PDF: {str(e)}")
+                submit_next()
+                for offset, text in enumerate(texts):
+                    yield start + offset + 1, text
+        finally:
+            # Only this document's queued ranges; other documents keep using the pool
+            for _, future in in_flight:
+                future.cancel()
+            self._release(pool)
+
+
+pdf_extractor = PdfExtractor()
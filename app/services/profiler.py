@@ -0,0 +1,384 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable
+from urllib.parse import parse_qs
+
+from ..config import settings
+
+
+PROFILE_HEADER = "x-profile"
+PROFILE_ID = re.compile(r"^[0-9T]+-[0-9a-f]{8}$")
+_TOP_FUNCTIONS = 30
+
+# Longest first, so site-packages wins over a parent directory that is also on sys.path
+_PATH_PREFIXES = sorted({os.path.abspath(p) + os.sep for p in sys.path if p}, key=len, reverse=True)
+_labels: dict[Any, str] = {}
+
+
+def _label(code: Any) -> str:
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        for prefix in _PATH_PREFIXES:
+            if filename.startswith(prefix):
+                filename = filename[len(prefix):]
+                break
+        name = getattr(code, "co_qualname", code.co_name)
+        # ';' separates frames in the collapsed format
+        label = _labels[code] = f"{name} ({filename}:{code.co_firstlineno})".replace(";", ",")
+    return label
+
+
+def _thread_frames(frame: Any) -> list[Any]:
+    """A thread's Python frames, outermost first."""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _coro_frames(task: asyncio.Task) -> tuple[list[Any], Any]:
+    """Frames of a suspended task's await chain, outermost first, and the future it waits on."""
+    frames: list[Any] = []
+    coro = task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    # The chain ends in a future's iterator; the task itself knows the future (a private
+    # attribute, so the leaf is just "[await]" where it is missing)
+    return frames, getattr(task, "_fut_waiter", None)
+
+
+def _executor_future(future: Any) -> concurrent.futures.Future | None:
+    # run_in_executor/to_thread chain the asyncio future to a concurrent one; the
+    # cancellation callback they register closes over it. These are asyncio internals:
+    # if their shape differs on this Python, the task just shows as awaiting a future.
+    try:
+        for entry in getattr(future, "_callbacks", None) or ():
+            callback = entry[0] if isinstance(entry, tuple) else entry
+            for cell in getattr(callback, "__closure__", None) or ():
+                try:
+                    value = cell.cell_contents
+                except ValueError:
+                    continue
+                if isinstance(value, concurrent.futures.Future):
+                    return value
+    except Exception:
+        pass
+    return None
+
+
+def _worker_stacks(frames: dict[int, Any], skip: set[int]) -> dict[concurrent.futures.Future, list[Any]]:
+    """Executor threads busy with a work item: its future -> the frames it is running."""
+    busy = {}
+    for ident, frame in frames.items():
+        if ident in skip:
+            continue
+        stack = _thread_frames(frame)
+        for i, f in enumerate(stack):
+            if f.f_code.co_name == "run" and f.f_code.co_filename.endswith(os.path.join("concurrent", "futures", "thread.py")):
+                # The work item is the frame's ``self``; without it the thread is not attributed
+                try:
+                    future = getattr(f.f_locals.get("self"), "future", None)
+                except Exception:
+                    future = None
+                if future is not None:
+                    busy[future] = stack[i + 1:]
+                break
+    return busy
+
+
+# Profiles in progress; their task sets are extended by the task factory below
+_active: set["RequestProfile"] = set()
+_previous_factory: Callable | None = None
+
+
+def _task_factory(loop: asyncio.AbstractEventLoop, coro: Any, **kwargs: Any) -> asyncio.Task:
+    if _previous_factory is not None:
+        task = _previous_factory(loop, coro, **kwargs)
+    else:
+        task = asyncio.Task(coro, loop=loop, **kwargs)
+    parent = asyncio.current_task(loop)
+    if parent is not None:
+        for profile in _active:
+            if parent in profile.tasks:
+                profile.tasks[task] = parent
+    return task
+
+
+class RequestProfile:
+    """Wall-clock sampling profile of one request, across the tasks and threads it uses.
+
+    A background thread samples every ``profiling_interval_ms``. Each sample records,
+    for every live task the request spawned (tracked through the loop's task factory),
+    the task's stack prefixed with the stack of the task that created it. A running task
+    contributes its real thread stack. A suspended one contributes its await chain, plus
+    the worker thread's stack when it waits on ``asyncio.to_thread``. Otherwise it ends
+    in an ``[await ...]`` marker, so time spent waiting on I/O shows up too. Tasks only
+    waiting on their own children are left to the children. On ``stop`` the samples are
+    written to ``profiling_dir`` in the background: ``<id>.collapsed`` (folded stacks for
+    flamegraph.pl, speedscope and the like) and ``<id>.json`` (request details and the
+    top functions).
+    """
+
+    def __init__(self, scope: dict, trigger: str):
+        self.id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.method = scope.get("method", "")
+        self.path = scope.get("path", "")
+        self.trigger = trigger
+        self.interval = max(0.001, settings.profiling_interval_ms / 1000)
+        self.tasks: dict[asyncio.Task, asyncio.Task | None] = {}
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        self.ticks = 0
+        self.status = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{self.id}", daemon=True)
+
+    def start(self) -> None:
+        global _previous_factory
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        task = asyncio.current_task()
+        if task is not None:
+            self.tasks[task] = None
+        if not _active and self.loop.get_task_factory() is not _task_factory:
+            _previous_factory = self.loop.get_task_factory()
+            self.loop.set_task_factory(_task_factory)
+        _active.add(self)
+        self.started = time.perf_counter()
+        self.started_at = datetime.utcnow()
+        self._thread.start()
+
+    def stop(self, status: int) -> None:
+        self.duration = time.perf_counter() - self.started
+        self.status = status
+        _active.discard(self)
+        if not _active and self.loop.get_task_factory() is _task_factory:
+            self.loop.set_task_factory(_previous_factory)
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except Exception as e:
+                # Frames change under us; a torn sample is dropped, not fatal
+                print(f"Profiler sample failed: {e!r}")
+        self.tasks.clear()
+        try:
+            self._write()
+        except OSError as e:
+            print(f"Failed to write profile {self.id}: {e}")
+
+    def _sample(self) -> None:
+        self.ticks += 1
+        frames = sys._current_frames()
+        running = asyncio.current_task(self.loop)
+        tasks = [(t, p) for t, p in self.tasks.copy().items() if not t.done()]
+        parents = {p for _, p in tasks if p is not None}
+
+        chains: dict[asyncio.Task, tuple[list[Any], Any]] = {}
+        for task, _ in tasks:
+            if task is running and self.loop_thread in frames:
+                stack = _thread_frames(frames[self.loop_thread])
+                root = getattr(task.get_coro(), "cr_frame", None)
+                cut = next((i for i, f in enumerate(stack) if f is root), None)
+                chains[task] = (stack[cut:] if cut is not None else stack, None)
+            else:
+                chains[task] = _coro_frames(task)
+            # Leave out the server and middleware frames the request passed through
+            entry = next((i for i, f in enumerate(chains[task][0]) if f.f_code is _ENTRY), None)
+            if entry is not None:
+                chains[task] = (chains[task][0][entry + 1:], chains[task][1])
+
+        pending = {t: _executor_future(leaf) for t, (_, leaf) in chains.items() if isinstance(leaf, asyncio.Future)}
+        workers = (
+            _worker_stacks(frames, {self.loop_thread, threading.get_ident()})
+            if any(pending.values()) else {}
+        )
+
+        def prefix(task: asyncio.Task | None) -> list[str]:
+            labels: list[str] = []
+            while task is not None and task in chains:
+                labels = [_label(f.f_code) for f in chains[task][0]] + labels
+                task = self.tasks.get(task)
+            return labels
+
+        for task, parent in tasks:
+            frames_, leaf = chains[task]
+            labels = prefix(parent) + [_label(f.f_code) for f in frames_]
+            if task is running:
+                pass
+            elif pending.get(task) is not None:
+                thread = workers.get(pending[task])
+                labels += ["[to_thread]"] + [_label(f.f_code) for f in thread] if thread else ["[queued for thread]"]
+            elif task in parents:
+                continue  # waiting on the tasks it spawned, which are sampled themselves
+            else:
+                labels.append(f"[await {type(leaf).__name__}]" if leaf is not None else "[await]")
+            if labels:
+                self.stacks[tuple(labels)] += 1
+
+    def summary(self) -> dict:
+        own: Counter[str] = Counter()
+        total: Counter[str] = Counter()
+        for stack, n in self.stacks.items():
+            own[stack[-1]] += n
+            for label in set(stack):
+                total[label] += n
+        samples = sum(self.stacks.values())
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "trigger": self.trigger,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 2),
+            "interval_ms": round(self.interval * 1000, 3),
+            "ticks": self.ticks,
+            "samples": samples,
+            "top_functions": [
+                {
+                    "function": label,
+                    "self": n,
+                    "total": total[label],
+                    "self_pct": round(100 * n / samples, 1),
+                }
+                for label, n in own.most_common(_TOP_FUNCTIONS)
+            ],
+        }
+
+    def _write(self) -> None:
+        directory = settings.profiling_dir
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, self.id)
+        with open(base + ".collapsed", "w") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{';'.join(stack)} {n}\n")
+        with open(base + ".json", "w") as f:
+            json.dump(self.summary(), f, indent=2)
+        _prune(directory, settings.profiling_keep)
+
+
+def _prune(directory: str, keep: int) -> None:
+    # Ids start with a timestamp, so name order is age order
+    ids = sorted(name[:-5] for name in os.listdir(directory) if name.endswith(".json"))
+    for old in ids[: max(0, len(ids) - keep)]:
+        for ext in (".json", ".collapsed"):
+            try:
+                os.remove(os.path.join(directory, old + ext))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(limit: int = 20) -> list[dict]:
+    """Summaries of the most recent profiles, newest first."""
+    directory = settings.profiling_dir
+    if not os.path.isdir(directory):
+        return []
+    ids = sorted((name[:-5] for name in os.listdir(directory) if name.endswith(".json")), reverse=True)
+    profiles = []
+    for profile_id in ids[:limit]:
+        try:
+            with open(os.path.join(directory, profile_id + ".json")) as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            continue
+        summary["top_functions"] = summary.get("top_functions", [])[:5]
+        profiles.append(summary)
+    return profiles
+
+
+def read_collapsed(profile_id: str) -> str | None:
+    if not PROFILE_ID.match(profile_id):
+        return None
+    try:
+        with open(os.path.join(settings.profiling_dir, profile_id + ".collapsed")) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def profiling_available() -> bool:
+    # Profiles expose stack traces and request paths; never without a token guarding them
+    if settings.profiling_enabled and not settings.profiling_token:
+        print("Profiling disabled: PROFILING_ENABLED is set but PROFILING_TOKEN is not")
+        return False
+    return settings.profiling_enabled
+
+
+def token_matches(value: str | None) -> bool:
+    token = settings.profiling_token
+    return bool(token and value and hmac.compare_digest(value.encode(), token.encode()))
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware profiling requests on demand.
+
+    A request is profiled when it carries ``X-Profile: <profiling_token>`` (or
+    ``?profile=<token>``), or at random with probability ``profiling_sample_rate``.
+    At most ``profiling_max_concurrent`` run at once. The profile id comes back in an
+    ``X-Profile-Id`` response header. Only installed when ``profiling_enabled`` and a
+    ``profiling_token`` is set, since the token also guards reading profiles back.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    def _trigger(self, scope: dict) -> str | None:
+        for name, value in scope.get("headers", ()):
+            if name == PROFILE_HEADER.encode() and token_matches(value.decode("latin-1")):
+                return "header"
+        query = scope.get("query_string", b"")
+        if b"profile=" in query and token_matches(parse_qs(query.decode("latin-1")).get("profile", [None])[0]):
+            return "query"
+        if settings.profiling_sample_rate > 0 and random.random() < settings.profiling_sample_rate:
+            return "sample"
+        return None
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or scope["path"].startswith("/debug/profiles"):
+            await self.app(scope, receive, send)
+            return
+        trigger = self._trigger(scope)
+        if trigger is None or len(_active) >= settings.profiling_max_concurrent:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope, trigger)
+        status = 500
+
+        async def send_wrapper(message: dict) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        profile.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.stop(status)
+
+
+_ENTRY = ProfilingMiddleware.__call__.__code__
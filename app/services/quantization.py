@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+# Number of set bits per byte value, for Hamming distance over packed codes
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class Int8Quantizer:
+    """Scalar quantization of unit vectors: each component scaled by 127 and rounded.
+
+    Needs no training, so codes can be appended alongside vectors; 4x smaller than float32.
+    """
+
+    mode = "int8"
+    dtype = np.dtype(np.int8)
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.width = dim
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(vectors * 127.0), -127, 127).astype(np.int8)
+
+    def prepare(self, q: np.ndarray) -> np.ndarray:
+        return np.asarray(q, dtype=np.float32)
+
+    def scores(self, codes: np.ndarray, prepared: np.ndarray, rows: int = 4096) -> np.ndarray:
+        # Widen in cache-sized slices; converting a whole block at once is ~3x slower
+        out = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], rows):
+            out[start:start + rows] = codes[start:start + rows].astype(np.float32) @ prepared
+        return out
+
+
+class BinaryQuantizer:
+    """One sign bit per component, ranked by Hamming distance; 32x smaller than float32."""
+
+    mode = "binary"
+    dtype = np.dtype(np.uint8)
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.width = (dim + 7) // 8
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.packbits(vectors > 0, axis=-1)
+
+    def prepare(self, q: np.ndarray) -> np.ndarray:
+        return self.encode(np.asarray(q, dtype=np.float32)[None, :])[0]
+
+    def scores(self, codes: np.ndarray, prepared: np.ndarray) -> np.ndarray:
+        distance = _POPCOUNT[np.bitwise_xor(codes, prepared)].sum(axis=1, dtype=np.int32)
+        return -distance.astype(np.float32)
+
+
+Quantizer = Int8Quantizer | BinaryQuantizer
+
+
+def get_quantizer(mode: str, dim: int) -> Quantizer | None:
+    if mode in ("", "none"):
+        return None
+    if mode == "int8":
+        return Int8Quantizer(dim)
+    if mode == "binary":
+        return BinaryQuantizer(dim)
+    raise ValueError(f"Unsupported vector quantization: {mode}")
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from sqlalchemy import text
+
+from ..config import settings
+from ..db import engine
+from .context import context_packer
+from .embedding_batcher import get_embedding_batcher
+from .jobs import job_queue
+from .llm import get_llm_provider
+from .memory import get_memory_manager
+from .model_registry import model_registry
+from .retrieval import get_rag_service
+from .snapshot import SnapshotManager, snapshot_manager
+from .vector_store import get_async_vector_store
+
+
+@dataclass
+class Dependency:
+    name: str
+    required: bool
+    state: str = "pending"  # pending|warming|ready|failed|skipped
+    latency_ms: float | None = None
+    attempts: int = 0
+    error: str | None = None
+    ready_at: datetime | None = None
+
+    def as_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "required": self.required,
+            "latency_ms": self.latency_ms,
+            "attempts": self.attempts,
+            "error": self.error,
+            "ready_at": self.ready_at.isoformat() if self.ready_at else None,
+        }
+
+
+class Readiness:
+    """Warms the app's dependencies in the background after startup and tracks their state.
+
+    Steps run in order, because later ones use earlier ones: the database, the embedding
+    model (loaded, then a dummy embed through the query batcher so the first real query
+    doesn't pay for lazy initialisation), the vector store (snapshot restored, if any),
+    the ingestion job queue, Redis and the LLM client. Failed steps are retried every
+    ``warmup_retry_seconds``; a step whose prerequisites are not ready yet waits for
+    them. The job queue needs the vector store: its resumed jobs must not write to the
+    index before the snapshot is restored, or the restore would be skipped. The app is
+    ready once every required step is. Redis is reported but not required, since chat
+    memory already degrades to an empty history when it is down.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.dependencies: dict[str, Dependency] = {}
+        self._task: asyncio.Task | None = None
+
+    def _steps(self) -> list[tuple[str, bool, Callable[[], Awaitable[None]] | None, tuple[str, ...]]]:
+        # (name, required, step, names of the steps it needs)
+        return [
+            ("database", True, self._database, ()),
+            ("embedding_model", True, self._embedding_model if settings.embedding_preload else None, ()),
+            ("vector_store", True, self._vector_store, ()),
+            ("ingestion", True, self._ingestion, ("database", "vector_store")),
+            ("redis", False, self._redis, ()),
+            ("llm", True, self._llm, ()),
+        ]
+
+    @staticmethod
+    async def _database() -> None:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    @staticmethod
+    async def _embedding_model() -> None:
+        await asyncio.to_thread(model_registry.preload)
+        batcher = await asyncio.to_thread(get_embedding_batcher)
+        await batcher.embed("warmup")
+        # The packer copies the tokenizer on first use
+        await asyncio.to_thread(context_packer.count, ["warmup"])
+
+    @staticmethod
+    async def _vector_store() -> None:
+        # Building the store may create the collection; keep that off the event loop
+        store = await asyncio.to_thread(get_async_vector_store)
+        if SnapshotManager.applies():
+            await snapshot_manager.restore()
+            snapshot_manager.start()
+        await store.count()
+
+    @staticmethod
+    async def _ingestion() -> None:
+        # Re-queues files left pending or running by the previous process
+        await job_queue.start()
+
+    @staticmethod
+    async def _redis() -> None:
+        await get_memory_manager().client.ping()
+
+    @staticmethod
+    async def _llm() -> None:
+        await asyncio.to_thread(get_llm_provider)
+
+    async def _run_step(self, dep: Dependency, step: Callable[[], Awaitable[None]]) -> bool:
+        dep.state = "warming"
+        dep.attempts += 1
+        started = time.perf_counter()
+        try:
+            await step()
+        except Exception as e:
+            dep.state, dep.error = "failed", repr(e)
+            print(f"Warmup of {dep.name} failed: {e!r}")
+            return False
+        finally:
+            dep.latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        dep.state, dep.error, dep.ready_at = "ready", None, datetime.utcnow()
+        return True
+
+    async def warm_up(self) -> None:
+        steps = self._steps()
+        self.dependencies = {
+            name: Dependency(name, required, state="pending" if step else "skipped")
+            for name, required, step, _ in steps
+        }
+        pending = [(self.dependencies[name], step, needs) for name, _, step, needs in steps if step is not None]
+        while pending:
+            failed = []
+            for dep, step, needs in pending:
+                if not all(self.is_ready(n) for n in needs) or not await self._run_step(dep, step):
+                    failed.append((dep, step, needs))
+            pending = failed
+            if pending:
+                await asyncio.sleep(settings.warmup_retry_seconds)
+        if settings.embedding_preload:
+            # Everything it is made of is built by now; this only wires it together
+            await asyncio.to_thread(get_rag_service)
+
+    def start(self) -> None:
+        if self._task is None:
+            # Not ready until this run's warmup says so, even if an earlier one finished
+            self.dependencies = {}
+            self._task = asyncio.create_task(self.warm_up())
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def is_ready(self, name: str | None = None) -> bool:
+        if name is not None:
+            dep = self.dependencies.get(name)
+            return dep is not None and dep.state == "ready"
+        return bool(self.dependencies) and all(
+            d.state in ("ready", "skipped") for d in self.dependencies.values() if d.required
+        )
+
+    def report(self) -> dict:
+        return {
+            "ready": self.is_ready(),
+            "uptime_seconds": round(time.perf_counter() - self.started, 1),
+            "dependencies": {name: d.as_dict() for name, d in self.dependencies.items()},
+        }
+
+
+readiness = Readiness()
@@ -1,49 +1,376 @@
 from __future__ import annotations
 
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, TypeVar
+
+import numpy as np
+
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+
+from ..config import settings
+from ..schemas import ChatMessage, RAGBatchQueryResult, RAGQueryResponse
 
 from .embeddings import EmbeddingsService
-from .vector_store import get_vector_store
-from .memory import ChatMemoryManager
-from .llm import LLMProvider, SYSTEM_PROMPT
-from ..models import Chunk
+from .embedding_batcher import get_embedding_batcher
+from .answer_cache import answer_cache
+from .chunk_cache import ChunkSpan, chunk_text_cache
+from .context import PackedContext, context_packer
+from .vector_store import get_async_vector_store
+from .memory import get_memory_manager
+from .types import RetrievedChunk, SearchFilter
+from .llm import get_llm_provider
+
+
+T = TypeVar("T")
+
+# (ttfb, total) seconds of recent streamed answers, shared by all RAGService instances
+_stream_timings: deque[tuple[float, float]] = deque(maxlen=1000)
+# Stage name -> recent durations in seconds
+_stage_timings: dict[str, deque[float]] = {}
+
+
+def _pct(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(p * len(values)))] * 1000, 1)
+
+
+def stream_stats() -> dict:
+    timings = list(_stream_timings)
+    ttfbs, totals = [t for t, _ in timings], [t for _, t in timings]
+    return {
+        "requests": len(timings),
+        "ttfb_ms": {"p50": _pct(ttfbs, 0.50), "p95": _pct(ttfbs, 0.95), "p99": _pct(ttfbs, 0.99)},
+        "total_ms": {"p50": _pct(totals, 0.50), "p95": _pct(totals, 0.95), "p99": _pct(totals, 0.99)},
+    }
+
+
+def stage_stats() -> dict:
+    return {
+        name: {"count": len(d), "p50_ms": _pct(list(d), 0.50), "p95_ms": _pct(list(d), 0.95)}
+        for name, d in _stage_timings.items()
+    }
+
+
+class StageTimer:
+    """Start offset and duration of each pipeline stage of one request.
+
+    Stages that ran concurrently overlap in time; comparing their offsets shows
+    which one was on the critical path.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: list[tuple[str, float, float]] = []
+
+    def record(self, name: str, start: float) -> None:
+        end = time.perf_counter()
+        self.stages.append((name, start - self.started, end - start))
+        _stage_timings.setdefault(name, deque(maxlen=1000)).append(end - start)
+
+    async def run(self, name: str, awaitable: Awaitable[T]) -> T:
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.record(name, start)
+
+    def as_dict(self) -> dict[str, dict[str, float]]:
+        return {name: {"start_ms": round(s * 1000, 1), "ms": round(d * 1000, 1)} for name, s, d in self.stages}
+
+    def server_timing(self) -> str:
+        """A ``Server-Timing`` header value; ``desc`` carries each stage's start offset."""
+        parts = [f'{name};dur={d * 1000:.1f};desc="+{s * 1000:.1f}ms"' for name, s, d in self.stages]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
 
 
 class RAGService:
+    """Retrieval-augmented answering, run as a small stage graph per question:
+
+    ``embed -> search`` and ``history`` run concurrently; then ``answer_cache`` and
+    ``chunks``; then, on a cache miss, ``pack`` (in a worker thread, it tokenizes)
+    and ``llm``. The memory and answer-cache writes are not awaited: they run in the
+    background once the answer is known. A follow-up sent the instant an answer
+    arrives may therefore not see that turn in its history yet.
+    """
+
     def __init__(self):
         self.embedder = EmbeddingsService()
-        self.vstore = get_vector_store()
-        self.memory = ChatMemoryManager()
-        self.llm = LLMProvider()
-
-    async def query(self, db: AsyncSession, *, session_id: str, query: str, top_k: int = 5) -> tuple[str, list[int]]:
-        q_emb = self.embedder.embed([query])[0]
-        results = self.vstore.query(q_emb, top_k)
-        chunk_ids = [r.chunk_id for r in results]
-
-        # Fetch chunk texts in case the store did not return full text
-        if any(not r.text for r in results):
-            rows = (await db.execute(select(Chunk).where(Chunk.id.in_(chunk_ids)))).scalars().all()
-            id_to_text = {c.id: c.text for c in rows}
-            for r in results:
-                if not r.text:
-                    r.text = id_to_text.get(r.chunk_id, "")
-
-        context = "\n\n".join([f"[Doc {r.document_id} | Score {r.score:.3f}]\n{r.text}" for r in results])
-        history = await self.memory.get_chat_history(session_id)
-
-        messages: list[dict[str, str]] = [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "system", "content": f"Context:\n{context}"},
-        ]
-        # Convert ChatMessage objects to dict format for LLM
-        for msg in history[-10:]:
-            messages.append({"role": msg.role, "content": msg.content})
-        messages.append({"role": "user", "content": query})
-
-        answer = await self.llm.generate(messages)
-        await self.memory.add_interaction(session_id, query, answer)
-
-        return answer, chunk_ids
+        self.batcher = get_embedding_batcher()
+        self.vstore = get_async_vector_store()
+        self.memory = get_memory_manager()
+        self.llm = get_llm_provider()
+        self.packer = context_packer
+        self._pending: set[asyncio.Task] = set()
+
+    def _background(self, coro: Awaitable[Any]) -> None:
+        task = asyncio.ensure_future(coro)
+        self._pending.add(task)
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Task) -> None:
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Background write failed: {task.exception()}")
+
+    async def drain(self) -> None:
+        """Wait for background writes still in flight (called on shutdown)."""
+        if self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+    async def _load_chunks(self, db: AsyncSession, results: list[RetrievedChunk]) -> dict[int, ChunkSpan]:
+        # Positions for context packing, plus any text the store did not return
+        # (ids-only payloads, restored snapshots)
+        entries = await chunk_text_cache.get(db, [r.chunk_id for r in results])
+        for r in results:
+            if not r.text and r.chunk_id in entries:
+                r.text = entries[r.chunk_id][0]
+        return {cid: span for cid, (_, span) in entries.items()}
+
+    async def _retrieve(
+        self, timer: StageTimer, query: str, top_k: int, filters: SearchFilter | None
+    ) -> tuple[np.ndarray, list[RetrievedChunk]]:
+        q_emb = await timer.run("embed", self.batcher.embed(query))
+        results = await timer.run("search", self.vstore.query(q_emb, top_k, filters))
+        return q_emb, results
+
+    async def _prepare(
+        self,
+        timer: StageTimer,
+        db: AsyncSession,
+        session_id: str,
+        query: str,
+        top_k: int,
+        filters: SearchFilter | None,
+    ) -> tuple[np.ndarray, list[RetrievedChunk], list[ChatMessage], str | None, str | None, dict[int, ChunkSpan]]:
+        # Everything up to the LLM call: (q_emb, results, history, summary, cached answer, spans)
+        (q_emb, results), (history, summary) = await asyncio.gather(
+            self._retrieve(timer, query, top_k, filters),
+            timer.run("history", self.memory.get_prompt_history(session_id)),
+        )
+        answer, spans = await asyncio.gather(
+            timer.run("answer_cache", self._cached_answer(q_emb, results)),
+            timer.run("chunks", self._load_chunks(db, results)),
+        )
+        return q_emb, results, history, summary, answer, spans
+
+    async def query(
+        self,
+        db: AsyncSession,
+        *,
+        session_id: str,
+        query: str,
+        top_k: int = 5,
+        document_ids: list[int] | None = None,
+        tenant_id: str | None = None,
+        timer: StageTimer | None = None,
+    ) -> RAGQueryResponse:
+        timer = timer or StageTimer()
+        q_emb, results, history, summary, answer, spans = await self._prepare(
+            timer, db, session_id, query, top_k, SearchFilter.build(document_ids, tenant_id)
+        )
+        # Near-duplicate question over the same chunks: skip the LLM
+        packed: PackedContext | None = None
+        if answer is None:
+            answer, packed = await self._generate(timer, query, q_emb, results, spans, history, summary)
+        self._background(self.memory.add_interaction(session_id, query, answer))
+        return RAGQueryResponse(
+            answer=answer,
+            sources=[r.chunk_id for r in results],
+            cached=packed is None,
+            prompt_tokens=packed.prompt_tokens if packed else None,
+            tokens_saved=packed.tokens_saved if packed else None,
+        )
+
+    async def _cached_answer(self, q_emb: np.ndarray, results: list[RetrievedChunk]) -> str | None:
+        if not settings.answer_cache_enabled:
+            return None
+        return await answer_cache.lookup(q_emb, [r.chunk_id for r in results])
+
+    def _store_answer(self, q_emb: np.ndarray, results: list[RetrievedChunk], answer: str) -> None:
+        if settings.answer_cache_enabled:
+            self._background(
+                answer_cache.store(q_emb, [r.chunk_id for r in results], [r.document_id for r in results], answer)
+            )
+
+    async def _pack(
+        self,
+        timer: StageTimer,
+        query: str,
+        results: list[RetrievedChunk],
+        spans: dict[int, ChunkSpan],
+        history: list[ChatMessage],
+        summary: str | None,
+    ) -> PackedContext:
+        return await timer.run("pack", asyncio.to_thread(self.packer.pack, query, results, spans, history, summary))
+
+    async def _generate(
+        self,
+        timer: StageTimer,
+        query: str,
+        q_emb: np.ndarray,
+        results: list[RetrievedChunk],
+        spans: dict[int, ChunkSpan],
+        history: list[ChatMessage],
+        summary: str | None = None,
+    ) -> tuple[str, PackedContext]:
+        packed = await self._pack(timer, query, results, spans, history, summary)
+        answer = await timer.run("llm", self.llm.generate(packed.messages))
+        self._store_answer(q_emb, results, answer)
+        return answer, packed
+
+    async def query_stream(
+        self,
+        db: AsyncSession,
+        *,
+        session_id: str,
+        query: str,
+        top_k: int = 5,
+        document_ids: list[int] | None = None,
+        tenant_id: str | None = None,
+    ) -> AsyncIterator[tuple[str, dict[str, Any]]]:
+        """Answer ``query`` as ``(event, data)`` pairs: ``sources``, then ``delta``s, then ``done``.
+
+        The interaction is written to chat memory only once the answer is complete.
+        ``ttfb_ms`` in the ``done`` event is the time to the first answer text;
+        ``stages`` has the start offset and duration of each pipeline stage.
+        """
+        timer = StageTimer()
+        started = timer.started
+        q_emb, results, history, summary, answer, spans = await self._prepare(
+            timer, db, session_id, query, top_k, SearchFilter.build(document_ids, tenant_id)
+        )
+        cached = answer is not None
+        yield "sources", {"sources": [r.chunk_id for r in results], "cached": cached}
+
+        ttfb: float | None = None
+        packed: PackedContext | None = None
+        if cached:
+            ttfb = time.perf_counter() - started
+            yield "delta", {"text": answer}
+        else:
+            packed = await self._pack(timer, query, results, spans, history, summary)
+            parts: list[str] = []
+            llm_started = time.perf_counter()
+            async for delta in self.llm.generate_stream(packed.messages):
+                if ttfb is None:
+                    ttfb = time.perf_counter() - started
+                parts.append(delta)
+                yield "delta", {"text": delta}
+            timer.record("llm", llm_started)
+            answer = "".join(parts)
+            self._store_answer(q_emb, results, answer)
+        self._background(self.memory.add_interaction(session_id, query, answer))
+
+        total = time.perf_counter() - started
+        ttfb = total if ttfb is None else ttfb
+        _stream_timings.append((ttfb, total))
+        yield "done", {
+            "ttfb_ms": round(ttfb * 1000, 1),
+            "total_ms": round(total * 1000, 1),
+            "prompt_tokens": packed.prompt_tokens if packed else None,
+            "tokens_saved": packed.tokens_saved if packed else None,
+            "stages": timer.as_dict(),
+        }
+
+    async def query_batch(
+        self,
+        db: AsyncSession,
+        questions: list[tuple[str, str]],
+        *,
+        top_k: int = 5,
+        document_ids: list[int] | None = None,
+        tenant_id: str | None = None,
+        concurrency: int | None = None,
+    ) -> AsyncIterator[RAGBatchQueryResult]:
+        """Answer many ``(session_id, query)`` pairs, yielding results as they finish.
+
+        Retrieval is shared: one ``encode`` call, one batched vector search, one text
+        lookup and one pipelined history fetch. Only the LLM calls run per question,
+        at most ``concurrency`` at a time. Every question sees the history as it was
+        when the batch started.
+        """
+        timer = StageTimer()
+
+        async def retrieve() -> tuple[np.ndarray, list[list[RetrievedChunk]]]:
+            vectors = await timer.run("embed", asyncio.to_thread(self.embedder.encode, [q for _, q in questions]))
+            hits = await timer.run(
+                "search", self.vstore.query_batch(vectors, top_k, SearchFilter.build(document_ids, tenant_id))
+            )
+            return vectors, hits
+
+        (vectors, hits), histories = await asyncio.gather(
+            retrieve(), timer.run("history", self.memory.get_prompt_histories([s for s, _ in questions]))
+        )
+        spans = await timer.run("chunks", self._load_chunks(db, [r for results in hits for r in results]))
+
+        slots = asyncio.Semaphore(max(1, concurrency or settings.rag_batch_llm_concurrency))
+
+        async def answer(index: int) -> RAGBatchQueryResult:
+            session_id, query = questions[index]
+            results = hits[index]
+            sources = [r.chunk_id for r in results]
+            try:
+                text = await self._cached_answer(vectors[index], results)
+                packed: PackedContext | None = None
+                if text is None:
+                    async with slots:
+                        text, packed = await self._generate(
+                            StageTimer(), query, vectors[index], results, spans, *histories[session_id]
+                        )
+                self._background(self.memory.add_interaction(session_id, query, text))
+            except Exception as e:
+                return RAGBatchQueryResult(index=index, session_id=session_id, sources=sources, error=str(e))
+            return RAGBatchQueryResult(
+                index=index,
+                session_id=session_id,
+                answer=text,
+                sources=sources,
+                cached=packed is None,
+                prompt_tokens=packed.prompt_tokens if packed else None,
+                tokens_saved=packed.tokens_saved if packed else None,
+            )
+
+        tasks = [asyncio.create_task(answer(i)) for i in range(len(questions))]
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield await done
+        finally:
+            # Client went away mid-stream: don't keep spending LLM calls
+            for task in tasks:
+                task.cancel()
+
+
+_service: RAGService | None = None
+_service_lock = threading.Lock()
+
+
+def get_rag_service() -> RAGService:
+    """The process-wide RAG service, built on first use (or by the startup warmup).
+
+    Building it loads the embedding model, so it blocks; async callers use
+    ``aget_rag_service``.
+    """
+    global _service
+    if _service is None:
+        # Called from worker threads and the event loop alike; build it only once
+        with _service_lock:
+            if _service is None:
+                _service = RAGService()
+    return _service
+
+
+async def aget_rag_service() -> RAGService:
+    # Only the first call pays for the thread hop; it keeps the loop free while the model loads
+    return _service if _service is not None else await asyncio.to_thread(get_rag_service)
+
 
+async def close_rag_service() -> None:
+    # Only drain a service that exists; building one at shutdown would load the model
+    if _service is not None:
+        await _service.drain()
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import struct
+import time
+import uuid
+
+import numpy as np
+from sqlalchemy import select, update
+
+from ..config import settings
+from ..db import SessionLocal
+from ..models import Chunk, Document
+from .embedding_cache import EmbeddingCache
+from .embeddings import EmbeddingsService
+from .types import AsyncVectorStore
+from .vector_store import get_async_vector_store
+
+
+MAGIC = b"PMVSNAP1"
+HEADER = struct.Struct("<8sIQ")  # magic, dim, count
+
+
+def record_dtype(dim: int) -> np.dtype:
+    return np.dtype([("id", "V16"), ("chunk_id", "<i8"), ("document_id", "<i8"), ("vector", "<f4", (dim,))])
+
+
+async def write_snapshot(store: AsyncVectorStore, path: str, dim: int, batch_size: int = 2_000) -> int:
+    """Write every point of ``store`` to ``path`` atomically; returns the point count.
+
+    Layout: a 20-byte header followed by fixed-size records of uuid bytes, chunk id,
+    document id and the float32 vector. Chunk text is left out; it lives in SQLite.
+    """
+    dtype = record_dtype(dim)
+    tmp = f"{path}.tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    count = 0
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, dim, 0))
+        async for ids, vectors, payloads in store.iter_points(batch_size):
+            records = np.empty(len(ids), dtype=dtype)
+            records["id"] = np.frombuffer(b"".join(uuid.UUID(i).bytes for i in ids), dtype="V16")
+            records["chunk_id"] = [int(p["chunk_id"]) for p in payloads]
+            records["document_id"] = [int(p["document_id"]) for p in payloads]
+            records["vector"] = vectors
+            await asyncio.to_thread(f.write, records.tobytes())
+            count += len(ids)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, dim, count))
+        f.flush()
+        await asyncio.to_thread(os.fsync, f.fileno())
+    os.replace(tmp, path)
+    return count
+
+
+def read_snapshot(path: str, dim: int) -> np.ndarray:
+    """Memory-map a snapshot's records; raises ValueError if it doesn't match ``dim``."""
+    with open(path, "rb") as f:
+        magic, snap_dim, count = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a vector snapshot")
+    if snap_dim != dim:
+        raise ValueError(f"Snapshot dim {snap_dim} does not match embedding_dim {dim}")
+    if count == 0:
+        return np.empty(0, dtype=record_dtype(dim))
+    return np.memmap(path, dtype=record_dtype(dim), mode="r", offset=HEADER.size, shape=(count,))
+
+
+def _id_keys(ids: np.ndarray) -> np.ndarray:
+    # 16-byte ids as sortable fixed-width bytes for vectorized membership tests
+    return np.frombuffer(np.ascontiguousarray(ids).tobytes(), dtype="S16")
+
+
+class SnapshotManager:
+    """Persists the vector collection to a compact binary file and warm-restores it.
+
+    Only useful for stores that lose their contents on restart (in-memory Qdrant);
+    the mmap backend and a Qdrant server persist on their own.
+    """
+
+    def __init__(self, store: AsyncVectorStore | None = None, path: str | None = None, interval: float | None = None):
+        self._store = store
+        self.path = path or settings.vector_snapshot_path
+        self.interval = settings.vector_snapshot_interval_seconds if interval is None else interval
+        self.dim = settings.embedding_dim
+        self._task: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+        self._last_count: int | None = None
+        self.last_stats: dict = {}
+
+    @property
+    def store(self) -> AsyncVectorStore:
+        if self._store is None:
+            self._store = get_async_vector_store()
+        return self._store
+
+    @staticmethod
+    def applies() -> bool:
+        return (
+            settings.vector_snapshot_enabled
+            and settings.vector_provider == "qdrant"
+            and settings.qdrant_url == ":memory:"
+        )
+
+    async def save(self, force: bool = False) -> int | None:
+        async with self._lock:
+            count = await self.store.count()
+            if not force and count == self._last_count:
+                return None
+            started = time.perf_counter()
+            written = await write_snapshot(self.store, self.path, self.dim)
+            self._last_count = written
+            self.last_stats["saved_points"] = written
+            self.last_stats["save_seconds"] = round(time.perf_counter() - started, 3)
+            return written
+
+    async def restore(self) -> dict:
+        """Bulk-load the snapshot's vectors of chunks that still exist, then re-embed
+        chunks whose vectors it doesn't have."""
+        started = time.perf_counter()
+        chunk_ids, chunk_keys = await self._chunk_keys()
+        restored_keys = np.empty(0, dtype="S16")
+        stale = 0
+        if os.path.exists(self.path) and await self.store.count() == 0:
+            try:
+                records = read_snapshot(self.path, self.dim)
+            except (ValueError, struct.error) as e:
+                print(f"Ignoring vector snapshot {self.path}: {e}")
+                records = None
+            if records is not None and len(records):
+                # Chunks deleted after the snapshot was written must not come back as orphan points
+                keys = _id_keys(records["id"])
+                keep = np.isin(keys, chunk_keys)
+                stale = int(len(records) - np.count_nonzero(keep))
+                await self._load(records, keep, await self._document_tenants())
+                restored_keys = np.sort(keys[keep])
+        restored = int(restored_keys.shape[0])
+        load_seconds = time.perf_counter() - started
+
+        missing = chunk_ids[~np.isin(chunk_keys, restored_keys)]
+        reembedded = await self._reembed(missing.tolist())
+        self._last_count = restored + reembedded if restored else None
+        self.last_stats.update(
+            restored_points=restored,
+            dropped_points=stale,
+            reembedded_chunks=reembedded,
+            load_seconds=round(load_seconds, 3),
+            restore_seconds=round(time.perf_counter() - started, 3),
+        )
+        return dict(self.last_stats)
+
+    async def _document_tenants(self) -> dict[int, str]:
+        # Tenants aren't in the snapshot records; filtered search needs them back in the payload
+        async with SessionLocal() as db:
+            rows = await db.execute(select(Document.id, Document.tenant_id).where(Document.tenant_id.is_not(None)))
+            return {doc_id: tenant for doc_id, tenant in rows}
+
+    @staticmethod
+    def _payload(chunk_id: int, document_id: int, tenants: dict[int, str]) -> dict:
+        payload = {"chunk_id": chunk_id, "document_id": document_id}
+        if document_id in tenants:
+            payload["tenant_id"] = tenants[document_id]
+        return payload
+
+    async def _load(
+        self, records: np.ndarray, keep: np.ndarray, tenants: dict[int, str], batch_size: int = 50_000
+    ) -> None:
+        for start in range(0, len(records), batch_size):
+            # Masked per block so the memory-mapped file is never copied whole
+            block = records[start:start + batch_size][keep[start:start + batch_size]]
+            if not len(block):
+                continue
+            ids = [str(uuid.UUID(bytes=bytes(b))) for b in block["id"]]
+            payloads = [
+                self._payload(int(c), int(d), tenants) for c, d in zip(block["chunk_id"], block["document_id"])
+            ]
+            await self.store.upsert(ids, np.ascontiguousarray(block["vector"]), payloads)
+
+    async def _chunk_keys(self, batch_size: int = 10_000) -> tuple[np.ndarray, np.ndarray]:
+        # Walk chunks.embedding_id in batches; returns chunk ids and their point ids as S16
+        # keys, empty where a chunk has no (valid) point id
+        ids: list[np.ndarray] = []
+        keys: list[np.ndarray] = []
+        async with SessionLocal() as db:
+            result = await db.stream(
+                select(Chunk.id, Chunk.embedding_id).execution_options(yield_per=batch_size)
+            )
+            async for rows in result.partitions(batch_size):
+                block = np.empty(len(rows), dtype="S16")
+                for i, (_, embedding_id) in enumerate(rows):
+                    try:
+                        block[i] = uuid.UUID(embedding_id).bytes if embedding_id else b""
+                    except ValueError:
+                        block[i] = b""
+                ids.append(np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)))
+                keys.append(block)
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype="S16")
+        return np.concatenate(ids), np.concatenate(keys)
+
+    async def _reembed(self, missing: list[int]) -> int:
+        if not missing:
+            return 0
+
+        tenants = await self._document_tenants()
+        # Runs during warmup, possibly before the model is loaded; keep that off the event loop
+        embedder = await asyncio.to_thread(EmbeddingsService)
+        cache = EmbeddingCache(embedder.model_name, embedder.dim)
+
+        async def encode(texts: list[str]) -> np.ndarray:
+            return await asyncio.to_thread(embedder.encode, texts)
+
+        for start in range(0, len(missing), settings.ingest_batch_size):
+            ids = missing[start:start + settings.ingest_batch_size]
+            async with SessionLocal() as db:
+                chunks = (await db.execute(select(Chunk).where(Chunk.id.in_(ids)))).scalars().all()
+                if not chunks:
+                    continue
+                vectors, _, _ = await cache.embed(db, [c.text for c in chunks], encode)
+                point_ids = [c.embedding_id or str(uuid.uuid4()) for c in chunks]
+                await self.store.upsert(
+                    point_ids, vectors, [self._payload(c.id, c.document_id, tenants) for c in chunks]
+                )
+                for c, pid in zip(chunks, point_ids):
+                    if c.embedding_id != pid:
+                        await db.execute(update(Chunk).where(Chunk.id == c.id).values(embedding_id=pid))
+                await db.commit()
+        return len(missing)
+
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except Exception as e:
+                print(f"Vector snapshot failed: {e}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.save()
+
+
+snapshot_manager = SnapshotManager()
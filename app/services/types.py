@@ -1,7 +1,9 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Protocol, Sequence
+from typing import AsyncIterator, Iterator, Protocol, Sequence
+
+import numpy as np
 
 
 @dataclass
@@ -12,7 +14,45 @@ class RetrievedChunk:
     score: float
 
 
+@dataclass(frozen=True)
+class SearchFilter:
+    """Restricts a search to some documents and/or one tenant; both conditions must hold."""
+
+    document_ids: tuple[int, ...] | None = None
+    tenant_id: str | None = None
+
+    @classmethod
+    def build(cls, document_ids: Sequence[int] | None = None, tenant_id: str | None = None) -> SearchFilter | None:
+        if document_ids is None and tenant_id is None:
+            return None
+        return cls(tuple(sorted(set(document_ids))) if document_ids is not None else None, tenant_id)
+
+
 class VectorStore(Protocol):
-    def upsert(self, vectors: Sequence[tuple[str, list[float], dict]]) -> None: ...
-    def query(self, embedding: list[float], top_k: int) -> list[RetrievedChunk]: ...
+    # vectors is a float32 matrix of shape (len(ids), dim); payloads align with ids row by row
+    def upsert(self, ids: Sequence[str], vectors: np.ndarray, payloads: Sequence[dict]) -> None: ...
+    def query(self, embedding: np.ndarray, top_k: int, filters: SearchFilter | None = None) -> list[RetrievedChunk]: ...
+    # One result list per row of ``embeddings`` (m, dim), searched in a single pass
+    def query_batch(
+        self, embeddings: np.ndarray, top_k: int, filters: SearchFilter | None = None
+    ) -> list[list[RetrievedChunk]]: ...
+    def count(self) -> int: ...
+    # Removes the points with these ids; unknown ids are ignored
+    def delete(self, ids: Sequence[str]) -> None: ...
+    # Batches of (ids, vectors, payloads) covering every stored point; payloads hold chunk_id/document_id
+    # (plus tenant_id where the backend keeps the string)
+    def iter_points(self, batch_size: int = 10_000) -> Iterator[tuple[list[str], np.ndarray, list[dict]]]: ...
+
 
+class AsyncVectorStore(Protocol):
+    # Same contract as VectorStore, awaitable so vector I/O never blocks the event loop
+    async def upsert(self, ids: Sequence[str], vectors: np.ndarray, payloads: Sequence[dict]) -> None: ...
+    async def query(
+        self, embedding: np.ndarray, top_k: int, filters: SearchFilter | None = None
+    ) -> list[RetrievedChunk]: ...
+    async def query_batch(
+        self, embeddings: np.ndarray, top_k: int, filters: SearchFilter | None = None
+    ) -> list[list[RetrievedChunk]]: ...
+    async def count(self) -> int: ...
+    async def delete(self, ids: Sequence[str]) -> None: ...
+    def iter_points(self, batch_size: int = 10_000) -> AsyncIterator[tuple[list[str], np.ndarray, list[dict]]]: ...
@@ -1,61 +1,464 @@
 from __future__ import annotations
 
-from typing import Sequence
-from qdrant_client import QdrantClient
+import asyncio
+import threading
+from typing import AsyncIterator, Iterator, Sequence
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from qdrant_client.http import models as qmodels
 
-from .types import RetrievedChunk, VectorStore
+from .metrics import VECTOR_DURATION, timed
+from .types import AsyncVectorStore, RetrievedChunk, SearchFilter, VectorStore
 from ..config import settings
 
 
+def _quantization_config(mode: str) -> qmodels.QuantizationConfig | None:
+    if mode in ("", "none"):
+        return None
+    if mode == "int8":
+        return qmodels.ScalarQuantization(
+            scalar=qmodels.ScalarQuantizationConfig(type=qmodels.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if mode == "binary":
+        return qmodels.BinaryQuantization(binary=qmodels.BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(f"Unsupported vector quantization: {mode}")
+
+
+def _collection_config(dim: int) -> dict:
+    quantization = _quantization_config(settings.vector_quantization)
+    return {
+        # Quantized: codes stay in RAM, float32 originals go to disk for rescoring
+        "vectors_config": qmodels.VectorParams(
+            size=dim,
+            distance=qmodels.Distance.COSINE,
+            on_disk=settings.qdrant_vectors_on_disk or quantization is not None,
+        ),
+        "hnsw_config": qmodels.HnswConfigDiff(m=settings.qdrant_hnsw_m, ef_construct=settings.qdrant_hnsw_ef_construct),
+        "on_disk_payload": settings.qdrant_payload_on_disk,
+        "quantization_config": quantization,
+    }
+
+
+def _search_params() -> qmodels.SearchParams | None:
+    quantized = settings.vector_quantization not in ("", "none")
+    if not quantized and not settings.qdrant_search_ef:
+        return None
+    return qmodels.SearchParams(
+        hnsw_ef=settings.qdrant_search_ef or None,
+        quantization=qmodels.QuantizationSearchParams(rescore=True, oversampling=settings.vector_rescore_oversampling)
+        if quantized
+        else None,
+    )
+
+
+# Payload fields searches filter on; indexed on server collections
+PAYLOAD_INDEXES = {
+    "document_id": qmodels.PayloadSchemaType.INTEGER,
+    "tenant_id": qmodels.KeywordIndexParams(type=qmodels.KeywordIndexType.KEYWORD, is_tenant=True),
+}
+
+
+def _query_filter(filters: SearchFilter | None) -> qmodels.Filter | None:
+    if filters is None:
+        return None
+    must: list[qmodels.FieldCondition] = []
+    if filters.tenant_id is not None:
+        must.append(qmodels.FieldCondition(key="tenant_id", match=qmodels.MatchValue(value=filters.tenant_id)))
+    if filters.document_ids is not None:
+        must.append(qmodels.FieldCondition(key="document_id", match=qmodels.MatchAny(any=list(filters.document_ids))))
+    return qmodels.Filter(must=must)
+
+
+def _query_payload() -> bool | list[str]:
+    # In ids mode there is no text to transfer; fetch just the two ids even from older full payloads
+    return ["chunk_id", "document_id"] if settings.vector_payload_mode == "ids" else True
+
+
+def _search_requests(embeddings: np.ndarray, top_k: int, filters: SearchFilter | None) -> list[qmodels.SearchRequest]:
+    query_filter, params, payload = _query_filter(filters), _search_params(), _query_payload()
+    return [
+        qmodels.SearchRequest(vector=e.tolist(), filter=query_filter, limit=top_k, with_payload=payload, params=params)
+        for e in embeddings
+    ]
+
+
+def _to_chunks(points) -> list[RetrievedChunk]:
+    out: list[RetrievedChunk] = []
+    for p in points:
+        payload = p.payload or {}
+        out.append(
+            RetrievedChunk(
+                chunk_id=int(payload["chunk_id"]),
+                document_id=int(payload["document_id"]),
+                text=str(payload.get("text") or ""),
+                score=float(p.score),
+            )
+        )
+    return out
+
+
+def _to_batch(points) -> tuple[list[str], np.ndarray, list[dict]]:
+    return (
+        [str(p.id) for p in points],
+        np.asarray([p.vector for p in points], dtype=np.float32),
+        [dict(p.payload or {}) for p in points],
+    )
+
+
 class QdrantVectorStore(VectorStore):
     def __init__(self, collection: str | None = None, dim: int | None = None):
         self.collection = collection or settings.qdrant_collection
         self.dim = dim or settings.embedding_dim
         # Support in-memory instance when configured
-        if settings.qdrant_url == ":memory:":
+        self._local = settings.qdrant_url == ":memory:"
+        if self._local:
             self.client = QdrantClient(":memory:")
         else:
             self.client = QdrantClient(url=settings.qdrant_url, api_key=settings.qdrant_api_key, prefer_grpc=False)
+        # Local mode evaluates filters point by point over the whole collection, so it
+        # keeps its own document -> point ids index to resolve small filters directly
+        self._doc_points: dict[int, set[str]] = {}
+        self._tenant_docs: dict[str, set[int]] = {}
         self._ensure_collection()
 
     def _ensure_collection(self) -> None:
         collections = self.client.get_collections()
         existing = {c.name for c in collections.collections}
         if self.collection not in existing:
-            self.client.create_collection(
-                collection_name=self.collection,
-                vectors_config=qmodels.VectorParams(size=self.dim, distance=qmodels.Distance.COSINE),
-            )
+            self.client.create_collection(collection_name=self.collection, **_collection_config(self.dim))
+        if not self._local:
+            for field, schema in PAYLOAD_INDEXES.items():
+                self.client.create_payload_index(self.collection, field, field_schema=schema, wait=True)
+
+    def upsert(self, ids: Sequence[str], vectors: np.ndarray, payloads: Sequence[dict]) -> None:
+        if len(ids) == 0:
+            return
+        # upload_collection takes the ndarray as-is, no per-point PointStruct/list[float] copies
+        self.client.upload_collection(
+            collection_name=self.collection,
+            vectors=np.ascontiguousarray(vectors, dtype=np.float32),
+            payload=payloads,
+            ids=ids,
+            batch_size=settings.vector_upsert_batch_size,
+            wait=True,
+        )
+        if self._local:
+            for point_id, payload in zip(ids, payloads):
+                doc = int(payload["document_id"])
+                self._doc_points.setdefault(doc, set()).add(str(point_id))
+                if payload.get("tenant_id") is not None:
+                    self._tenant_docs.setdefault(payload["tenant_id"], set()).add(doc)
+
+    def _local_filter_points(self, filters: SearchFilter) -> list[str]:
+        docs = set(filters.document_ids) if filters.document_ids is not None else None
+        if filters.tenant_id is not None:
+            tenant_docs = self._tenant_docs.get(filters.tenant_id, set())
+            docs = set(tenant_docs) if docs is None else docs & tenant_docs
+        return [p for d in docs for p in self._doc_points.get(d, ())]
 
-    def upsert(self, vectors: Sequence[tuple[str, list[float], dict]]) -> None:
-        points = [
-            qmodels.PointStruct(id=vid, vector=vec, payload=payload) for vid, vec, payload in vectors
+    def _query_points(self, embeddings: np.ndarray, top_k: int, point_ids: list[str]) -> list[list[RetrievedChunk]]:
+        records = self.client.retrieve(
+            self.collection, point_ids, with_payload=_query_payload(), with_vectors=True
+        )
+        if not records:
+            return [[] for _ in range(embeddings.shape[0])]
+        queries = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        scores = np.asarray([r.vector for r in records], dtype=np.float32) @ queries.T
+        order = np.argsort(-scores, axis=0, kind="stable")[:top_k]
+        return [
+            [
+                RetrievedChunk(
+                    chunk_id=int(records[i].payload["chunk_id"]),
+                    document_id=int(records[i].payload["document_id"]),
+                    text=str(records[i].payload.get("text") or ""),
+                    score=float(scores[i, j]),
+                )
+                for i in order[:, j]
+            ]
+            for j in range(embeddings.shape[0])
         ]
-        self.client.upsert(collection_name=self.collection, points=points)
 
-    def query(self, embedding: list[float], top_k: int) -> list[RetrievedChunk]:
+    def query(self, embedding: np.ndarray, top_k: int, filters: SearchFilter | None = None) -> list[RetrievedChunk]:
+        if self._local and filters is not None:
+            point_ids = self._local_filter_points(filters)
+            if not point_ids:
+                return []
+            # Fetching points costs ~6x a filtered scan per point; only worth it for small subsets
+            if len(point_ids) * 6 < self.count():
+                return self._query_points(np.asarray(embedding, dtype=np.float32).reshape(1, -1), top_k, point_ids)[0]
         res = self.client.search(
             collection_name=self.collection,
             query_vector=embedding,
+            query_filter=_query_filter(filters),
             limit=top_k,
-            with_payload=True,
+            with_payload=_query_payload(),
+            search_params=_search_params(),
         )
-        out: list[RetrievedChunk] = []
-        for p in res:
-            payload = p.payload or {}
-            out.append(
-                RetrievedChunk(
-                    chunk_id=int(payload["chunk_id"]),
-                    document_id=int(payload["document_id"]),
-                    text=str(payload["text"]),
-                    score=float(p.score),
-                )
+        return _to_chunks(res)
+
+    def query_batch(
+        self, embeddings: np.ndarray, top_k: int, filters: SearchFilter | None = None
+    ) -> list[list[RetrievedChunk]]:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if self._local and filters is not None:
+            point_ids = self._local_filter_points(filters)
+            if not point_ids:
+                return [[] for _ in range(embeddings.shape[0])]
+            if len(point_ids) * 6 < self.count() * embeddings.shape[0]:
+                return self._query_points(embeddings, top_k, point_ids)
+        if self._local:
+            # Local mode runs batch requests one by one, with extra per-request overhead
+            return [self.query(e, top_k, filters) for e in embeddings]
+        res = self.client.search_batch(
+            collection_name=self.collection, requests=_search_requests(embeddings, top_k, filters)
+        )
+        return [_to_chunks(points) for points in res]
+
+    def count(self) -> int:
+        return self.client.count(collection_name=self.collection, exact=True).count
+
+    def delete(self, ids: Sequence[str]) -> None:
+        if len(ids) == 0:
+            return
+        self.client.delete(
+            collection_name=self.collection,
+            points_selector=qmodels.PointIdsList(points=list(ids)),
+            wait=True,
+        )
+        if self._local:
+            gone = {str(i) for i in ids}
+            for points in self._doc_points.values():
+                points -= gone
+
+    def iter_points(self, batch_size: int = 10_000) -> Iterator[tuple[list[str], np.ndarray, list[dict]]]:
+        if self._local:
+            yield from self._iter_local_points(batch_size)
+            return
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection,
+                limit=batch_size,
+                offset=offset,
+                with_payload=["chunk_id", "document_id", "tenant_id"],
+                with_vectors=True,
             )
-        return out
+            if points:
+                yield _to_batch(points)
+            if offset is None:
+                break
+
+    def _iter_local_points(self, batch_size: int) -> Iterator[tuple[list[str], np.ndarray, list[dict]]]:
+        # Local scroll re-sorts the whole collection on every call (~0.7 s per 100k points
+        # with the threaded store's lock held); lookups by id cost the same per batch at any
+        # size. Points deleted between batches are skipped, points added after the first
+        # batch are left to the next pass.
+        ids = [p for points in self._doc_points.values() for p in points]
+        for start in range(0, len(ids), batch_size):
+            points = self.client.retrieve(
+                collection_name=self.collection,
+                ids=ids[start:start + batch_size],
+                with_payload=["chunk_id", "document_id", "tenant_id"],
+                with_vectors=True,
+            )
+            if points:
+                yield _to_batch(points)
+
+
+class AsyncQdrantVectorStore(AsyncVectorStore):
+    """Qdrant server client on the event loop, gRPC when ``qdrant_prefer_grpc`` is set.
+
+    Upserts are cut into ``vector_upsert_batch_size`` batches; at most
+    ``vector_upsert_parallelism`` of them are in flight at once.
+    """
+
+    def __init__(self, collection: str | None = None, dim: int | None = None):
+        self.collection = collection or settings.qdrant_collection
+        self.dim = dim or settings.embedding_dim
+        self.client = AsyncQdrantClient(
+            url=settings.qdrant_url,
+            api_key=settings.qdrant_api_key,
+            prefer_grpc=settings.qdrant_prefer_grpc,
+            grpc_port=settings.qdrant_grpc_port,
+        )
+        self.batch_size = max(1, settings.vector_upsert_batch_size)
+        self._upsert_slots = asyncio.Semaphore(max(1, settings.vector_upsert_parallelism))
+        self._ready = False
+        self._ready_lock = asyncio.Lock()
+
+    async def _ensure_collection(self) -> None:
+        if self._ready:
+            return
+        async with self._ready_lock:
+            if not self._ready:
+                if not await self.client.collection_exists(self.collection):
+                    await self.client.create_collection(collection_name=self.collection, **_collection_config(self.dim))
+                for field, schema in PAYLOAD_INDEXES.items():
+                    await self.client.create_payload_index(self.collection, field, field_schema=schema, wait=True)
+                self._ready = True
+
+    async def _upsert_batch(self, ids: Sequence[str], vectors: np.ndarray, payloads: Sequence[dict]) -> None:
+        async with self._upsert_slots:
+            await self.client.upsert(
+                collection_name=self.collection,
+                points=qmodels.Batch(ids=list(ids), vectors=vectors.tolist(), payloads=list(payloads)),
+                wait=True,
+            )
+
+    @timed(VECTOR_DURATION, store="qdrant_server", op="upsert")
+    async def upsert(self, ids: Sequence[str], vectors: np.ndarray, payloads: Sequence[dict]) -> None:
+        if len(ids) == 0:
+            return
+        await self._ensure_collection()
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n = self.batch_size
+        await asyncio.gather(
+            *(
+                self._upsert_batch(ids[s:s + n], vectors[s:s + n], payloads[s:s + n])
+                for s in range(0, len(ids), n)
+            )
+        )
+
+    @timed(VECTOR_DURATION, store="qdrant_server", op="query")
+    async def query(
+        self, embedding: np.ndarray, top_k: int, filters: SearchFilter | None = None
+    ) -> list[RetrievedChunk]:
+        await self._ensure_collection()
+        res = await self.client.search(
+            collection_name=self.collection,
+            query_vector=np.asarray(embedding, dtype=np.float32).tolist(),
+            query_filter=_query_filter(filters),
+            limit=top_k,
+            with_payload=_query_payload(),
+            search_params=_search_params(),
+        )
+        return _to_chunks(res)
+
+    @timed(VECTOR_DURATION, store="qdrant_server", op="query_batch")
+    async def query_batch(
+        self, embeddings: np.ndarray, top_k: int, filters: SearchFilter | None = None
+    ) -> list[list[RetrievedChunk]]:
+        await self._ensure_collection()
+        res = await self.client.search_batch(
+            collection_name=self.collection,
+            requests=_search_requests(np.asarray(embeddings, dtype=np.float32), top_k, filters),
+        )
+        return [_to_chunks(points) for points in res]
+
+    async def count(self) -> int:
+        await self._ensure_collection()
+        return (await self.client.count(collection_name=self.collection, exact=True)).count
+
+    @timed(VECTOR_DURATION, store="qdrant_server", op="delete")
+    async def delete(self, ids: Sequence[str]) -> None:
+        if len(ids) == 0:
+            return
+        await self._ensure_collection()
+        await self.client.delete(
+            collection_name=self.collection,
+            points_selector=qmodels.PointIdsList(points=list(ids)),
+            wait=True,
+        )
+
+    async def iter_points(self, batch_size: int = 10_000) -> AsyncIterator[tuple[list[str], np.ndarray, list[dict]]]:
+        await self._ensure_collection()
+        offset = None
+        while True:
+            points, offset = await self.client.scroll(
+                collection_name=self.collection,
+                limit=batch_size,
+                offset=offset,
+                with_payload=["chunk_id", "document_id", "tenant_id"],
+                with_vectors=True,
+            )
+            if points:
+                yield _to_batch(points)
+            if offset is None:
+                break
+
+
+class ThreadedVectorStore(AsyncVectorStore):
+    """Runs a synchronous store on worker threads.
+
+    Used for the in-process backends (mmap, in-memory Qdrant), which have no async
+    client. ``serialize`` guards stores that are not safe for concurrent calls.
+    """
+
+    def __init__(self, store: VectorStore, serialize: bool = False):
+        self.store = store
+        self._lock = threading.Lock() if serialize else None
+        self.name = "qdrant_local" if isinstance(store, QdrantVectorStore) else "mmap"
+
+    def _call(self, fn, *args):
+        if self._lock is None:
+            return fn(*args)
+        with self._lock:
+            return fn(*args)
+
+    async def upsert(self, ids: Sequence[str], vectors: np.ndarray, payloads: Sequence[dict]) -> None:
+        with VECTOR_DURATION.time(store=self.name, op="upsert"):
+            await asyncio.to_thread(self._call, self.store.upsert, ids, vectors, payloads)
+
+    async def query(
+        self, embedding: np.ndarray, top_k: int, filters: SearchFilter | None = None
+    ) -> list[RetrievedChunk]:
+        with VECTOR_DURATION.time(store=self.name, op="query"):
+            return await asyncio.to_thread(self._call, self.store.query, embedding, top_k, filters)
+
+    async def query_batch(
+        self, embeddings: np.ndarray, top_k: int, filters: SearchFilter | None = None
+    ) -> list[list[RetrievedChunk]]:
+        with VECTOR_DURATION.time(store=self.name, op="query_batch"):
+            return await asyncio.to_thread(self._call, self.store.query_batch, embeddings, top_k, filters)
+
+    async def count(self) -> int:
+        return await asyncio.to_thread(self._call, self.store.count)
+
+    async def delete(self, ids: Sequence[str]) -> None:
+        with VECTOR_DURATION.time(store=self.name, op="delete"):
+            await asyncio.to_thread(self._call, self.store.delete, ids)
+
+    async def iter_points(self, batch_size: int = 10_000) -> AsyncIterator[tuple[list[str], np.ndarray, list[dict]]]:
+        batches = self.store.iter_points(batch_size)
+        while True:
+            batch = await asyncio.to_thread(self._call, next, batches, None)
+            if batch is None:
+                break
+            yield batch
+
+
+_store: VectorStore | None = None
+_async_store: AsyncVectorStore | None = None
 
 
 def get_vector_store() -> VectorStore:
-    # Only Qdrant implemented by default; others can be added with same interface
-    return QdrantVectorStore()
+    # One store per process: with qdrant_url=":memory:" a fresh client would be a fresh, empty index
+    global _store
+    if _store is None:
+        if settings.vector_provider == "mmap":
+            from .mmap_store import MmapVectorStore
 
+            _store = MmapVectorStore()
+        elif settings.vector_provider == "qdrant":
+            _store = QdrantVectorStore()
+        else:
+            raise ValueError(f"Unsupported vector provider: {settings.vector_provider}")
+    return _store
+
+
+def get_async_vector_store() -> AsyncVectorStore:
+    """The store used by request handlers and ingestion.
+
+    A Qdrant server gets the native async client. In-process backends are wrapped
+    around the ``get_vector_store()`` singleton so both views share one index.
+    """
+    global _async_store
+    if _async_store is None:
+        if settings.vector_provider == "qdrant" and settings.qdrant_url != ":memory:":
+            _async_store = AsyncQdrantVectorStore()
+        else:
+            store = get_vector_store()
+            # Local-mode Qdrant keeps plain dicts and is not safe to call from several threads
+            _async_store = ThreadedVectorStore(store, serialize=isinstance(store, QdrantVectorStore))
+    return _async_store
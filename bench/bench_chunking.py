@@ -0,0 +1,80 @@
+"""Micro-benchmark: ChunkingEngine vs the legacy split_recursive/split_fixed.
+
+Run from the repository root:
+
+    python -m bench.bench_chunking --sizes 100000 1000000 --chunk-size 500 --overlap 50
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import time
+
+from app.services.chunking import ChunkingEngine, split_fixed, split_recursive
+
+
+WORDS = ["retrieval", "vector", "chunk", "embedding", "document", "query", "model", "token", "the", "of", "a"]
+
+
+def synthetic_text(n_chars: int, *, layout: str, seed: int = 0) -> str:
+    """Random prose laid out as paragraphs, one long line of sentences, or one run-on line.
+
+    The run-on line (no newlines or sentence breaks) forces the word-level split where the
+    legacy splitter re-joins its accumulator for every word.
+    """
+    rng = random.Random(seed)
+    out: list[str] = []
+    size = 0
+    while size < n_chars:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 20)))
+        sentence += " " if layout == "run-on" else ". "
+        if layout == "paragraphs" and rng.random() < 0.15:
+            sentence += "\n\n"
+        out.append(sentence)
+        size += len(sentence)
+    return "".join(out)[:n_chars]
+
+
+def timeit(fn, repeat: int) -> float:
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - started)
+    return statistics.median(runs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--overlap", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'case':<28}{'chars':>10}{'legacy s':>11}{'engine s':>11}{'speedup':>9}{'chunks':>15}")
+    for n in args.sizes:
+        for label in ("paragraphs", "sentences", "run-on"):
+            text = synthetic_text(n, layout=label)
+            cases = [
+                (
+                    f"recursive/{label}",
+                    lambda: split_recursive(text, max_tokens=args.chunk_size, overlap=args.overlap),
+                    ChunkingEngine("recursive", args.chunk_size, args.overlap),
+                ),
+                (
+                    f"fixed/{label}",
+                    lambda: split_fixed(text, size=args.chunk_size, overlap=args.overlap),
+                    ChunkingEngine("fixed", args.chunk_size, args.overlap),
+                ),
+            ]
+            for name, legacy, engine in cases:
+                legacy_s = timeit(legacy, args.repeat)
+                engine_s = timeit(lambda: engine.split(text), args.repeat)
+                counts = f"{len(legacy())}/{len(engine.split(text))}"
+                print(f"{name:<28}{n:>10}{legacy_s:>11.4f}{engine_s:>11.4f}{legacy_s / engine_s:>8.1f}x{counts:>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Query latency of filtered search at different selectivities.
+
+Points are spread over documents of ``--doc-size`` chunks. Each document belongs to
+one of a few tenants whose sizes cover the same selectivities. Each row of the
+output restricts the search to a fraction of the corpus, either by ``document_ids``
+or by ``tenant_id``. With the mmap index, latency should fall in proportion to
+that fraction. Local-mode Qdrant has no payload indexes. It resolves small
+filters from its own document index and scans with the filter otherwise. To
+measure real payload indexes, point ``QDRANT_URL`` at a Qdrant server.
+
+Run from the repository root:
+
+    python -m bench.bench_filters --points 100000 --queries 100
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+from app.services.mmap_store import MmapVectorStore
+from app.services.types import SearchFilter
+from app.services.vector_store import QdrantVectorStore
+
+from .bench_vector_store import pct, random_unit
+
+
+SELECTIVITIES = (1.0, 0.1, 0.01, 0.001)
+
+
+def tenant_of(doc: int, n_docs: int) -> str:
+    # Tenant "t<s>" owns a `s` share of the documents, e.g. t0.1 = 10%
+    frac = doc / n_docs
+    edge = 0.0
+    for s in sorted(SELECTIVITIES[1:]):
+        if frac < edge + s:
+            return f"t{s:g}"
+        edge += s
+    return "rest"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--doc-size", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--quantization", default="none")
+    parser.add_argument("--skip-qdrant", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = random_unit(args.points, args.dim, rng)
+    queries = random_unit(args.queries, args.dim, rng)
+    n_docs = -(-args.points // args.doc_size)
+    doc_of = np.arange(args.points) // args.doc_size
+    payloads = [
+        {"chunk_id": i, "document_id": int(d), "tenant_id": tenant_of(int(d), n_docs)} for i, d in enumerate(doc_of)
+    ]
+
+    cases: list[tuple[str, SearchFilter | None]] = []
+    for s in SELECTIVITIES:
+        if s == 1.0:
+            cases.append(("none 100%", None))
+            continue
+        docs = rng.choice(n_docs, size=max(1, int(n_docs * s)), replace=False)
+        cases.append((f"docs {s:.1%}", SearchFilter.build(docs.tolist())))
+        cases.append((f"tenant {s:.1%}", SearchFilter.build(tenant_id=f"t{s:g}")))
+
+    stores = [("mmap", lambda d: MmapVectorStore(path=d, dim=args.dim, quantization=args.quantization))]
+    if not args.skip_qdrant:
+        stores.append(("qdrant", lambda d: QdrantVectorStore(collection="bench_filters", dim=args.dim)))
+
+    print(f"{args.points} points, {n_docs} documents, top_k={args.top_k}")
+    print(f"{'store':<8}{'filter':<16}{'p50 ms':>9}{'p99 ms':>9}{'mean ms':>9}")
+    for name, factory in stores:
+        with tempfile.TemporaryDirectory() as d:
+            store = factory(d)
+            for start in range(0, args.points, 4096):
+                end = min(start + 4096, args.points)
+                store.upsert([str(uuid.uuid4()) for _ in range(end - start)], vectors[start:end], payloads[start:end])
+            for label, filters in cases:
+                store.query(queries[0], args.top_k, filters)  # warm the per-document row index
+                lat = []
+                for q in queries:
+                    started = time.perf_counter()
+                    store.query(q, args.top_k, filters)
+                    lat.append((time.perf_counter() - started) * 1000)
+                print(
+                    f"{name:<8}{label:<16}{pct(lat, 0.5):>9.2f}{pct(lat, 0.99):>9.2f}{statistics.mean(lat):>9.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Query latency of the memory-mapped exact index vs in-memory Qdrant.
+
+Run from the repository root:
+
+    python -m bench.bench_vector_store --points 20000 100000 --queries 200 --top-k 5
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+from app.services.mmap_store import MmapVectorStore
+from app.services.vector_store import QdrantVectorStore
+
+
+def random_unit(n: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    x = rng.standard_normal((n, dim), dtype=np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def fill(store, vectors: np.ndarray, batch: int = 4096) -> float:
+    started = time.perf_counter()
+    for start in range(0, len(vectors), batch):
+        block = vectors[start:start + batch]
+        ids = [str(uuid.uuid4()) for _ in range(len(block))]
+        payloads = [{"chunk_id": start + i, "document_id": (start + i) // 100, "text": ""} for i in range(len(block))]
+        store.upsert(ids, block, payloads)
+    return time.perf_counter() - started
+
+
+def latencies(store, queries: np.ndarray, top_k: int) -> list[float]:
+    out = []
+    for q in queries:
+        started = time.perf_counter()
+        store.query(q, top_k)
+        out.append((time.perf_counter() - started) * 1000)
+    return out
+
+
+def pct(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, nargs="+", default=[20_000, 100_000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--skip-qdrant", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'store':<8}{'points':>10}{'load s':>9}{'open ms':>9}{'p50 ms':>9}{'p99 ms':>9}{'mean ms':>9}")
+    for n in args.points:
+        vectors = random_unit(n, args.dim, rng)
+        queries = random_unit(args.queries, args.dim, rng)
+        stores = [("mmap", lambda d: MmapVectorStore(path=d, dim=args.dim))]
+        if not args.skip_qdrant:
+            stores.append(("qdrant", lambda d: QdrantVectorStore(collection=f"bench_{n}", dim=args.dim)))
+        for name, factory in stores:
+            with tempfile.TemporaryDirectory() as d:
+                store = factory(d)
+                load_s = fill(store, vectors)
+                started = time.perf_counter()
+                if name == "mmap":
+                    # Startup cost of a second process opening the existing index
+                    store = factory(d)
+                open_ms = (time.perf_counter() - started) * 1000
+                lat = latencies(store, queries, args.top_k)
+                print(
+                    f"{name:<8}{n:>10}{load_s:>9.2f}{open_ms:>9.2f}{pct(lat, 0.5):>9.2f}{pct(lat, 0.99):>9.2f}"
+                    f"{statistics.mean(lat):>9.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Recall@k and memory of the quantized mmap index against exact search.
+
+Ground truth is a brute-force float32 scan. Each quantization mode is measured at
+several rescore oversampling factors. Vectors are synthetic and clustered, like
+real embeddings, unless ``--index-dir`` points at an existing mmap index. In that
+case its vectors are used and queries are perturbed copies of sampled rows.
+
+Run from the repository root:
+
+    python -m bench.eval_recall --points 100000 --top-k 5 --oversampling 1 2 4 8
+    python -m bench.eval_recall --index-dir ./data/vector_index
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+from app.services.mmap_store import MmapVectorStore
+
+
+def normalize(x: np.ndarray) -> np.ndarray:
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+def clustered(n: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, clusters, n)
+    return normalize(centers[labels] + 0.6 * rng.standard_normal((n, dim), dtype=np.float32))
+
+
+def load_index(path: str) -> np.ndarray:
+    store = MmapVectorStore(path=path, quantization="none")
+    return np.concatenate([v for _, v, _ in store.iter_points()]) if store.count() else np.empty((0, store.dim), "f4")
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int, block: int = 65536) -> np.ndarray:
+    out = np.empty((len(queries), k), dtype=np.int64)
+    for i, q in enumerate(queries):
+        scores = np.concatenate([vectors[s:s + block] @ q for s in range(0, len(vectors), block)])
+        idx = np.argpartition(scores, -k)[-k:]
+        out[i] = idx[np.argsort(-scores[idx])]
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", default=["int8", "binary"])
+    parser.add_argument("--oversampling", type=float, nargs="+", default=[1.0, 2.0, 4.0, 8.0])
+    parser.add_argument("--index-dir", help="evaluate the vectors of an existing mmap index")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.index_dir:
+        vectors = load_index(args.index_dir)
+        sample = vectors[rng.integers(0, len(vectors), args.queries)]
+        queries = normalize(sample + 0.05 * rng.standard_normal(sample.shape, dtype=np.float32))
+    else:
+        vectors = clustered(args.points, args.dim, args.clusters, rng)
+        queries = clustered(args.queries, args.dim, args.clusters, rng)
+    n, dim = vectors.shape
+    k = min(args.top_k, n)
+    truth = exact_top_k(vectors, queries, k)
+    print(f"{n} vectors, dim {dim}, {len(queries)} queries, recall@{k}")
+    print(f"{'mode':<8}{'oversample':>11}{'recall':>9}{'p50 ms':>9}{'bytes/vec':>11}{'vs f32':>8}")
+
+    for mode in ["none", *args.modes]:
+        with tempfile.TemporaryDirectory() as d:
+            store = MmapVectorStore(path=d, dim=dim, quantization=mode)
+            for start in range(0, n, 8192):
+                block = vectors[start:start + 8192]
+                store.upsert(
+                    [str(uuid.uuid4()) for _ in range(len(block))],
+                    block,
+                    [{"chunk_id": start + i, "document_id": 0} for i in range(len(block))],
+                )
+            stats = store.memory_stats()
+            scanned = (stats["code_bytes"] or stats["vector_bytes"]) / n
+            for oversampling in ([1.0] if mode == "none" else args.oversampling):
+                store.oversampling = oversampling
+                hits, lat = 0, []
+                for q, expected in zip(queries, truth):
+                    started = time.perf_counter()
+                    found = store.query(q, k)
+                    lat.append((time.perf_counter() - started) * 1000)
+                    hits += len({r.chunk_id for r in found} & set(expected.tolist()))
+                print(
+                    f"{mode:<8}{oversampling:>11g}{hits / truth.size:>9.4f}{statistics.median(lat):>9.2f}"
+                    f"{scanned:>11.0f}{dim * 4 / scanned:>7.0f}x"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""Offline load test of the whole app: ingestion, RAG queries and bookings.
+
+The app is built with ``create_app()`` and driven in process over ASGI, with local
+stand-ins for everything external (see ``bench.stand_ins``): in-memory Qdrant, a
+temporary SQLite file, an in-memory Redis, the ``local`` LLM provider and a hashing
+embedder (or a real sentence-transformers model with ``--model``). Documents and
+questions come from a seeded synthetic corpus, so runs are repeatable.
+
+Each endpoint is loaded in turn by ``--concurrency`` workers. The report gives, per
+endpoint, the request and error counts, throughput, latency percentiles and the
+peak RSS of the process during that phase. ``--save`` writes the results to a JSON
+file, and ``--baseline`` compares a run against one. Latency or RSS more than
+``--tolerance`` above the baseline, or throughput that far below it, counts as a
+regression and makes the exit status 1.
+
+Run from the repository root:
+
+    python -m bench.load_test --concurrency 16 --queries 500 --save bench/baseline.json
+    python -m bench.load_test --concurrency 16 --queries 500 --baseline bench/baseline.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable
+
+
+TOPICS = {
+    "astronomy": "telescope orbit galaxy nebula comet planet eclipse spectrum",
+    "botany": "chlorophyll pollen seedling root stem photosynthesis petal xylem",
+    "finance": "ledger dividend equity bond interest portfolio audit liquidity",
+    "geology": "basalt sediment magma fault erosion mineral quartz tectonic",
+    "medicine": "diagnosis vaccine antibody dosage symptom therapy clinic pathogen",
+    "music": "melody chord rhythm tempo harmony octave orchestra cadence",
+    "networking": "packet router latency bandwidth socket protocol firewall gateway",
+    "cooking": "simmer saute marinade braise dough spice roast broth",
+}
+FILLER = "the a of and to in is was for on with as by that this it from at which are be".split()
+
+
+def synthetic_document(rng: random.Random, topic: str, n_chars: int) -> str:
+    """Prose about one topic, with a numbered fact sentence per paragraph."""
+    words = TOPICS[topic].split()
+    out: list[str] = []
+    size = 0
+    while size < n_chars:
+        sentence = " ".join(rng.choice(words) if rng.random() < 0.4 else rng.choice(FILLER)
+                            for _ in range(rng.randint(8, 20)))
+        sentence = sentence.capitalize() + ". "
+        if rng.random() < 0.1:
+            sentence += f"The {topic} reference code is {rng.randint(1000, 9999)}.\n\n"
+        out.append(sentence)
+        size += len(sentence)
+    return "".join(out)[:n_chars]
+
+
+def synthetic_question(rng: random.Random) -> str:
+    topic = rng.choice(list(TOPICS))
+    terms = rng.sample(TOPICS[topic].split(), 3)
+    return f"What does the {topic} text say about {terms[0]}, {terms[1]} and {terms[2]}?"
+
+
+def pct(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RSSSampler:
+    """Background thread tracking the peak RSS since the last ``reset``."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_bytes())
+            self._stop.wait(self.interval)
+
+    def reset(self) -> None:
+        self.peak = rss_bytes()
+
+    def __enter__(self) -> "RSSSampler":
+        self.reset()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+@dataclass
+class EndpointResult:
+    requests: int
+    errors: int
+    seconds: float
+    throughput_rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    mean_ms: float
+    peak_rss_mb: float
+    error_samples: list[str] = field(default_factory=list)
+
+
+async def run_phase(
+    requests: list[Callable[[], Awaitable[Any]]], concurrency: int, sampler: RSSSampler
+) -> EndpointResult:
+    """Run ``requests`` (each returning an httpx response) with ``concurrency`` workers."""
+    latencies: list[float] = []
+    errors: list[str] = []
+    pending = iter(requests)
+
+    async def worker() -> None:
+        for make in pending:
+            started = time.perf_counter()
+            try:
+                response = await make()
+                if response.status_code >= 400:
+                    errors.append(f"{response.status_code} {response.text[:200]}")
+            except Exception as e:
+                errors.append(repr(e))
+            latencies.append(time.perf_counter() - started)
+
+    sampler.reset()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    elapsed = time.perf_counter() - started
+    ms = [x * 1000 for x in latencies]
+    return EndpointResult(
+        requests=len(latencies),
+        errors=len(errors),
+        seconds=round(elapsed, 3),
+        throughput_rps=round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        p50_ms=round(pct(ms, 50), 2),
+        p95_ms=round(pct(ms, 95), 2),
+        p99_ms=round(pct(ms, 99), 2),
+        mean_ms=round(sum(ms) / len(ms), 2) if ms else 0.0,
+        peak_rss_mb=round(sampler.peak / 2**20, 1),
+        error_samples=errors[:3],
+    )
+
+
+def configure_environment(args: argparse.Namespace, workdir: str) -> None:
+    # Settings are read when the app is first imported, so this must run before that
+    env = {
+        "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}",
+        "VECTOR_PROVIDER": "qdrant",
+        "QDRANT_URL": ":memory:",
+        "VECTOR_SNAPSHOT_ENABLED": "false",
+        "MMAP_INDEX_DIR": os.path.join(workdir, "vector_index"),
+        "INGEST_SPOOL_DIR": os.path.join(workdir, "spool"),
+        "LLM_PROVIDER": "local",
+        "LLM_LOCAL_LATENCY_MS": str(args.llm_latency_ms),
+        "ANSWER_CACHE_ENABLED": "true" if args.answer_cache else "false",
+    }
+    if args.model:
+        env["EMBEDDING_MODEL_NAME"] = args.model
+    os.environ.update(env)
+
+
+async def run(args: argparse.Namespace) -> dict[str, EndpointResult]:
+    import httpx
+
+    from app.config import settings
+
+    from .stand_ins import HashingEmbedder, install
+
+    install(None if args.model else HashingEmbedder(settings.embedding_dim))
+    from app.main import create_app
+
+    app = create_app()
+    rng = random.Random(args.seed)
+    topics = list(TOPICS)
+    documents = [
+        (f"doc{i}.txt", synthetic_document(rng, topics[i % len(topics)], args.doc_chars).encode())
+        for i in range(args.documents)
+    ]
+    questions = [synthetic_question(rng) for _ in range(args.queries)]
+    results: dict[str, EndpointResult] = {}
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), httpx.AsyncClient(
+        transport=transport, base_url="http://bench", timeout=None
+    ) as client:
+        # Dependencies warm up in the background; measure a warm app only
+        deadline = time.perf_counter() + 600
+        while (ready := await client.get("/health/ready")).status_code != 200:
+            if time.perf_counter() > deadline:
+                raise SystemExit(f"app did not become ready: {ready.text}")
+            await asyncio.sleep(0.05)
+        with RSSSampler() as sampler:
+            phases: dict[str, list[Callable[[], Awaitable[Any]]]] = {
+                "POST /ingest/upload": [
+                    (lambda name=name, body=body: client.post(
+                        "/ingest/upload",
+                        files={"file": (name, body, "text/plain")},
+                        data={"strategy": args.strategy},
+                    ))
+                    for name, body in documents
+                ],
+                "POST /rag/query": [
+                    (lambda i=i, q=q: client.post(
+                        "/rag/query",
+                        json={"session_id": f"s{i % args.sessions}", "query": q, "top_k": args.top_k},
+                    ))
+                    for i, q in enumerate(questions)
+                ],
+                "POST /booking/create": [
+                    (lambda i=i: client.post(
+                        "/booking/create",
+                        json={"name": f"User {i}", "email": f"user{i}@example.com",
+                              "date": f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}", "time": f"{9 + i % 8}:30"},
+                    ))
+                    for i in range(args.bookings)
+                ],
+                "GET /booking/list": [
+                    (lambda: client.get("/booking/list")) for _ in range(args.booking_lists)
+                ],
+            }
+            for name, requests in phases.items():
+                if not requests or (args.endpoints and not any(e in name for e in args.endpoints)):
+                    continue
+                results[name] = await run_phase(requests, args.concurrency, sampler)
+                print(f"  {name}: {results[name].requests} requests in {results[name].seconds}s", file=sys.stderr)
+    return results
+
+
+def print_report(results: dict[str, EndpointResult]) -> None:
+    print(f"{'endpoint':<22}{'reqs':>6}{'errs':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'peak MB':>9}")
+    for name, r in results.items():
+        print(f"{name:<22}{r.requests:>6}{r.errors:>6}{r.throughput_rps:>9.1f}"
+              f"{r.p50_ms:>9.1f}{r.p95_ms:>9.1f}{r.p99_ms:>9.1f}{r.peak_rss_mb:>9.1f}")
+        for sample in r.error_samples:
+            print(f"    error: {sample}")
+
+
+# (field, higher is worse)
+COMPARED = [("throughput_rps", False), ("p50_ms", True), ("p95_ms", True), ("p99_ms", True), ("peak_rss_mb", True)]
+
+
+def compare(results: dict[str, EndpointResult], baseline: dict, tolerance: float) -> list[str]:
+    """Print the change against ``baseline`` per endpoint; returns the regressions."""
+    regressions: list[str] = []
+    print(f"\nvs baseline (tolerance {tolerance:.0%})")
+    for name, r in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            print(f"{name:<22}not in baseline")
+            continue
+        cells = []
+        for key, higher_is_worse in COMPARED:
+            old, new = base.get(key), getattr(r, key)
+            if not old:
+                continue
+            change = (new - old) / old
+            worse = change > tolerance if higher_is_worse else change < -tolerance
+            cells.append(f"{key} {old:g}->{new:g} ({change:+.0%}){' REGRESSION' if worse else ''}")
+            if worse:
+                regressions.append(f"{name} {key}")
+        if r.errors > base.get("errors", 0):
+            regressions.append(f"{name} errors")
+            cells.append(f"errors {base.get('errors', 0)}->{r.errors} REGRESSION")
+        print(f"{name:<22}" + "; ".join(cells))
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--documents", type=int, default=40)
+    parser.add_argument("--doc-chars", type=int, default=20_000)
+    parser.add_argument("--strategy", default="recursive")
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--sessions", type=int, default=50, help="distinct chat sessions the queries rotate over")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--bookings", type=int, default=200)
+    parser.add_argument("--booking-lists", type=int, default=50)
+    parser.add_argument("--endpoints", nargs="*", help="only run endpoints whose name contains one of these")
+    parser.add_argument("--model", help="real sentence-transformers model instead of the hashing embedder")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="simulated LLM latency")
+    parser.add_argument("--answer-cache", action="store_true", help="keep the semantic answer cache on")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with results saved by --save")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as workdir:
+        configure_environment(args, workdir)
+        results = asyncio.run(run(args))
+
+    print_report(results)
+    config = {k: v for k, v in vars(args).items() if k not in ("save", "baseline", "tolerance", "endpoints")}
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "config": config,
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "results": {name: asdict(r) for name, r in results.items()},
+            }, f, indent=2)
+        print(f"\nsaved {args.save}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        changed = {k: (baseline["config"].get(k), v) for k, v in config.items() if baseline.get("config", {}).get(k) != v}
+        if changed:
+            print(f"\nwarning: run settings differ from the baseline: {changed}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""In-process stand-ins for the app's external services, for offline benchmarks.
+
+``install()`` swaps them into the running app: a hashing embedder registered under
+the configured model name and an in-memory Redis for chat memory and the answer
+cache. Qdrant runs in memory (``QDRANT_URL=:memory:``) and the LLM is the built-in
+``local`` provider, so neither needs a stand-in here.
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+import time
+from typing import Any
+
+import numpy as np
+
+
+_WORD = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    """Deterministic bag-of-words embeddings: each word is hashed to a signed dimension.
+
+    Texts that share words get similar vectors, so retrieval over a synthetic corpus
+    still finds the documents a query was drawn from. Mimics the parts of
+    ``SentenceTransformer`` the app calls.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._cache: dict[str, tuple[int, float]] = {}
+
+    def parameters(self) -> list:
+        return []
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def _slot(self, word: str) -> tuple[int, float]:
+        slot = self._cache.get(word)
+        if slot is None:
+            h = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+            slot = self._cache[word] = (h % self.dim, 1.0 if h >> 63 else -1.0)
+        return slot
+
+    def encode(self, sentences: Any, batch_size: int = 32, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, **kwargs: Any) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in _WORD.findall(text.lower()):
+                j, sign = self._slot(word)
+                out[i, j] += sign
+        if normalize_embeddings:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out[0] if single else out
+
+
+def _b(value: Any) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, (int, float)):
+        return repr(value).encode()
+    return str(value).encode()
+
+
+class FakeRedis:
+    """The subset of ``redis.asyncio.Redis`` the app uses, held in process memory.
+
+    Values come back as bytes, as from a client without ``decode_responses``. TTLs
+    are honoured lazily on access.
+    """
+
+    def __init__(self):
+        self._data: dict[bytes, Any] = {}
+        self._expires: dict[bytes, float] = {}
+
+    def _live(self, key: Any) -> bytes:
+        key = _b(key)
+        deadline = self._expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return key
+
+    def _get(self, key: Any, kind: type) -> Any:
+        return self._data.setdefault(self._live(key), kind())
+
+    async def ping(self) -> bool:
+        return True
+
+    # strings
+    async def get(self, key: Any) -> bytes | None:
+        return self._data.get(self._live(key))
+
+    async def set(self, key: Any, value: Any, ex: int | None = None) -> bool:
+        key = _b(key)
+        self._data[key] = _b(value)
+        self._expires.pop(key, None)
+        if ex:
+            await self.expire(key, ex)
+        return True
+
+    async def delete(self, *keys: Any) -> int:
+        removed = 0
+        for key in keys:
+            key = self._live(key)
+            removed += self._data.pop(key, None) is not None
+            self._expires.pop(key, None)
+        return removed
+
+    async def expire(self, key: Any, seconds: int) -> bool:
+        key = self._live(key)
+        if key not in self._data:
+            return False
+        self._expires[key] = time.monotonic() + seconds
+        return True
+
+    # lists
+    async def rpush(self, key: Any, *values: Any) -> int:
+        items = self._get(key, list)
+        items.extend(_b(v) for v in values)
+        return len(items)
+
+    @staticmethod
+    def _range(items: list, start: int, end: int) -> list:
+        n = len(items)
+        start = max(0, start + n if start < 0 else start)
+        end = end + n if end < 0 else end
+        return items[start:end + 1]
+
+    async def lrange(self, key: Any, start: int, end: int) -> list[bytes]:
+        return self._range(self._data.get(self._live(key), []), start, end)
+
+    async def ltrim(self, key: Any, start: int, end: int) -> bool:
+        key = self._live(key)
+        if key in self._data:
+            self._data[key] = self._range(self._data[key], start, end)
+        return True
+
+    # hashes
+    async def hset(self, key: Any, field: Any = None, value: Any = None, mapping: dict | None = None) -> int:
+        h = self._get(key, dict)
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        added = 0
+        for f, v in items.items():
+            added += _b(f) not in h
+            h[_b(f)] = _b(v)
+        return added
+
+    async def hgetall(self, key: Any) -> dict[bytes, bytes]:
+        return dict(self._data.get(self._live(key), {}))
+
+    async def hmget(self, key: Any, *fields: Any) -> list[bytes | None]:
+        h = self._data.get(self._live(key), {})
+        return [h.get(_b(f)) for f in fields]
+
+    async def hdel(self, key: Any, *fields: Any) -> int:
+        h = self._data.get(self._live(key), {})
+        return sum(h.pop(_b(f), None) is not None for f in fields)
+
+    # sets
+    async def sadd(self, key: Any, *members: Any) -> int:
+        s = self._get(key, set)
+        before = len(s)
+        s.update(_b(m) for m in members)
+        return len(s) - before
+
+    async def smembers(self, key: Any) -> set[bytes]:
+        return set(self._data.get(self._live(key), set()))
+
+    # sorted sets
+    async def zadd(self, key: Any, mapping: dict) -> int:
+        z = self._get(key, dict)
+        added = sum(_b(m) not in z for m in mapping)
+        z.update({_b(m): float(score) for m, score in mapping.items()})
+        return added
+
+    async def zcard(self, key: Any) -> int:
+        return len(self._data.get(self._live(key), {}))
+
+    async def zrem(self, key: Any, *members: Any) -> int:
+        z = self._data.get(self._live(key), {})
+        return sum(z.pop(_b(m), None) is not None for m in members)
+
+    async def zpopmin(self, key: Any, count: int = 1) -> list[tuple[bytes, float]]:
+        z = self._data.get(self._live(key), {})
+        popped = sorted(z.items(), key=lambda item: item[1])[:count]
+        for member, _ in popped:
+            del z[member]
+        return popped
+
+    def pipeline(self, transaction: bool = True) -> "FakePipeline":
+        return FakePipeline(self)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class FakePipeline:
+    """Queues commands and runs them in order on ``execute``, like a redis-py pipeline."""
+
+    def __init__(self, client: FakeRedis):
+        self._client = client
+        self._commands: list[tuple[str, tuple, dict]] = []
+
+    async def __aenter__(self) -> "FakePipeline":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        self._commands.clear()
+
+    def __getattr__(self, name: str) -> Any:
+        if not hasattr(self._client, name):
+            raise AttributeError(name)
+
+        def queue(*args: Any, **kwargs: Any) -> "FakePipeline":
+            self._commands.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self) -> list:
+        commands, self._commands = self._commands, []
+        return [await getattr(self._client, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+
+def install(embedder: Any = None) -> FakeRedis:
+    """Point the app's singletons at the stand-ins; returns the shared fake Redis.
+
+    Import this only after the settings environment is final: it imports the app.
+    """
+    from app.config import settings
+    from app.services.answer_cache import answer_cache
+    from app.services.memory import get_memory_manager
+    from app.services.model_registry import model_registry
+
+    if embedder is not None:
+        model_registry.register(settings.embedding_model_name, embedder)
+    fake = FakeRedis()
+    get_memory_manager().client = fake
+    answer_cache._client = fake
+    return fake